@@ -0,0 +1,35 @@
+# A medication course is active when it has no end date or ends today or
+# later. Both halves of that predicate get their own index range so the
+# census count and a patient's current regimen never scan medications.
+
+
+def init_active_med_indexes(conn):
+    # Census: NULL (open-ended) and future end dates are two ranges of the
+    # same index, which also covers patient_id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medications_end_date ON medications(end_date, patient_id)")
+    # Per patient: current regimen and history
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medications_patient_end ON medications(patient_id, end_date)")
+
+
+def count_active_patients(conn):
+    return conn.execute(
+        """SELECT COUNT(*) FROM (
+               SELECT patient_id FROM medications WHERE end_date IS NULL
+               UNION
+               SELECT patient_id FROM medications WHERE end_date >= date('now')
+           )"""
+    ).fetchone()[0]
+
+
+def get_active_medications(conn, patient_id):
+    """Current regimen as (medication_name, dosage, frequency, start_date, end_date, notes)."""
+    return conn.execute(
+        """SELECT medication_name, dosage, frequency, start_date, end_date, notes
+           FROM (
+               SELECT * FROM medications WHERE patient_id = ? AND end_date IS NULL
+               UNION ALL
+               SELECT * FROM medications WHERE patient_id = ? AND end_date >= date('now')
+           )
+           ORDER BY start_date DESC""",
+        (patient_id, patient_id)
+    ).fetchall()
@@ -0,0 +1,94 @@
+# Home page "Recent Activity": one row per new patient, medication,
+# diagnostic or lab entry, written by insert triggers into activity_feed.
+# Pages are read newest-first by primary key with a keyset cursor
+# ("id < last id seen"), so loading more costs the same however much
+# history there is.
+PAGE_SIZE = 15
+NEWEST = 2 ** 63 - 1
+
+# table -> (summary expression over NEW, fallback date column for old rows)
+FEED_SOURCES = {
+    "patients": ("'Registered ' || NEW.full_name", None),
+    "medications": ("'Started ' || NEW.medication_name || COALESCE(' ' || NEW.dosage, '')", "start_date"),
+    "diagnostics": ("'Diagnostic: ' || NEW.test_name", "test_date"),
+    "lab_results": ("'Lab results of ' || NEW.test_date", "test_date"),
+}
+ENTITY_ICONS = {"patients": "🧑", "medications": "💊", "diagnostics": "🩺", "lab_results": "🧪"}
+
+
+def init_activity_schema(conn):
+    for table in ("medications", "diagnostics", "lab_results"):
+        columns = [col[1] for col in conn.execute(f"PRAGMA table_info({table})")]
+        # Added to existing tables without a default (SQLite cannot add
+        # CURRENT_TIMESTAMP to a populated table); inserts set both
+        if "created_at" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN created_at TIMESTAMP")
+        if "created_by" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN created_by TEXT")
+    for table in FEED_SOURCES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_created_at ON {table}(created_at)")
+
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_feed'"
+    ).fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_feed (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            occurred_at TIMESTAMP NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            patient_id INTEGER,
+            actor TEXT,
+            summary TEXT
+        )
+    """)
+    for table, (summary, _) in FEED_SOURCES.items():
+        patient_id = "NEW.id" if table == "patients" else "NEW.patient_id"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_activity_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO activity_feed (occurred_at, entity, entity_id, patient_id, actor, summary)
+                VALUES (COALESCE(NEW.created_at, CURRENT_TIMESTAMP), '{table}', NEW.id, {patient_id},
+                        NEW.created_by, {summary});
+            END
+        """)
+    if not exists:
+        _backfill(conn)
+
+
+def _backfill(conn):
+    # Existing rows enter the feed once, oldest first, so ids stay chronological
+    selects = []
+    for table, (summary, date_column) in FEED_SOURCES.items():
+        occurred_at = f"COALESCE(created_at, {date_column})" if date_column else "created_at"
+        patient_id = "id" if table == "patients" else "patient_id"
+        selects.append(
+            f"""SELECT {occurred_at} AS occurred_at, '{table}', id, {patient_id}, created_by,
+                       {summary.replace('NEW.', '')}
+                FROM {table} WHERE {occurred_at} IS NOT NULL"""
+        )
+    conn.execute(f"""
+        INSERT INTO activity_feed (occurred_at, entity, entity_id, patient_id, actor, summary)
+        SELECT * FROM ({' UNION ALL '.join(selects)}) ORDER BY occurred_at
+    """)
+
+
+def activity_page(conn, before=None, limit=PAGE_SIZE):
+    """One page of the feed, newest first, and the cursor for the next page.
+
+    Rows are ``(id, occurred_at, entity, entity_id, patient_id, patient_name,
+    actor, summary)``; the cursor is None on the last page.
+    """
+    rows = conn.execute(
+        """SELECT f.id, f.occurred_at, f.entity, f.entity_id, f.patient_id, p.full_name, f.actor, f.summary
+           FROM activity_feed f
+           LEFT JOIN patients p ON p.id = f.patient_id
+           WHERE f.id < ?
+           ORDER BY f.id DESC
+           LIMIT ?""",
+        (before if before is not None else NEWEST, limit + 1)
+    ).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1][0]
+    return rows, None
@@ -0,0 +1,161 @@
+import json
+import os
+
+# Rules are checked only against a newly saved lab row and the same
+# patient's previous row, never by scanning lab_results.
+#   above / below: absolute thresholds on the new value
+#   rise_pct:      percentage increase over the previous value
+DEFAULT_RULES = [
+    {"name": "hyperkalemia", "analyte": "potassium", "type": "above",
+     "threshold": 6.0, "severity": "critical",
+     "message": "Hyperkalemia: potassium {value:g} (> {threshold:g})"},
+    {"name": "low_hemoglobin", "analyte": "hemoglobin", "type": "below",
+     "threshold": 8.0, "severity": "high",
+     "message": "Low hemoglobin: {value:g} (< {threshold:g})"},
+    {"name": "creatinine_spike", "analyte": "creatinine", "type": "rise_pct",
+     "threshold": 30.0, "severity": "high",
+     "message": "Creatinine up {change:.0f}% ({previous:g} → {value:g})"},
+]
+
+_rules = None
+
+
+def load_rules():
+    """Alert rules, from the JSON file named by RENAL_ALERT_RULES if set."""
+    global _rules
+    if _rules is None:
+        path = os.getenv("RENAL_ALERT_RULES")
+        if path and os.path.exists(path):
+            with open(path) as f:
+                _rules = json.load(f)
+        else:
+            _rules = DEFAULT_RULES
+    return _rules
+
+
+def init_alert_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            lab_result_id INTEGER,
+            rule TEXT NOT NULL,
+            analyte TEXT,
+            value REAL,
+            previous_value REAL,
+            severity TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open', 'acknowledged')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            acknowledged_at TIMESTAMP,
+            acknowledged_by TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(id),
+            FOREIGN KEY (lab_result_id) REFERENCES lab_results(id)
+        )
+    """)
+    # Only open alerts are indexed for the dashboard, so its cost tracks
+    # the number of open alerts rather than the alert history
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts(created_at) WHERE status = 'open'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_patient_open ON alerts(patient_id) WHERE status = 'open'")
+    # "Previous lab for this patient" lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lab_results_patient_date ON lab_results(patient_id, test_date)")
+
+
+def _to_float(value):
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _row(cursor):
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col[0] for col in cursor.description], row))
+
+
+def evaluate_lab_result(conn, lab_result_id, rules=None):
+    """Check one saved lab row against the rules and store any alerts.
+
+    Runs on the caller's connection, so alerts commit together with the lab
+    row. Returns the list of alert messages raised.
+    """
+    rules = load_rules() if rules is None else rules
+    current = _row(conn.execute("SELECT * FROM lab_results WHERE id = ?", (lab_result_id,)))
+    if current is None:
+        return []
+    previous = None
+    if any(rule["type"] == "rise_pct" for rule in rules):
+        previous = _row(conn.execute(
+            """SELECT * FROM lab_results
+               WHERE patient_id = ? AND (test_date < ? OR (test_date = ? AND id < ?))
+               ORDER BY test_date DESC, id DESC LIMIT 1""",
+            (current["patient_id"], current["test_date"], current["test_date"], current["id"])
+        ))
+
+    raised = []
+    for rule in rules:
+        value = _to_float(current.get(rule["analyte"]))
+        if value is None:
+            continue
+        prior, change = None, None
+        if rule["type"] == "above":
+            triggered = value > rule["threshold"]
+        elif rule["type"] == "below":
+            triggered = value < rule["threshold"]
+        elif rule["type"] == "rise_pct":
+            prior = _to_float(previous.get(rule["analyte"])) if previous else None
+            if not prior:
+                continue
+            change = (value - prior) / prior * 100
+            triggered = change >= rule["threshold"]
+        else:
+            continue
+        if not triggered:
+            continue
+        message = rule["message"].format(
+            value=value, threshold=rule["threshold"], previous=prior or 0, change=change or 0
+        )
+        conn.execute(
+            """INSERT INTO alerts (patient_id, lab_result_id, rule, analyte, value,
+                                   previous_value, severity, message)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (current["patient_id"], lab_result_id, rule["name"], rule["analyte"],
+             value, prior, rule["severity"], message)
+        )
+        raised.append(message)
+    return raised
+
+
+def open_alerts(conn, limit=50):
+    return conn.execute(
+        """SELECT a.id, a.patient_id, p.full_name, a.severity, a.message, a.created_at
+           FROM alerts a JOIN patients p ON a.patient_id = p.id
+           WHERE a.status = 'open'
+           ORDER BY a.created_at DESC
+           LIMIT ?""",
+        (limit,)
+    ).fetchall()
+
+
+def patient_open_alerts(conn, patient_id):
+    return conn.execute(
+        """SELECT severity, message, created_at FROM alerts
+           WHERE patient_id = ? AND status = 'open'
+           ORDER BY created_at DESC""",
+        (patient_id,)
+    ).fetchall()
+
+
+def count_open_alerts(conn):
+    return conn.execute("SELECT COUNT(*) FROM alerts WHERE status = 'open'").fetchone()[0]
+
+
+def acknowledge_alert(conn, alert_id, username):
+    conn.execute(
+        """UPDATE alerts SET status = 'acknowledged',
+               acknowledged_at = CURRENT_TIMESTAMP, acknowledged_by = ?
+           WHERE id = ? AND status = 'open'""",
+        (username, alert_id)
+    )
@@ -1,12 +1,45 @@
 import streamlit as st
 import sqlite3
-import hashlib
-from datetime import datetime, date
+import html
+from datetime import datetime, date, timedelta
 from PIL import Image
 import os
 import pandas as pd
-from fpdf import FPDF
 import base64
+from auth import (hash_password, verify_password, login_retry_after, record_login_success,
+                  client_address, LOCAL_CLIENT)
+from sessions import (init_session_schema, create_session, validate_session,
+                      revoke_session, invalidate_user_sessions)
+from audit import init_audit_schema, row_snapshot, audit_event, query_events, DIRECTORY_ENTITIES
+from changefeed import init_changefeed_schema
+from activity import init_activity_schema, activity_page, ENTITY_ICONS
+from timeline import init_timeline_indexes, timeline_page
+from alerts import (init_alert_schema, evaluate_lab_result, open_alerts, patient_open_alerts,
+                    count_open_alerts, acknowledge_alert)
+from labs import LAB_ANALYTES, lab_label
+from med_catalog import (init_medication_catalog, SEARCH_SQL, search_params, match_catalog, parse_dosage,
+                         parse_frequency, format_dosage, DOSE_UNITS, FREQUENCIES)
+from renal_dosing import (init_renal_dosing_indexes, kidney_function, has_renal_rule, check_prescription,
+                          recheck_active_prescriptions)
+from bulk_labs import empty_grid, validate_lab_grid, describe_errors, save_lab_grid
+from report import load_report_data, render_patient_report, report_html
+from archive import attach_archive, history_source, archive_path
+from clinics import get_router, init_clinic_registry, DEFAULT_CLINIC
+from attachments import (init_attachment_schema, store_blob, record_attachment,
+                         attachments_for_patient, open_attachment, request_thumbnail, format_size)
+from metrics import (track_page, start_metrics_server, report_seconds, report_failures,
+                     login_attempts, db_size_bytes)
+from active_meds import init_active_med_indexes, count_active_patients, get_active_medications
+from dialysis import (init_dialysis_schema, save_session, list_sessions, load_readings,
+                      downsample, CHANNELS, CHANNEL_LABELS, DEFAULT_INTERVAL_MINUTES)
+from cohort import run_cohort, AGE_BANDS, LAB_FILTER_ANALYTES, LAB_FILTER_OPERATORS
+from snapshot import (get_snapshot_connection, snapshot_age, refresh_snapshot, start_snapshot_scheduler,
+                      snapshot_path)
+from writer import run_write
+from query_cache import cached_rows, cached_row, invalidate, cache_stats
+from arrow_results import fetch_arrow, rows_to_arrow, TEXT, CATEGORY, DATE, FLOAT
+from maintenance import (init_maintenance_schema, run_maintenance, start_maintenance_scheduler,
+                         last_run, recent_runs, object_sizes, maintenance_window)
 
 # ======================
 # APP CONFIGURATION
@@ -103,6 +136,8 @@ if "user_type" not in st.session_state:
     st.session_state.user_type = ""
 if "full_name" not in st.session_state:
     st.session_state.full_name = ""
+if "clinic" not in st.session_state:
+    st.session_state.clinic = DEFAULT_CLINIC
 if "current_page" not in st.session_state:
     st.session_state.current_page = "Home"
 if "editing_patient" not in st.session_state:
@@ -127,8 +162,13 @@ if "generating_report_for" not in st.session_state:
 # ======================
 # HELPER FUNCTIONS
 # ======================
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def get_client_ip():
+    # X-Forwarded-For is only believed from RENAL_TRUSTED_PROXIES
+    try:
+        return client_address(getattr(st.context, "ip_address", None),
+                              st.context.headers.get("X-Forwarded-For", ""))
+    except Exception:
+        return LOCAL_CLIENT
 
 def calculate_age(birth_date):
     if not birth_date:
@@ -136,8 +176,74 @@ def calculate_age(birth_date):
     today = date.today()
     return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
 
+# Directory database: users, sessions and the clinic registry, plus the
+# default clinic's clinical data. Other clinics each have their own file.
+DB_PATH = "renal_tracker.db"
+clinic_router = get_router(DB_PATH)
+
+def clinic_db_path():
+    return clinic_router.db_path(st.session_state.clinic)
+
 def get_db_connection():
-    return sqlite3.connect("renal_tracker.db")
+    # Pooled connection to the signed-in user's clinic
+    return clinic_router.connect(st.session_state.clinic)
+
+def get_directory_connection():
+    return clinic_router.directory()
+
+def get_read_connection():
+    # Read-only snapshot for reports and aggregates; may lag by a few minutes
+    return get_snapshot_connection(clinic_db_path())
+
+def show_snapshot_status():
+    age = snapshot_age(clinic_db_path())
+    col1, col2 = st.columns([5, 1])
+    with col1:
+        if age is None:
+            st.caption("📸 Showing live data (no report snapshot yet)")
+        elif age < 60:
+            st.caption("📸 Report data is up to date (snapshot taken under a minute ago)")
+        else:
+            st.caption(f"📸 Report data as of {int(age // 60)} min ago")
+    with col2:
+        if st.button("🔄 Refresh data", key="refresh_snapshot"):
+            refresh_snapshot(clinic_db_path())
+            st.rerun()
+
+def database_sizes():
+    # Samples for the renal_db_size_bytes gauge, taken at scrape time
+    sizes = []
+    for _, db_path in clinic_router.clinics().values():
+        for path in (db_path, snapshot_path(db_path), archive_path(db_path)):
+            if os.path.exists(path):
+                sizes.append(((os.path.basename(path),), os.path.getsize(path)))
+    return sizes
+
+ATTACHMENT_TYPES = ["png", "jpg", "jpeg", "gif", "bmp", "tif", "tiff", "webp", "pdf"]
+
+def write_clinic(operation):
+    # Queued on the clinic's single writer; returns once the batch has committed
+    return run_write(clinic_db_path(), operation)
+
+def write_with_uploads(uploads, operation):
+    # Upload bytes are hashed and copied before the write is queued, so the
+    # writer only records rows; a blob left by a write that fails is removed
+    # by the maintenance sweep. ``operation(conn, stored)`` gets
+    # [(upload, sha256, size, deduplicated), ...]
+    db_path = clinic_db_path()
+    stored = [(upload, *store_blob(db_path, upload)) for upload in uploads or []]
+    return write_clinic(lambda conn: operation(conn, stored))
+
+def write_directory(operation):
+    return run_write(DB_PATH, operation)
+
+def cached_clinic_rows(sql, params=(), tables=()):
+    # Repeated reads shared across reruns and sessions; see query_cache.py
+    return cached_rows(clinic_db_path(), get_db_connection, sql, params, tables)
+
+def cached_patient(patient_id):
+    return cached_row(clinic_db_path(), get_db_connection,
+                      "SELECT * FROM patients WHERE id = ?", (patient_id,), ("patients",))
 
 def create_placeholder_logo():
     from PIL import Image, ImageDraw, ImageFont
@@ -158,194 +264,50 @@ def load_logo():
         st.error(f"Failed to load logo: {e}")
         return create_placeholder_logo()
 
-def generate_patient_report(patient_id):
+def load_patient_report(patient_id, use_snapshot=False, include_history=False):
+    connect = get_read_connection if use_snapshot else get_db_connection
+    with connect() as conn:
+        if include_history:
+            attach_archive(conn, clinic_db_path())
+        return load_report_data(conn, patient_id, include_history)
+
+def report_author():
+    return f"{st.session_state.full_name} ({st.session_state.username})"
+
+def generate_patient_report(patient_id, use_snapshot=False, include_history=False, data=None):
+    # ``data`` from load_patient_report skips reloading what the preview already read
     try:
-        with get_db_connection() as conn:
-            # Get patient data
-            patient = conn.execute(
-                "SELECT * FROM patients WHERE id = ?", 
-                (patient_id,)
-            ).fetchone()
+        with report_seconds.time():
+            if data is None:
+                data = load_patient_report(patient_id, use_snapshot, include_history)
             
-            if not patient:
+            if not data:
                 st.error("Patient not found")
                 return None
-
-            # Get medications (latest first)
-            medications = conn.execute(
-                """SELECT medication_name, dosage, frequency, 
-                   start_date, end_date, notes 
-                   FROM medications 
-                   WHERE patient_id = ? 
-                   ORDER BY start_date DESC""", 
-                (patient_id,)
-            ).fetchall()
-            
-            # Get diagnostics (latest first)
-            diagnostics = conn.execute(
-                """SELECT test_name, test_date, results, notes 
-                   FROM diagnostics 
-                   WHERE patient_id = ? 
-                   ORDER BY test_date DESC""", 
-                (patient_id,)
-            ).fetchall()
-        
-        # Create PDF with proper margins
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        
-        # Add logo
-        try:
-            pdf.image("renal_tracker_logo.png", x=10, y=8, w=40)
-        except:
-            pass
-        
-        # Set initial position below logo
-        pdf.set_y(40)
-        
-        # Report header
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(0, 10, "Patient Monthly Medical Report", 0, 1, 'C')
-        pdf.ln(10)
-        
-        # Report date
-        pdf.set_font("Arial", '', 10)
-        pdf.cell(0, 5, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 0, 1, 'R')
-        pdf.ln(10)
-        
-        # Patient Information Section
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "Patient Information", 0, 1, 'L')
-        pdf.set_font("Arial", '', 12)
-        
-        # Calculate age if birthday exists
-        age = ""
-        if patient[2]:
-            birth_date = datetime.strptime(patient[2], "%Y-%m-%d").date()
-            age = f" ({calculate_age(birth_date)} years)"
-        
-        # Patient info rows
-        info_data = [
-            ["Full Name", patient[1]],
-            ["Date of Birth", f"{patient[2]}{age}" if patient[2] else "Not specified"],
-            ["Primary Diagnosis", patient[8] if patient[8] else "Not specified"]
-        ]
-        
-        for label, value in info_data:
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(50, 8, label + ":", 0, 0, 'L')
-            pdf.set_font("Arial", '', 12)
-            pdf.multi_cell(0, 8, str(value), 0, 'L')
-            pdf.ln(2)
-        
-        pdf.ln(10)
-        
-        # Current Medications Section
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "Current Medications", 0, 1, 'L')
-        pdf.ln(5)
-        
-        if medications:
-            # Table header
-            col_widths = [60, 30, 30, 30, 30]
-            pdf.set_font("Arial", 'B', 10)
-            for i, header in enumerate(["Medication", "Dosage", "Frequency", "Start Date", "End Date"]):
-                pdf.cell(col_widths[i], 8, header, 1, 0, 'C')
-            pdf.ln()
             
-            # Table content
-            pdf.set_font("Arial", '', 10)
-            for med in medications:
-                for i, value in enumerate(med[:5]):  # First 5 fields
-                    cell_value = str(value) if value is not None else ""
-                    if i == 4 and not cell_value:  # End Date
-                        cell_value = "Ongoing"
-                    pdf.cell(col_widths[i], 8, cell_value, 1, 0, 'L')
-                pdf.ln()
-                
-                # Add notes if available
-                if med[5]:  # Notes field
-                    pdf.set_font("Arial", 'I', 8)
-                    pdf.cell(sum(col_widths), 6, f"Notes: {med[5]}", 0, 1, 'L')
-                    pdf.set_font("Arial", '', 10)
-        else:
-            pdf.set_font("Arial", '', 12)
-            pdf.cell(0, 8, "No medications recorded", 0, 1, 'L')
-        
-        pdf.ln(15)
-               # Lab Results Section
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "Laboratory Values", 0, 1, 'L')
-        pdf.ln(5)
-
-        with get_db_connection() as conn:
-            labs = conn.execute(
-                "SELECT * FROM lab_results WHERE patient_id = ? ORDER BY test_date DESC",
-                (patient_id,)
-            ).fetchall()
-            columns = [col[1] for col in conn.execute("PRAGMA table_info(lab_results)")]
-
-        if labs:
-            for lab in labs:
-                pdf.set_font("Arial", 'B', 12)
-                pdf.cell(0, 8, f"Test Date: {lab[2]}", 0, 1)
-                pdf.set_font("Arial", '', 11)
-                labels = columns[3:]  # skip id, patient_id, test_date
-                for i, label in enumerate(labels, start=3):
-                    if lab[i]:
-                        pdf.cell(60, 8, f"{label.replace('_', ' ').title()}: ", 0, 0)
-                        pdf.cell(0, 8, str(lab[i]), 0, 1)
-                pdf.ln(5)
-        else:
-            pdf.set_font("Arial", '', 12)
-            pdf.cell(0, 8, "No laboratory results recorded", 0, 1, 'L')
-
-        pdf.ln(10)
-
-        if diagnostics:
-            # Table header
-            col_widths = [70, 30, 0]  # Last column takes remaining space
-            pdf.set_font("Arial", 'B', 10)
-            pdf.cell(col_widths[0], 8, "Test Name", 1, 0, 'C')
-            pdf.cell(col_widths[1], 8, "Test Date", 1, 0, 'C')
-            pdf.cell(col_widths[2], 8, "Results", 1, 1, 'C')
-            
-            # Table content
-            pdf.set_font("Arial", '', 10)
-            for diag in diagnostics:
-                pdf.cell(col_widths[0], 8, diag[0], 1, 0, 'L')  # Test Name
-                pdf.cell(col_widths[1], 8, diag[1], 1, 0, 'L')  # Test Date
-                pdf.multi_cell(col_widths[2], 8, diag[2] if diag[2] else "No results", 1, 'L')  # Results
-                
-                # Add notes if available
-                if diag[3]:  # Notes field
-                    pdf.set_font("Arial", 'I', 8)
-                    pdf.cell(20, 6, "Notes:", 0, 0, 'L')
-                    pdf.multi_cell(0, 6, diag[3], 0, 'L')
-                    pdf.set_font("Arial", '', 10)
-        else:
-            pdf.set_font("Arial", '', 12)
-            pdf.cell(0, 8, "No diagnostic tests recorded", 0, 1, 'L')
-        
- 
-        # Footer with user information (centered)
-        pdf.set_font("Arial", 'I', 8)
-        footer_text = f"Generated by: {st.session_state.full_name} ({st.session_state.username}) | Renal Tracker Pro"
-        page_width = pdf.w - 2 * pdf.l_margin
-        pdf.set_x((pdf.w - pdf.get_string_width(footer_text)) / 2)
-        pdf.cell(pdf.get_string_width(footer_text), 10, footer_text)
-        
-        # Return PDF bytes
-        pdf_output = pdf.output(dest='S')
-        if isinstance(pdf_output, str):
-            return pdf_output.encode('latin1')
-        return bytes(pdf_output)
+            return render_patient_report(data, report_author())
         
     except Exception as e:
+        report_failures.inc()
         st.error(f"Failed to generate report: {str(e)}")
         return None
 
+def show_report_preview(patient_id, use_snapshot=False, include_history=False, key="report"):
+    # The page shows the report as HTML straight away; FPDF only runs when
+    # the user asks for the file
+    data = load_patient_report(patient_id, use_snapshot, include_history)
+    if not data:
+        st.error("Patient not found")
+        return
+    
+    if st.button("Generate PDF Report", type="primary", key=f"{key}_pdf"):
+        with st.spinner("Generating report..."):
+            pdf_bytes = generate_patient_report(patient_id, data=data)
+        if pdf_bytes:
+            create_download_button(pdf_bytes, data["patient"][1])
+    
+    st.markdown(report_html(data, report_author()), unsafe_allow_html=True)
+
 def create_download_button(pdf_bytes, patient_name):
     # Generate a filename
     filename = f"Renal_Report_{patient_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
@@ -364,40 +326,128 @@ logo = load_logo()
 # ======================
 # MEDICATION & DIAGNOSTIC FORMS
 # ======================
+def medication_picker(key, current_name="", current_catalog=None):
+    # Outside the form so each search reruns; matches come from the
+    # medication_terms prefix index, through the query cache
+    search = st.text_input(
+        "Medication Name*", value=current_name, key=f"{key}_search",
+        help="Type the start of a generic or brand name (e.g. \"EPO\", \"Renv\") and press Enter"
+    )
+    if not search.strip():
+        st.caption("Search the medication catalog to choose a drug")
+        return None, None
+    
+    matches = cached_clinic_rows(SEARCH_SQL, search_params(search),
+                                 tables=("medication_catalog", "medication_terms"))
+    options = [(catalog_id, name) for catalog_id, name, _, _ in matches] + [(None, search.strip())]
+    labels = [
+        f"{name} — {drug_class}" + (f" (matched \"{synonym}\")" if synonym else "")
+        for _, name, drug_class, synonym in matches
+    ] + [f"Not in catalog: \"{search.strip()}\""]
+    if current_catalog and search == current_name and current_catalog[0] not in [m[0] for m in matches]:
+        # A name mapped by the normalizer ("Renvela 800") keeps its mapping
+        options.insert(0, (current_catalog[0], current_name))
+        labels.insert(0, f"{current_name} — catalog: {current_catalog[1]}")
+    choice = st.selectbox("Catalog match", range(len(options)), format_func=labels.__getitem__,
+                          key=f"{key}_choice")
+    return options[choice]
+
+def dose_fields(amount=None, unit=None, frequency_code=None):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        amount = st.number_input("Dose*", min_value=0.0, value=amount, step=1.0, format="%g")
+    with col2:
+        unit = st.selectbox("Unit*", DOSE_UNITS,
+                            index=DOSE_UNITS.index(unit) if unit in DOSE_UNITS else None)
+    with col3:
+        codes = list(FREQUENCIES)
+        frequency_code = st.selectbox("Frequency*", codes, format_func=FREQUENCIES.get,
+                                      index=codes.index(frequency_code) if frequency_code in codes else None)
+    return amount, unit, frequency_code
+
+def renal_dosing_panel(patient_id, catalog_id, medication_name):
+    # Returns (catalog_id, catalog drug name, kidney function or None). A
+    # name entered as "Not in catalog" is still matched the way the
+    # normalizer would, so "Metformin XR" is recorded and checked as Metformin
+    drug, free_text = None, catalog_id is None
+    if free_text and medication_name:
+        terms = dict(cached_clinic_rows("SELECT term, catalog_id FROM medication_terms",
+                                        tables=("medication_terms",)))
+        catalog_id = match_catalog(terms, medication_name)
+    if catalog_id is not None:
+        drug = cached_clinic_rows("SELECT name FROM medication_catalog WHERE id = ?", (catalog_id,),
+                                  tables=("medication_catalog",))[0][0]
+        if free_text:
+            st.warning(f"\"{medication_name}\" matches {drug} in the medication catalog; "
+                       f"it is recorded and dose-checked as {drug}")
+    
+    # Kidney function is only looked up for drugs with renal dosing rules
+    kidney = None
+    if drug and has_renal_rule(drug):
+        with get_db_connection() as conn:
+            kidney = kidney_function(conn, patient_id)
+        if kidney:
+            st.info(f"🩺 eGFR {kidney['egfr']:.0f} mL/min/1.73m² (creatinine {kidney['creatinine']:.2f} mg/dL "
+                    f"on {kidney['test_date']}). The dose is checked against renal dosing limits before saving.")
+        else:
+            st.caption("Renal dosing cannot be checked: no creatinine result, age or sex on record")
+    return catalog_id, drug, kidney
+
+@track_page("add_medication")
 def add_medication_form():
     st.header("💊 Add New Medication")
     
+    catalog_id, medication_name = medication_picker("add_med")
+    catalog_id, drug, kidney = renal_dosing_panel(st.session_state.adding_med_for, catalog_id, medication_name)
+    
     with st.form("add_med_form"):
-        medication_name = st.text_input("Medication Name*")
-        dosage = st.text_input("Dosage*")
-        frequency = st.text_input("Frequency*")
+        dose_amount, dose_unit, frequency_code = dose_fields()
         start_date = st.date_input("Start Date*", value=date.today())
         end_date = st.date_input("End Date (optional)", value=None)
         notes = st.text_area("Notes")
+        override = st.checkbox("Save despite a renal dosing warning") if kidney else False
         
         col1, col2 = st.columns(2)
         with col1:
             if st.form_submit_button("Save Medication", type="primary"):
-                if not medication_name or not dosage or not frequency:
+                finding = kidney and check_prescription(drug, kidney["egfr"], dose_amount, dose_unit, frequency_code)
+                if not medication_name or not dose_amount or not dose_unit or not frequency_code:
                     st.error("Please fill all required fields (*)")
+                elif finding and not override:
+                    st.error(f"⚠️ {finding[1]}")
+                    st.caption("Adjust the dose, or tick \"Save despite a renal dosing warning\" to save it as prescribed.")
                 else:
-                    with get_db_connection() as conn:
-                        conn.execute(
+                    patient_id = st.session_state.adding_med_for
+                    username = st.session_state.username
+                    def insert(conn):
+                        cursor = conn.execute(
                             """INSERT INTO medications 
                             (patient_id, medication_name, dosage, frequency, 
-                            start_date, end_date, notes) 
-                            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                            start_date, end_date, notes, created_at, created_by,
+                            catalog_id, dose_amount, dose_unit, frequency_code) 
+                            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?)""",
                             (
-                                st.session_state.adding_med_for,
+                                patient_id,
                                 medication_name,
-                                dosage,
-                                frequency,
+                                format_dosage(dose_amount, dose_unit),
+                                FREQUENCIES[frequency_code],
                                 str(start_date),
                                 str(end_date) if end_date else None,
-                                notes
+                                notes,
+                                username,
+                                catalog_id,
+                                dose_amount,
+                                dose_unit,
+                                frequency_code
                             )
                         )
-                        conn.commit()
+                        if finding:
+                            # Saved over the warning: keep it open on the patient's alerts
+                            recheck_active_prescriptions(conn, [patient_id])
+                        audit_event(conn, username, "medications", cursor.lastrowid, "INSERT",
+                                    after=row_snapshot(conn, "medications", "id", cursor.lastrowid),
+                                    patient_id=patient_id)
+                    write_clinic(insert)
                     st.success("Medication added successfully!")
                     st.session_state.adding_med_for = None
                     st.rerun()
@@ -406,32 +456,59 @@ def add_medication_form():
                 st.session_state.adding_med_for = None
                 st.rerun()
 
+@track_page("edit_medication")
 def edit_medication_form():
     with get_db_connection() as conn:
         med = conn.execute(
-            "SELECT * FROM medications WHERE id = ?",
+            """SELECT m.id, m.patient_id, m.medication_name, m.dosage, m.frequency, m.start_date,
+                      m.end_date, m.notes, m.dose_amount, m.dose_unit, m.frequency_code, m.catalog_id, c.name
+               FROM medications m LEFT JOIN medication_catalog c ON c.id = m.catalog_id
+               WHERE m.id = ?""",
             (st.session_state.editing_med,)
         ).fetchone()
     
     st.header("✏️ Edit Medication")
     
+    catalog_id, medication_name = medication_picker(f"edit_med_{med[0]}", med[2],
+                                                    (med[11], med[12]) if med[11] else None)
+    catalog_id, drug, kidney = renal_dosing_panel(med[1], catalog_id, medication_name)
+    
+    # The dose fields start from the recorded text; text that is not a plain
+    # amount and unit ("5 mg/kg") leaves them empty. The text is only
+    # rewritten when the dose or frequency is changed here
+    amount, unit = parse_dosage(med[3]) or (None, None)
+    recorded_frequency = med[10] or parse_frequency(med[4])
+    st.caption(f"Recorded as: {med[3]}, {med[4]}"
+               + (" — leave the dose fields empty to keep it" if amount is None or recorded_frequency is None else ""))
+    
     with st.form("edit_med_form"):
-        medication_name = st.text_input("Medication Name*", value=med[2])
-        dosage = st.text_input("Dosage*", value=med[3])
-        frequency = st.text_input("Frequency*", value=med[4])
+        dose_amount, dose_unit, frequency_code = dose_fields(amount, unit, recorded_frequency)
         start_date = st.date_input("Start Date*", 
                                  value=datetime.strptime(med[5], "%Y-%m-%d").date())
         end_date = st.date_input("End Date", 
                                value=datetime.strptime(med[6], "%Y-%m-%d").date() if med[6] else None)
         notes = st.text_area("Notes", value=med[7] if med[7] else "")
+        override = st.checkbox("Save despite a renal dosing warning") if kidney else False
         
         col1, col2 = st.columns(2)
         with col1:
             if st.form_submit_button("Save Changes", type="primary"):
-                if not medication_name or not dosage or not frequency:
+                dose_changed = (dose_amount, dose_unit) != (amount, unit)
+                frequency_changed = frequency_code != recorded_frequency
+                finding = kidney and check_prescription(drug, kidney["egfr"], dose_amount, dose_unit, frequency_code)
+                if (not medication_name or (dose_changed and (not dose_amount or not dose_unit))
+                        or (frequency_changed and not frequency_code)):
                     st.error("Please fill all required fields (*)")
+                elif finding and not override:
+                    st.error(f"⚠️ {finding[1]}")
+                    st.caption("Adjust the dose, or tick \"Save despite a renal dosing warning\" to save it as prescribed.")
                 else:
-                    with get_db_connection() as conn:
+                    medication_id = st.session_state.editing_med
+                    username = st.session_state.username
+                    dosage = format_dosage(dose_amount, dose_unit) if dose_changed else med[3]
+                    frequency = FREQUENCIES[frequency_code] if frequency_changed else med[4]
+                    def update(conn):
+                        before = row_snapshot(conn, "medications", "id", medication_id)
                         conn.execute(
                             """UPDATE medications SET
                             medication_name = ?,
@@ -439,7 +516,11 @@ def edit_medication_form():
                             frequency = ?,
                             start_date = ?,
                             end_date = ?,
-                            notes = ?
+                            notes = ?,
+                            catalog_id = ?,
+                            dose_amount = ?,
+                            dose_unit = ?,
+                            frequency_code = ?
                             WHERE id = ?""",
                             (
                                 medication_name,
@@ -448,10 +529,18 @@ def edit_medication_form():
                                 str(start_date),
                                 str(end_date) if end_date else None,
                                 notes,
-                                st.session_state.editing_med
+                                catalog_id,
+                                dose_amount,
+                                dose_unit,
+                                frequency_code,
+                                medication_id
                             )
                         )
-                        conn.commit()
+                        if finding:
+                            recheck_active_prescriptions(conn, [med[1]])
+                        audit_event(conn, username, "medications", medication_id, "UPDATE", before=before,
+                                    after=row_snapshot(conn, "medications", "id", medication_id), patient_id=med[1])
+                    write_clinic(update)
                     st.success("Medication updated successfully!")
                     st.session_state.editing_med = None
                     st.rerun()
@@ -460,6 +549,7 @@ def edit_medication_form():
                 st.session_state.editing_med = None
                 st.rerun()
 
+@track_page("add_diagnostic")
 def add_diagnostic_form():
     st.header("🩺 Add New Diagnostic Test")
     
@@ -468,6 +558,11 @@ def add_diagnostic_form():
         test_date = st.date_input("Test Date*", value=date.today())
         results = st.text_area("Results")
         notes = st.text_area("Notes")
+        uploads = st.file_uploader(
+            "Attachments (images, scanned reports)",
+            type=ATTACHMENT_TYPES,
+            accept_multiple_files=True
+        )
         
         col1, col2 = st.columns(2)
         with col1:
@@ -475,20 +570,33 @@ def add_diagnostic_form():
                 if not test_name:
                     st.error("Test name is required!")
                 else:
-                    with get_db_connection() as conn:
-                        conn.execute(
+                    patient_id = st.session_state.adding_diag_for
+                    db_path = clinic_db_path()
+                    username = st.session_state.username
+                    def insert(conn, stored):
+                        cursor = conn.execute(
                             """INSERT INTO diagnostics 
-                            (patient_id, test_name, test_date, results, notes) 
-                            VALUES (?, ?, ?, ?, ?)""",
+                            (patient_id, test_name, test_date, results, notes, created_at, created_by) 
+                            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)""",
                             (
-                                st.session_state.adding_diag_for,
+                                patient_id,
                                 test_name,
                                 str(test_date),
                                 results,
-                                notes
+                                notes,
+                                username
                             )
                         )
-                        conn.commit()
+                        diagnostic_id = cursor.lastrowid
+                        audit_event(conn, username, "diagnostics", diagnostic_id, "INSERT",
+                                    after=row_snapshot(conn, "diagnostics", "id", diagnostic_id), patient_id=patient_id)
+                        for upload, sha256, size, _ in stored:
+                            attachment_id = record_attachment(conn, db_path, diagnostic_id, upload.name, sha256, size,
+                                                              upload.type, username)
+                            audit_event(conn, username, "diagnostic_attachments", attachment_id, "INSERT",
+                                        after={"diagnostic_id": diagnostic_id, "filename": upload.name, "sha256": sha256},
+                                        patient_id=patient_id)
+                    write_with_uploads(uploads, insert)
                     st.success("Diagnostic test added successfully!")
                     st.session_state.adding_diag_for = None
                     st.rerun()
@@ -497,6 +605,7 @@ def add_diagnostic_form():
                 st.session_state.adding_diag_for = None
                 st.rerun()
 
+@track_page("edit_diagnostic")
 def edit_diagnostic_form():
     with get_db_connection() as conn:
         diag = conn.execute(
@@ -519,7 +628,10 @@ def edit_diagnostic_form():
                 if not test_name:
                     st.error("Test name is required!")
                 else:
-                    with get_db_connection() as conn:
+                    diagnostic_id = st.session_state.editing_diag
+                    username = st.session_state.username
+                    def update(conn):
+                        before = row_snapshot(conn, "diagnostics", "id", diagnostic_id)
                         conn.execute(
                             """UPDATE diagnostics SET
                             test_name = ?,
@@ -532,10 +644,12 @@ def edit_diagnostic_form():
                                 str(test_date),
                                 results,
                                 notes,
-                                st.session_state.editing_diag
+                                diagnostic_id
                             )
                         )
-                        conn.commit()
+                        audit_event(conn, username, "diagnostics", diagnostic_id, "UPDATE", before=before,
+                                    after=row_snapshot(conn, "diagnostics", "id", diagnostic_id), patient_id=diag[1])
+                    write_clinic(update)
                     st.success("Diagnostic test updated successfully!")
                     st.session_state.editing_diag = None
                     st.rerun()
@@ -548,7 +662,9 @@ def edit_diagnostic_form():
 # DATABASE INITIALIZATION
 # ======================
 def init_db():
-    conn = sqlite3.connect("renal_tracker.db")
+    # Runs on every rerun. On an up-to-date database it only reads, but a
+    # maintenance VACUUM can still keep readers waiting while it copies back
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     c = conn.cursor()
     
     # Check if users table exists
@@ -580,6 +696,29 @@ def init_db():
         if 'created_at' not in columns:
             c.execute("ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
     
+    init_session_schema(conn)
+    init_clinic_registry(conn, DB_PATH)
+    
+    # Create default admin if none exists
+    c.execute("SELECT 1 FROM users WHERE username = 'admin'")
+    if not c.fetchone():
+        c.execute(
+            "INSERT INTO users (username, password, full_name, user_type) VALUES (?, ?, ?, ?)",
+            ("admin", hash_password("admin123"), "System Administrator", "Admin")
+        )
+    conn.commit()
+    conn.close()
+    
+    # Every clinic database gets the clinical schema
+    for _, db_path in clinic_router.clinics().values():
+        conn = sqlite3.connect(db_path, timeout=30)
+        init_clinic_db(conn)
+        conn.commit()
+        conn.close()
+
+def init_clinic_db(conn):
+    c = conn.cursor()
+    
     # Create patients table
     c.execute('''
         CREATE TABLE IF NOT EXISTS patients (
@@ -609,6 +748,12 @@ def init_db():
             start_date TEXT NOT NULL,
             end_date TEXT,
             notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT,
+            catalog_id INTEGER,
+            dose_amount REAL,
+            dose_unit TEXT,
+            frequency_code TEXT,
             FOREIGN KEY (patient_id) REFERENCES patients(id)
         )
     ''')
@@ -622,6 +767,8 @@ def init_db():
             test_date TEXT NOT NULL,
             results TEXT,
             notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT,
             FOREIGN KEY (patient_id) REFERENCES patients(id)
         )
     ''')
@@ -636,23 +783,28 @@ def init_db():
             neutrophils TEXT, lymphocytes TEXT, monocytes TEXT, basophils TEXT, eosinophils TEXT,
             mcv TEXT, mch TEXT, mchc TEXT, sodium TEXT, potassium TEXT, creatinine TEXT,
             calcium TEXT, phosphorus TEXT, urea_nitrogen TEXT, albumin TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT,
             FOREIGN KEY(patient_id) REFERENCES patients(id)
         )
     """)
     
-    # Create default admin if none exists
-    c.execute("SELECT 1 FROM users WHERE username = 'admin'")
-    if not c.fetchone():
-        c.execute(
-            "INSERT INTO users (username, password, full_name, user_type) VALUES (?, ?, ?, ?)",
-            ("admin", hash_password("admin123"), "System Administrator", "Admin")
-        )
-    conn.commit()
-    conn.close()
+    init_audit_schema(conn)
+    init_changefeed_schema(conn)
+    init_activity_schema(conn)
+    init_alert_schema(conn)
+    init_active_med_indexes(conn)
+    init_medication_catalog(conn)
+    init_renal_dosing_indexes(conn)
+    init_timeline_indexes(conn)
+    init_dialysis_schema(conn)
+    init_attachment_schema(conn)
+    init_maintenance_schema(conn)
 
 # ======================
 # AUTHENTICATION
 # ======================
+@track_page("login")
 def show_login():
     st.empty()
     col1, col2, col3 = st.columns([1, 3, 1])
@@ -669,16 +821,23 @@ def show_login():
                 confirm_password = st.text_input("Confirm Password", type="password")
                 
                 if st.form_submit_button("Reset Password"):
-                    if new_password != confirm_password:
+                    retry_after = login_retry_after(username, get_client_ip())
+                    if retry_after:
+                        st.error(f"Too many attempts. Please try again in {int(retry_after) + 1} seconds.")
+                    elif new_password != confirm_password:
                         st.error("Passwords don't match!")
                     else:
-                        with get_db_connection() as conn:
-                            cursor = conn.cursor()
-                            cursor.execute(
+                        password_hash = hash_password(new_password)
+                        def reset(conn):
+                            cursor = conn.execute(
                                 "UPDATE users SET password = ? WHERE username = ?",
-                                (hash_password(new_password), username)
+                                (password_hash, username)
                             )
-                            conn.commit()
+                            if cursor.rowcount:
+                                # Signed session URLs must not outlive the old password
+                                invalidate_user_sessions(conn, username, revoke=True)
+                                audit_event(conn, username, "users", username, "UPDATE", after={"password": "***"})
+                        write_directory(reset)
                         st.success("Password updated!")
                         st.query_params.clear()
                         st.rerun()
@@ -689,26 +848,50 @@ def show_login():
             password = st.text_input("Password", type="password")
             
             if st.form_submit_button("Login", type="primary"):
+                retry_after = login_retry_after(username, get_client_ip())
+                if retry_after:
+                    login_attempts.inc("throttled")
+                    st.error(f"Too many login attempts. Please try again in {int(retry_after) + 1} seconds.")
+                    return
                 try:
-                    with get_db_connection() as conn:
+                    with get_directory_connection() as conn:
                         cursor = conn.cursor()
                         cursor.execute(
-                            "SELECT username, password, user_type, full_name, status FROM users WHERE username = ?",
+                            "SELECT username, password, user_type, full_name, status, clinic FROM users WHERE username = ?",
                             (username,)
                         )
                         user = cursor.fetchone()
                     
-                    if user and hash_password(password) == user[1]:
+                    ok, needs_rehash = verify_password(username, password, user[1] if user else None)
+                    if ok and needs_rehash:
+                        # Upgrade legacy/outdated hashes now that we know the password
+                        password_hash = hash_password(password)
+                        write_directory(lambda conn: conn.execute(
+                            "UPDATE users SET password = ? WHERE username = ? AND password = ?",
+                            (password_hash, user[0], user[1])
+                        ))
+                    
+                    if ok:
                         if user[4] != "active":
+                            login_attempts.inc("inactive")
                             st.error(f"Account is {user[4]}!")
                         else:
+                            login_attempts.inc("success")
+                            record_login_success(get_client_ip())
+                            def login(conn, username=user[0]):
+                                token = create_session(conn, username)
+                                audit_event(conn, username, "user_sessions", username, "INSERT")
+                                return token
+                            st.query_params["session"] = write_directory(login)
                             st.session_state.authenticated = True
                             st.session_state.username = user[0]
                             st.session_state.user_type = user[2]
                             st.session_state.full_name = user[3]
+                            st.session_state.clinic = user[5]
                             st.session_state.current_page = "Home"
                             st.rerun()
                     else:
+                        login_attempts.inc("failure")
                         st.error("Invalid username or password")
                 except sqlite3.OperationalError as e:
                     st.error("Database error. Please contact administrator.")
@@ -731,10 +914,11 @@ def show_profile_button():
             st.session_state.current_page = "Profile"
             st.rerun()
 
+@track_page("profile")
 def manage_profile():
     st.header("My Profile")
     
-    with get_db_connection() as conn:
+    with get_directory_connection() as conn:
         user = conn.execute(
             "SELECT username, full_name FROM users WHERE username = ?",
             (st.session_state.username,)
@@ -761,18 +945,27 @@ def manage_profile():
                         return
                     
                     if update_fields:
-                        with get_db_connection() as conn:
+                        username = st.session_state.username
+                        current_token = st.query_params.get("session")
+                        def update(conn):
+                            before = row_snapshot(conn, "users", "username", username)
                             if 'password' in update_fields:
                                 conn.execute(
                                     "UPDATE users SET full_name = ?, password = ? WHERE username = ?",
-                                    (new_full_name, update_fields['password'], st.session_state.username)
+                                    (new_full_name, update_fields['password'], username)
                                 )
+                                # Other sessions (and any copied session URL) end with the old password
+                                invalidate_user_sessions(conn, username, revoke=True, keep_token=current_token)
                             else:
                                 conn.execute(
                                     "UPDATE users SET full_name = ? WHERE username = ?",
-                                    (new_full_name, st.session_state.username)
+                                    (new_full_name, username)
                                 )
-                            conn.commit()
+                            audit_event(conn, username, "users", username, "UPDATE", before=before,
+                                        after=row_snapshot(conn, "users", "username", username))
+                        write_directory(update)
+                        with get_directory_connection() as conn:
+                            invalidate_user_sessions(conn, username)
                         st.session_state.full_name = new_full_name
                         st.success("Profile updated successfully!")
                         st.session_state.editing_profile = False
@@ -787,6 +980,7 @@ def manage_profile():
         st.write(f"**Username:** {user[0]}")
         st.write(f"**Full Name:** {user[1]}")
         st.write(f"**Account Type:** {st.session_state.user_type}")
+        st.write(f"**Clinic:** {clinic_router.clinics()[st.session_state.clinic][0]}")
         
         if st.button("Edit Profile", type="primary"):
             st.session_state.editing_profile = True
@@ -799,6 +993,35 @@ def manage_profile():
 # ======================
 # HOME PAGE
 # ======================
+def clinic_overview():
+    # Fan out one aggregate per clinic, read from each clinic's snapshot
+    counts = clinic_router.federated(
+        """SELECT (SELECT COUNT(*) FROM patients),
+                  (SELECT COUNT(*) FROM patients WHERE created_at >= date('now', '-30 days')),
+                  (SELECT COUNT(*) FROM alerts WHERE status = 'open')""",
+        connect=get_snapshot_connection
+    )
+    with get_directory_connection() as conn:
+        users = dict(conn.execute("SELECT clinic, COUNT(*) FROM users GROUP BY clinic").fetchall())
+    rows = []
+    for code, (name, _) in clinic_router.clinics().items():
+        patients, new_patients, alerts = counts[code][0] if counts.get(code) else (None, None, None)
+        rows.append({
+            "Clinic": name, "Code": code, "Users": users.get(code, 0),
+            "Patients": patients, "New Patients (30d)": new_patients, "Open Alerts": alerts,
+        })
+    return pd.DataFrame(rows)
+
+def show_clinic_overview():
+    st.subheader("All Clinics", divider="blue")
+    overview = clinic_overview()
+    st.dataframe(overview, use_container_width=True, hide_index=True)
+    st.caption(
+        f"{int(overview['Patients'].sum())} patients and {int(overview['Users'].sum())} users "
+        f"across {len(overview)} clinic(s); patient counts come from each clinic's report snapshot"
+    )
+
+@track_page("home")
 def show_home():
     show_profile_button()
     
@@ -813,16 +1036,15 @@ def show_home():
     st.markdown("---")
     
     # Metrics
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         patient_count = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
-        active_patients = conn.execute(
-            "SELECT COUNT(DISTINCT patient_id) FROM medications WHERE end_date IS NULL OR end_date >= date('now')"
-        ).fetchone()[0]
+        active_patients = count_active_patients(conn)
         recent_patients = conn.execute(
             "SELECT COUNT(*) FROM patients WHERE created_at >= date('now', '-30 days')"
         ).fetchone()[0]
     
     st.subheader("Practice Overview", divider="blue")
+    show_snapshot_status()
     col1, col2, col3 = st.columns(3)
     with col1:
         st.markdown(f"""
@@ -846,6 +1068,40 @@ def show_home():
         </div>
         """, unsafe_allow_html=True)
     
+    if st.session_state.user_type == "Admin" and len(clinic_router.clinics()) > 1:
+        show_clinic_overview()
+    
+    st.markdown("---")
+    
+    # Clinical Alerts (live data; served from the open-alerts index)
+    st.subheader("Clinical Alerts", divider="red")
+    with get_db_connection() as conn:
+        alert_count = count_open_alerts(conn)
+        alerts = open_alerts(conn, limit=20)
+    
+    if alerts:
+        st.caption(f"{alert_count} open alert(s)" + (" — showing the 20 most recent" if alert_count > 20 else ""))
+        for alert in alerts:
+            cols = st.columns([5, 1])
+            with cols[0]:
+                icon = "🚨" if alert[3] == "critical" else "⚠️"
+                st.markdown(f"{icon} **{html.escape(alert[2] or '')}** (ID: {alert[1]}) — {html.escape(alert[4])}"
+                            f"  \n<small>{html.escape(str(alert[5]))}</small>",
+                            unsafe_allow_html=True)
+            with cols[1]:
+                if st.session_state.user_type in ["Admin", "Doctor"]:
+                    if st.button("Acknowledge", key=f"ack_alert_{alert[0]}"):
+                        def acknowledge(conn, alert_id=alert[0], patient_id=alert[1],
+                                        username=st.session_state.username):
+                            before = row_snapshot(conn, "alerts", "id", alert_id)
+                            acknowledge_alert(conn, alert_id, username)
+                            audit_event(conn, username, "alerts", alert_id, "UPDATE", before=before,
+                                        after=row_snapshot(conn, "alerts", "id", alert_id), patient_id=patient_id)
+                        write_clinic(acknowledge)
+                        st.rerun()
+    else:
+        st.success("No open clinical alerts")
+    
     st.markdown("---")
     
     # Quick Actions
@@ -866,43 +1122,77 @@ def show_home():
     
     st.markdown("---")
     
-    # Recent Activity
+    # Recent Activity: the first page plus one keyset page per "Load more"
     st.subheader("Recent Activity", divider="blue")
+    if st.session_state.get("activity_clinic") != st.session_state.clinic:
+        st.session_state.activity_clinic = st.session_state.clinic
+        st.session_state.activity_cursors = []
     with get_db_connection() as conn:
-        recent_patients = conn.execute(
-            """SELECT p.id, p.full_name, p.diagnosis, u.full_name as created_by 
-               FROM patients p JOIN users u ON p.created_by = u.username
-               ORDER BY p.created_at DESC LIMIT 5"""
-        ).fetchall()
+        activity, next_cursor = activity_page(conn)
+        for cursor in st.session_state.activity_cursors:
+            page, next_cursor = activity_page(conn, before=cursor)
+            activity += page
+    # Users live in the directory database, so resolve names separately
+    actors = sorted({item[6] for item in activity if item[6]})
+    with get_directory_connection() as conn:
+        actor_names = dict(conn.execute(
+            f"SELECT username, full_name FROM users WHERE username IN ({', '.join('?' for _ in actors)})",
+            actors
+        ).fetchall())
     
-    if recent_patients:
-        for patient in recent_patients:
+    if activity:
+        for _, occurred_at, entity, _, patient_id, patient_name, actor, summary in activity:
+            # Names and summaries are user-entered text inside raw HTML
+            patient_name = html.escape(patient_name or "Removed patient")
+            by = html.escape(actor_names.get(actor, actor or "Unknown"))
             with st.container():
                 st.markdown(f"""
                 <div style="padding: 10px; border-radius: 8px; background-color: white; margin-bottom: 10px;">
-                    <strong>{patient[1]}</strong> (ID: {patient[0]})<br>
-                    <small>Diagnosis: {patient[2] or 'Not specified'} | Added by: {patient[3]}</small>
+                    {ENTITY_ICONS.get(entity, "•")} <strong>{patient_name}</strong> (ID: {patient_id}) — {html.escape(summary or "")}<br>
+                    <small>{html.escape(str(occurred_at))} | By: {by}</small>
                 </div>
                 """, unsafe_allow_html=True)
+        if next_cursor is not None and st.button("Load more", key="activity_load_more"):
+            st.session_state.activity_cursors.append(next_cursor)
+            st.rerun()
     else:
-        st.info("No recent patient activity")
+        st.info("No recent activity")
 
 # ======================
 # PATIENT MANAGEMENT
 # ======================
+# Typed Arrow columns for the patient tables (see arrow_results)
+MEDICATION_TABLE = [("Medication", CATEGORY), ("Dosage", CATEGORY), ("Frequency", CATEGORY),
+                    ("Start Date", DATE), ("End Date", DATE), ("Notes", TEXT)]
+DIAGNOSTIC_TABLE = [("Test Name", CATEGORY), ("Test Date", DATE), ("Results", TEXT), ("Notes", TEXT)]
+LAB_TABLE = [("test_date", DATE)] + [(analyte, FLOAT) for analyte in LAB_ANALYTES]
+
 def show_patient_details(patient_id):
+    patient = cached_patient(patient_id)
+    if not patient:
+        st.error("Patient not found")
+        return
+    
     with get_db_connection() as conn:
-        patient = conn.execute(
-            "SELECT * FROM patients WHERE id = ?",
-            (patient_id,)
-        ).fetchone()
-        
-        if not patient:
-            st.error("Patient not found")
-            return
+        patient_alerts = patient_open_alerts(conn, patient_id)
+    
+    for severity, message, created_at in patient_alerts:
+        if severity == "critical":
+            st.error(f"🚨 {message} ({created_at})")
+        else:
+            st.warning(f"⚠️ {message} ({created_at})")
+    
+    # Older rows live in the archive database; only read them when asked
+    include_history = st.checkbox(
+        "Include archived history",
+        key="include_history",
+        help="Also show medications, diagnostics and labs moved to the archive"
+    )
     
     # Use tabs for better organization
-    tab1, tab2, tab3, tab4 = st.tabs(["Overview", "Medications", "Diagnostics", "Lab Values"])
+    tab1, tab_timeline, tab2, tab3, tab4, tab5 = st.tabs(
+        ["Overview", "Timeline", "Medications", "Diagnostics", "Lab Values", "Dialysis"]
+    )
     
     with tab1:  # Overview tab
         st.markdown(f"""
@@ -928,21 +1218,37 @@ def show_patient_details(patient_id):
         </div>
         """, unsafe_allow_html=True)
     
+    with tab_timeline:
+        show_patient_timeline(patient_id, include_history)
+    
     with tab2:  # Medications tab
         st.subheader("💊 Medications")
         with get_db_connection() as conn:
-            medications = conn.execute(
-                "SELECT * FROM medications WHERE patient_id = ? ORDER BY start_date DESC",
+            current_meds = get_active_medications(conn, patient_id)
+            if include_history:
+                attach_archive(conn, clinic_db_path())
+            med_columns = ["id", "patient_id", "medication_name", "dosage", "frequency", "start_date", "end_date", "notes"]
+            medications = fetch_arrow(conn.execute(
+                f"""SELECT medication_name, dosage, frequency, start_date, end_date, notes
+                   FROM {history_source(conn, "medications", med_columns, include_history)}
+                   WHERE patient_id = ? ORDER BY start_date DESC""",
                 (patient_id,)
-            ).fetchall()
+            ), MEDICATION_TABLE)
         
-        if medications:
-            med_df = pd.DataFrame(medications, columns=[
-                "ID", "Patient ID", "Medication", "Dosage", "Frequency", 
-                "Start Date", "End Date", "Notes"
-            ])
+        st.markdown("**Current regimen**")
+        if current_meds:
             st.dataframe(
-                med_df.drop(columns=["ID", "Patient ID"]), 
+                rows_to_arrow(current_meds, MEDICATION_TABLE),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.caption("No active medications")
+        
+        st.markdown("**All medications**")
+        if medications.num_rows:
+            st.dataframe(
+                medications, 
                 use_container_width=True,
                 hide_index=True
             )
@@ -957,20 +1263,23 @@ def show_patient_details(patient_id):
     with tab3:  # Diagnostics tab
         st.subheader("🩺 Diagnostics")
         with get_db_connection() as conn:
+            if include_history:
+                attach_archive(conn, clinic_db_path())
+            diag_columns = ["id", "patient_id", "test_name", "test_date", "results", "notes"]
             diagnostics = conn.execute(
-                "SELECT * FROM diagnostics WHERE patient_id = ? ORDER BY test_date DESC",
+                f"""SELECT {', '.join(diag_columns)}
+                   FROM {history_source(conn, "diagnostics", diag_columns, include_history)}
+                   WHERE patient_id = ? ORDER BY test_date DESC""",
                 (patient_id,)
             ).fetchall()
         
         if diagnostics:
-            diag_df = pd.DataFrame(diagnostics, columns=[
-                "ID", "Patient ID", "Test Name", "Test Date", "Results", "Notes"
-            ])
             st.dataframe(
-                diag_df.drop(columns=["ID", "Patient ID"]), 
+                rows_to_arrow([diagnostic[2:] for diagnostic in diagnostics], DIAGNOSTIC_TABLE), 
                 use_container_width=True,
                 hide_index=True
             )
+            show_diagnostic_attachments(patient_id, diagnostics)
         else:
             st.info("No diagnostics recorded for this patient")
         
@@ -983,14 +1292,15 @@ def show_patient_details(patient_id):
     with tab4:
         st.subheader("🧪 Lab Values")
         with get_db_connection() as conn:
-            labs = conn.execute(
-                "SELECT * FROM lab_results WHERE patient_id = ? ORDER BY test_date DESC",
+            if include_history:
+                attach_archive(conn, clinic_db_path())
+            lab_source = history_source(conn, "lab_results", ["patient_id", "test_date"] + LAB_ANALYTES, include_history)
+            labs = fetch_arrow(conn.execute(
+                f"SELECT test_date, {', '.join(LAB_ANALYTES)} FROM {lab_source} WHERE patient_id = ? ORDER BY test_date DESC",
                 (patient_id,)
-            ).fetchall()
-            columns = [col[1] for col in conn.execute("PRAGMA table_info(lab_results)")]
-        if labs:
-            lab_df = pd.DataFrame(labs, columns=columns)
-            st.dataframe(lab_df.drop(columns=["id", "patient_id"]), use_container_width=True)
+            ), LAB_TABLE)
+        if labs.num_rows:
+            st.dataframe(labs, use_container_width=True)
         else:
             st.info("No lab values recorded for this patient.")
 
@@ -999,15 +1309,201 @@ def show_patient_details(patient_id):
                 st.session_state.adding_lab_for = patient_id
                 st.rerun()
 
+    with tab5:
+        show_dialysis_sessions(patient_id)
+
     # Generate Report Button
     if st.button("📄 Generate Patient Report", type="primary"):
         st.session_state.generating_report_for = patient_id
+        # The checkbox is not rendered on the report page, so its state would not survive
+        st.session_state.report_with_history = include_history
         st.rerun()
     
     if st.button("⬅️ Back to Patient List", type="secondary"):
         st.session_state.viewing_patient = None
         st.rerun()
 
+TIMELINE_ICONS = {"lab": "🧪", "diagnostic": "🩺", "medication_start": "💊", "medication_stop": "⏹️"}
+TIMELINE_COLUMNS = {
+    "lab_results": ["id", "patient_id", "test_date"] + LAB_ANALYTES,
+    "diagnostics": ["id", "patient_id", "test_name", "test_date", "results"],
+    "medications": ["id", "patient_id", "medication_name", "dosage", "frequency", "start_date", "end_date"],
+}
+
+def show_patient_timeline(patient_id, include_history):
+    st.subheader("🕒 Timeline")
+    # Stack of keyset cursors: the page shown starts after the last one
+    if st.session_state.get("timeline_for") != (patient_id, include_history):
+        st.session_state.timeline_for = (patient_id, include_history)
+        st.session_state.timeline_cursors = []
+    cursors = st.session_state.timeline_cursors
+    with get_db_connection() as conn:
+        if include_history:
+            attach_archive(conn, clinic_db_path())
+        events, next_cursor = timeline_page(
+            conn, patient_id, before=cursors[-1] if cursors else None,
+            source=lambda table: history_source(conn, table, TIMELINE_COLUMNS[table], include_history)
+        )
+    
+    if not events:
+        st.info("No events recorded for this patient")
+    for event_date, kind, title, detail in events:
+        # Titles and details are user-entered text; escape them for the <small> markup
+        st.markdown(f"**{html.escape(str(event_date))}** &nbsp; {TIMELINE_ICONS[kind]} {html.escape(title or '')}"
+                    + (f"  \n<small>{html.escape(detail)}</small>" if detail else ""),
+                    unsafe_allow_html=True)
+    
+    cols = st.columns(2)
+    with cols[0]:
+        if cursors and st.button("⬅️ Newer", key="timeline_newer"):
+            cursors.pop()
+            st.rerun()
+    with cols[1]:
+        if next_cursor is not None and st.button("Older ➡️", key="timeline_older"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def show_diagnostic_attachments(patient_id, diagnostics):
+    db_path = clinic_db_path()
+    with get_db_connection() as conn:
+        attachments = attachments_for_patient(conn, patient_id)
+    
+    st.markdown("**📎 Attachments**")
+    labels = {d[0]: f"{d[2]} ({d[3]})" for d in diagnostics}
+    if not attachments:
+        st.caption("No files attached to this patient's diagnostics")
+    for diagnostic_id, files in attachments.items():
+        if diagnostic_id not in labels:
+            continue
+        with st.expander(f"{labels[diagnostic_id]} — {len(files)} file(s)"):
+            for attachment_id, filename, sha256, size, mime_type, uploaded_at, uploaded_by in files:
+                cols = st.columns([1, 3, 1])
+                with cols[0]:
+                    thumbnail = request_thumbnail(db_path, sha256, mime_type)
+                    if thumbnail:
+                        st.image(thumbnail, width=96)
+                    elif mime_type.startswith("image/"):
+                        st.caption("🖼️ Preview pending")
+                    else:
+                        st.markdown("📄")
+                with cols[1]:
+                    st.write(f"**{filename}**")
+                    st.caption(f"{format_size(size)} · uploaded {uploaded_at} by {uploaded_by or 'unknown'}")
+                with cols[2]:
+                    # The file is only opened when the button is clicked
+                    st.download_button(
+                        "⬇️ Download",
+                        data=lambda sha256=sha256: open_attachment(db_path, sha256),
+                        file_name=filename,
+                        mime=mime_type,
+                        key=f"download_attachment_{attachment_id}"
+                    )
+    
+    if st.session_state.user_type in ["Admin", "Staff"]:
+        with st.form("attach_files_form", clear_on_submit=True):
+            diagnostic_id = st.selectbox("Attach to", list(labels), format_func=labels.get)
+            uploads = st.file_uploader("Files", type=ATTACHMENT_TYPES, accept_multiple_files=True)
+            if st.form_submit_button("📎 Attach Files"):
+                if not uploads:
+                    st.error("Choose at least one file")
+                else:
+                    username = st.session_state.username
+                    def attach(conn, stored):
+                        for upload, sha256, size, _ in stored:
+                            attachment_id = record_attachment(conn, db_path, diagnostic_id, upload.name, sha256, size,
+                                                              upload.type, username)
+                            audit_event(conn, username, "diagnostic_attachments", attachment_id, "INSERT",
+                                        after={"diagnostic_id": diagnostic_id, "filename": upload.name, "sha256": sha256},
+                                        patient_id=patient_id)
+                        return [deduplicated for *_, deduplicated in stored]
+                    attached = write_with_uploads(uploads, attach)
+                    duplicates = sum(attached)
+                    st.success(f"Attached {len(attached)} file(s)"
+                               + (f"; {duplicates} already stored, not copied again" if duplicates else ""))
+                    st.rerun()
+
+def show_dialysis_sessions(patient_id):
+    st.subheader("🩸 Dialysis Sessions")
+    cols = st.columns(2)
+    with cols[0]:
+        since = st.date_input("From", value=date.today() - timedelta(days=365), key="dialysis_since")
+    with cols[1]:
+        until = st.date_input("To", value=date.today(), key="dialysis_until")
+    
+    # Summaries only; packed readings are decoded for the selected session alone
+    with get_db_connection() as conn:
+        sessions = list_sessions(conn, patient_id, since, until)
+    
+    if sessions:
+        sessions_df = pd.DataFrame(sessions, columns=[
+            "ID", "Date", "Start", "Interval (min)", "Readings", "Pre SBP", "Post SBP",
+            "Min SBP", "Mean Blood Flow", "UF Removed", "Notes"
+        ])
+        st.line_chart(sessions_df.set_index("Date")[["Pre SBP", "Post SBP", "Min SBP"]].sort_index())
+        st.dataframe(sessions_df.drop(columns=["ID"]), use_container_width=True, hide_index=True)
+        
+        selected = st.selectbox(
+            "Session detail",
+            options=range(len(sessions)),
+            format_func=lambda i: f"{sessions[i][1]} {sessions[i][2] or ''} ({sessions[i][4]} readings)"
+        )
+        session_id, interval = sessions[selected][0], sessions[selected][3]
+        with get_db_connection() as conn:
+            readings = load_readings(conn, session_id)
+        series = {}
+        for ch, values in readings.items():
+            indices, points = downsample(values, max_points=200)
+            series[CHANNEL_LABELS[ch]] = pd.Series(points, index=[i * interval for i in indices], dtype="float64")
+        if series:
+            detail_df = pd.DataFrame(series)
+            detail_df.index.name = "Minutes"
+            st.line_chart(detail_df[[CHANNEL_LABELS["sbp"], CHANNEL_LABELS["dbp"]]])
+            st.line_chart(detail_df[[CHANNEL_LABELS["blood_flow"], CHANNEL_LABELS["uf_volume"]]])
+    else:
+        st.info("No dialysis sessions recorded in this period")
+    
+    if st.session_state.user_type in ["Admin", "Staff"]:
+        with st.expander("➕ Record Dialysis Session"):
+            with st.form("add_dialysis_session_form", clear_on_submit=True):
+                cols = st.columns(3)
+                with cols[0]:
+                    session_date = st.date_input("Session Date*", value=date.today())
+                with cols[1]:
+                    start_time = st.time_input("Start Time", value=None)
+                with cols[2]:
+                    interval = st.number_input("Minutes between readings", min_value=1, max_value=120,
+                                               value=DEFAULT_INTERVAL_MINUTES)
+                readings_df = st.data_editor(
+                    pd.DataFrame({ch: [None] * 17 for ch in CHANNELS}, dtype="float64"),
+                    column_config={ch: st.column_config.NumberColumn(CHANNEL_LABELS[ch]) for ch in CHANNELS},
+                    num_rows="dynamic",
+                    use_container_width=True
+                )
+                notes = st.text_area("Notes")
+                
+                if st.form_submit_button("Save Session", type="primary"):
+                    # Drop trailing rows left completely empty
+                    filled = readings_df.dropna(how="all")
+                    readings_df = readings_df.loc[:filled.index.max()] if not filled.empty else filled
+                    readings = {
+                        ch: [None if pd.isna(v) else float(v) for v in readings_df[ch]]
+                        for ch in CHANNELS
+                    }
+                    username = st.session_state.username
+                    def insert(conn):
+                        session_id = save_session(
+                            conn, patient_id, session_date,
+                            start_time.strftime("%H:%M") if start_time else None,
+                            readings, interval_minutes=int(interval), notes=notes,
+                            created_by=username
+                        )
+                        audit_event(conn, username, "dialysis_sessions", session_id, "INSERT",
+                                    after=row_snapshot(conn, "dialysis_sessions", "id", session_id), patient_id=patient_id)
+                    write_clinic(insert)
+                    st.success("Dialysis session saved!")
+                    st.rerun()
+
+@track_page("patients")
 def patient_management():
     show_profile_button()
     
@@ -1064,9 +1560,12 @@ def patient_management():
                         st.error("Full name is required!")
                     else:
                         age = calculate_age(birthday)
-                        with get_db_connection() as conn:
-                            if st.session_state.editing_patient == "new":
-                                conn.execute(
+                        editing = st.session_state.editing_patient
+                        username = st.session_state.username
+                        def save(conn):
+                            if editing == "new":
+                                before, action = None, "INSERT"
+                                cursor = conn.execute(
                                     """
                                     INSERT INTO patients (
                                         full_name, birthday, sex, age, address,
@@ -1074,9 +1573,12 @@ def patient_management():
                                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                                     """,
                                     (full_name, str(birthday), sex, age, address,
-                                    contact_no, emergency_contact, diagnosis, st.session_state.username)
+                                    contact_no, emergency_contact, diagnosis, username)
                                 )
+                                saved_id = cursor.lastrowid
                             else:
+                                saved_id, action = editing, "UPDATE"
+                                before = row_snapshot(conn, "patients", "id", saved_id)
                                 conn.execute(
                                     """
                                     UPDATE patients SET
@@ -1085,9 +1587,11 @@ def patient_management():
                                     WHERE id = ?
                                     """,
                                     (full_name, str(birthday), sex, age, address,
-                                    contact_no, emergency_contact, diagnosis, st.session_state.editing_patient)
+                                    contact_no, emergency_contact, diagnosis, editing)
                                 )
-                            conn.commit()
+                            audit_event(conn, username, "patients", saved_id, action, before=before,
+                                        after=row_snapshot(conn, "patients", "id", saved_id), patient_id=saved_id)
+                        write_clinic(save)
                         st.session_state.editing_patient = None
                         st.rerun()
             with col2:
@@ -1096,11 +1600,11 @@ def patient_management():
                     st.rerun()
     
     # Patient List with View Buttons
-    with get_db_connection() as conn:
-        patients = conn.execute(
-            "SELECT * FROM patients WHERE full_name LIKE ? OR diagnosis LIKE ? ORDER BY full_name",
-            (f"%{search_term}%", f"%{search_term}%")
-        ).fetchall()
+    patients = cached_clinic_rows(
+        "SELECT * FROM patients WHERE full_name LIKE ? OR diagnosis LIKE ? ORDER BY full_name",
+        (f"%{search_term}%", f"%{search_term}%"),
+        tables=("patients",)
+    )
     
     if not patients:
         st.info("No patients found matching your search")
@@ -1127,14 +1631,17 @@ def patient_management():
 # ======================
 # REPORTS
 # ======================
+@track_page("reports")
 def show_reports():
     show_profile_button()
     st.header("Patient Reports")
     
+    show_snapshot_status()
+    
     # Search patients
     search_term = st.text_input("🔍 Search patients by name", key="report_search")
     
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         patients = conn.execute(
             "SELECT id, full_name FROM patients WHERE full_name LIKE ? ORDER BY full_name",
             (f"%{search_term}%",)
@@ -1150,23 +1657,129 @@ def show_reports():
         )
         
         patient_id = int(selected_patient.split(" - ")[0])
-        patient_name = selected_patient.split(" - ")[1]
         
-        if st.button("Generate PDF Report", type="primary"):
-            with st.spinner("Generating report..."):
-                try:
-                    pdf_bytes = generate_patient_report(patient_id)
-                    create_download_button(pdf_bytes, patient_name)
-                except Exception as e:
-                    st.error(f"Failed to generate report: {e}")
+        include_history = st.checkbox("Include archived history", key="report_include_history")
+        
+        show_report_preview(patient_id, use_snapshot=True, include_history=include_history)
+
+# ======================
+# COHORT ANALYTICS
+# ======================
+@track_page("cohort_analytics")
+def show_cohort_analytics():
+    show_profile_button()
+    st.header("Cohort Analytics")
+    show_snapshot_status()
+    
+    with st.form("cohort_filters"):
+        cols = st.columns(4)
+        with cols[0]:
+            diagnosis = st.text_input("Diagnosis contains")
+        with cols[1]:
+            sexes = st.multiselect("Sex", ["Male", "Female", "Other"])
+        with cols[2]:
+            age_bands = st.multiselect("Age band", [label for label, _, _ in AGE_BANDS])
+        with cols[3]:
+            medication = st.text_input("On active medication")
+        
+        st.caption("Latest lab value filters")
+        lab_filters = []
+        for i in range(2):
+            cols = st.columns([1, 2, 1, 2])
+            with cols[0]:
+                enabled = st.checkbox("Use", key=f"cohort_lab_use_{i}")
+            with cols[1]:
+                analyte = st.selectbox("Analyte", LAB_FILTER_ANALYTES, key=f"cohort_lab_analyte_{i}")
+            with cols[2]:
+                op = st.selectbox("Operator", list(LAB_FILTER_OPERATORS), key=f"cohort_lab_op_{i}")
+            with cols[3]:
+                value = st.number_input("Value", value=0.0, step=0.1, key=f"cohort_lab_value_{i}")
+            if enabled:
+                lab_filters.append([analyte, op, value])
+        
+        st.form_submit_button("Apply Filters", type="primary")
+    
+    filters = {
+        "diagnosis": diagnosis.strip(),
+        "sex": sexes,
+        "age_bands": age_bands,
+        "medication": medication.strip(),
+        "labs": lab_filters,
+    }
+    with get_read_connection() as conn:
+        result = run_cohort(conn, filters)
+    
+    summary = result["summary"]
+    cols = st.columns(3)
+    with cols[0]:
+        st.metric("Patients in cohort", summary["patients"])
+    with cols[1]:
+        st.metric("Mean age", f"{summary['mean_age']:.1f}" if summary["mean_age"] is not None else "—")
+    with cols[2]:
+        st.metric(
+            "Hb < 10 (latest, last month)",
+            f"{summary['hb_below_10_pct']:.1f}%" if summary["hb_below_10_pct"] is not None else "—",
+            help=f"{summary['hb_below_10_last_month']} of {summary['hb_tested_last_month']} patients "
+                 "whose latest labs were drawn in the last month"
+        )
+    
+    st.subheader("Age and Sex", divider="blue")
+    if result["age_sex"].empty:
+        st.info("No patients match these filters")
+    else:
+        st.dataframe(result["age_sex"], use_container_width=True)
+    
+    st.subheader("Latest Phosphorus by Sex", divider="blue")
+    if result["phosphorus_histogram"].empty:
+        st.info("No phosphorus results for this cohort")
+    else:
+        st.bar_chart(result["phosphorus_histogram"])
+        st.dataframe(result["phosphorus_stats"].round(2), use_container_width=True)
+    
+    st.subheader("Active Medication Usage", divider="blue")
+    if result["medication_usage"].empty:
+        st.info("No active medications for this cohort")
+    else:
+        st.dataframe(result["medication_usage"], use_container_width=True, hide_index=True)
 
 # ======================
 # USER MANAGEMENT
 # ======================
+@track_page("users")
 def manage_users():
     show_profile_button()
     st.header("User Management")
     
+    clinics = clinic_router.clinics()
+    
+    if st.session_state.user_type == "Admin":
+        show_clinic_overview()
+        
+        with st.form("add_clinic_form"):
+            st.subheader("Add Clinic")
+            cols = st.columns(2)
+            with cols[0]:
+                clinic_code = st.text_input("Clinic Code*", help="Lowercase letters, digits and underscores")
+            with cols[1]:
+                clinic_name = st.text_input("Clinic Name*")
+            if st.form_submit_button("Create Clinic", type="primary"):
+                if not clinic_code or not clinic_name:
+                    st.error("Please fill all required fields (*)")
+                else:
+                    try:
+                        db_path = clinic_router.add_clinic(clinic_code, clinic_name, st.session_state.username)
+                        init_db()
+                        start_snapshot_scheduler(db_path)
+                        start_maintenance_scheduler(db_path)
+                        st.success(f"Clinic {clinic_name} created")
+                        st.rerun()
+                    except ValueError as e:
+                        st.error(str(e))
+                    except sqlite3.IntegrityError:
+                        st.error("Clinic code already exists!")
+        
+        st.markdown("---")
+    
     # Only allow Admin to add new users
     if st.session_state.user_type == "Admin":
         with st.form("add_user_form"):
@@ -1180,6 +1793,11 @@ def manage_users():
             with cols[1]:
                 user_type = st.selectbox("Account Type*", ["Admin", "Doctor", "Staff"])
                 status = st.selectbox("Status", ["active", "inactive"], index=0)
+                clinic = st.selectbox(
+                    "Clinic*", list(clinics),
+                    index=list(clinics).index(st.session_state.clinic),
+                    format_func=lambda code: clinics[code][0]
+                )
             
             col1, col2 = st.columns(2)
             with col1:
@@ -1188,12 +1806,16 @@ def manage_users():
                         st.error("Please fill all required fields (*)")
                     else:
                         try:
-                            with get_db_connection() as conn:
+                            password_hash = hash_password(new_password)
+                            username = st.session_state.username
+                            def insert(conn):
                                 conn.execute(
-                                    "INSERT INTO users (username, password, full_name, user_type, status) VALUES (?, ?, ?, ?, ?)",
-                                    (new_username, hash_password(new_password), full_name, user_type, status)
+                                    "INSERT INTO users (username, password, full_name, user_type, status, clinic) VALUES (?, ?, ?, ?, ?, ?)",
+                                    (new_username, password_hash, full_name, user_type, status, clinic)
                                 )
-                                conn.commit()
+                                audit_event(conn, username, "users", new_username, "INSERT",
+                                            after=row_snapshot(conn, "users", "username", new_username))
+                            write_directory(insert)
                             st.success(f"User {new_username} created successfully!")
                             st.rerun()
                         except sqlite3.IntegrityError:
@@ -1206,17 +1828,18 @@ def manage_users():
     st.subheader("User Accounts")
     
     # User List with Actions
-    with get_db_connection() as conn:
-        users = conn.execute(
-            "SELECT username, full_name, user_type, status FROM users ORDER BY username"
-        ).fetchall()
+    users = cached_rows(
+        DB_PATH, get_directory_connection,
+        "SELECT username, full_name, user_type, status, clinic FROM users ORDER BY username",
+        tables=("users",)
+    )
     
     if not users:
         st.info("No user accounts found")
     else:
         for user in users:
             with st.container():
-                cols = st.columns([3, 2, 1, 1, 1])
+                cols = st.columns([3, 2, 1, 1, 2, 1])
                 with cols[0]:
                     st.write(f"**{user[0]}**")
                 with cols[1]:
@@ -1226,29 +1849,157 @@ def manage_users():
                 with cols[3]:
                     st.write(user[3].capitalize())
                 with cols[4]:
+                    st.write(clinics.get(user[4], (user[4],))[0])
+                with cols[5]:
                     if user[0] == st.session_state.username:
                         st.warning("Current user")
                     elif st.session_state.user_type == "Admin":
                         if st.button("Delete", key=f"delete_{user[0]}"):
-                            with get_db_connection() as conn:
+                            def delete(conn, username=user[0], actor=st.session_state.username):
+                                invalidate_user_sessions(conn, username, revoke=True)
+                                before = row_snapshot(conn, "users", "username", username)
                                 conn.execute(
                                     "DELETE FROM users WHERE username = ?",
-                                    (user[0],)
+                                    (username,)
                                 )
-                                conn.commit()
+                                audit_event(conn, actor, "users", username, "DELETE", before=before)
+                            write_directory(delete)
                             st.success(f"User {user[0]} deleted")
                             st.rerun()
             st.markdown("---")
 
+# ======================
+# AUDIT LOG
+# ======================
+@track_page("audit_log")
+def show_audit_log():
+    show_profile_button()
+    st.header("Audit Log")
+    
+    cols = st.columns(4)
+    with cols[0]:
+        patient_id = st.number_input("Patient ID (0 = any)", min_value=0, step=1, value=0)
+    with cols[1]:
+        username = st.text_input("Username")
+    with cols[2]:
+        since = st.date_input("From", value=None)
+    with cols[3]:
+        until = st.date_input("To", value=None)
+    
+    filters = dict(
+        patient_id=patient_id or None,
+        username=username.strip() or None,
+        since=since,
+        until=until and date.fromordinal(until.toordinal() + 1),
+        limit=500
+    )
+    with get_db_connection() as conn:
+        events = query_events(conn, **filters)
+    # Accounts, sessions and clinics are audited in the directory database;
+    # show them alongside another clinic's events (they carry no patient)
+    if clinic_db_path() != DB_PATH and not patient_id:
+        with get_directory_connection() as conn:
+            events += query_events(conn, entities=DIRECTORY_ENTITIES, **filters)
+        events = sorted(events, key=lambda event: event[0], reverse=True)[:500]
+    
+    if events:
+        events_df = pd.DataFrame(events, columns=[
+            "Time (UTC)", "User", "Patient ID", "Entity", "Entity ID", "Action", "Before", "After"
+        ])
+        st.dataframe(events_df, use_container_width=True, hide_index=True)
+        if len(events) == 500:
+            st.caption("Showing the 500 most recent matching events. Narrow the filters to see older ones.")
+    else:
+        st.info("No audit events match these filters")
+
 
+# ======================
+# DATABASE HEALTH
+# ======================
+@track_page("database_health")
+def show_database_health():
+    show_profile_button()
+    st.header("Database Health")
+    db_path = clinic_db_path()
+    start, end = maintenance_window()
+    st.caption(f"{clinic_router.clinics()[st.session_state.clinic][0]} — {db_path}. "
+               f"Maintenance runs daily between {start:02d}:00 and {end:02d}:00.")
+    
+    with get_db_connection() as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        latest = last_run(conn)
+        runs = recent_runs(conn)
+    
+    cols = st.columns(4)
+    cols[0].metric("File Size", format_size(page_size * page_count))
+    cols[1].metric("Pages", f"{page_count:,}")
+    cols[2].metric("Free Pages", f"{freelist:,}", help="Reclaimed by the next maintenance run")
+    cols[3].metric("Auto-vacuum", {0: "None", 1: "Full", 2: "Incremental"}.get(auto_vacuum, str(auto_vacuum)))
+    
+    st.subheader("Last Maintenance Run")
+    if latest:
+        started_at, duration, _, pages_before, pages_after, free_before, free_after, integrity, vacuum, triggered_by = latest
+        cols = st.columns(4)
+        cols[0].metric("Started (UTC)", started_at)
+        cols[1].metric("Duration", f"{duration:.1f} s")
+        cols[2].metric("Pages", f"{pages_after:,}", delta=pages_after - pages_before, delta_color="inverse")
+        cols[3].metric("Vacuum", vacuum.capitalize())
+        if integrity == "ok":
+            st.success(f"Integrity check passed (run by {triggered_by})")
+        else:
+            st.error("Integrity check found problems; the database was not vacuumed")
+            st.code(integrity)
+        runs_df = pd.DataFrame(runs, columns=[
+            "Started (UTC)", "Duration (s)", "Pages Before", "Pages After",
+            "Free Before", "Free After", "Integrity", "Vacuum", "Triggered By"
+        ])
+        runs_df["Integrity"] = runs_df["Integrity"].where(runs_df["Integrity"] == "ok", "problems")
+        st.dataframe(runs_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("Maintenance has not run on this database yet")
+    
+    if st.button("🧹 Run Maintenance Now"):
+        with st.spinner("Running maintenance; saves wait until it finishes..."):
+            run_maintenance(db_path, triggered_by=st.session_state.username)
+        st.rerun()
+    
+    st.subheader("Query Cache")
+    stats = cache_stats()
+    cols = st.columns(4)
+    cols[0].metric("Hit Ratio", "—" if stats["hit_ratio"] is None else f"{stats['hit_ratio']:.0%}")
+    cols[1].metric("Hits", f"{stats['hits']:,}")
+    cols[2].metric("Misses", f"{stats['misses'] + stats['stale']:,}",
+                   help=f"{stats['stale']:,} of them found an entry invalidated by a write or expired")
+    cols[3].metric("Entries", f"{stats['entries']:,}", help=f"{stats['evictions']:,} evicted to stay under the size limit")
+    
+    st.subheader("Table and Index Sizes")
+    show_snapshot_status()
+    # dbstat reads every page, so scan the report snapshot rather than the live file
+    conn = get_read_connection()
+    try:
+        sizes = object_sizes(conn)
+    finally:
+        conn.close()
+    if sizes is None:
+        st.info("This SQLite build has no dbstat support; sizes are unavailable")
+    else:
+        sizes_df = pd.DataFrame(sizes, columns=["Name", "Type", "Table", "Pages", "Bytes"])
+        sizes_df["Size"] = sizes_df["Bytes"].map(format_size)
+        st.dataframe(sizes_df[["Name", "Type", "Table", "Pages", "Size"]], use_container_width=True, hide_index=True)
+
+
+@track_page("add_labs")
 def add_lab_values_form():
     st.header("🧪 Add Laboratory Values")
     with st.form("add_lab_form"):
         test_date = st.date_input("Test Date", value=date.today())
-        RBC = st.text_input("RBC")
+        rbc = st.text_input("RBC")
         hematocrit = st.text_input("Hematocrit")
         hemoglobin = st.text_input("Hemoglobin")
-        WBC = st.text_input("WBC")
+        wbc = st.text_input("WBC")
         platelet_count = st.text_input("Platelet Count")
         neutrophils = st.text_input("Neutrophils")
         lymphocytes = st.text_input("Lymphocytes")
@@ -1269,19 +2020,30 @@ def add_lab_values_form():
         col1, col2 = st.columns(2)
         with col1:
             if st.form_submit_button("Save Lab Values", type="primary"):
-                with get_db_connection() as conn:
-                    conn.execute("""
+                patient_id = st.session_state.adding_lab_for
+                username = st.session_state.username
+                def insert(conn):
+                    cursor = conn.execute("""
                         INSERT INTO lab_results (
                             patient_id, test_date, rbc, hematocrit, hemoglobin, wbc, platelet_count,
                             neutrophils, lymphocytes, monocytes, basophils, eosinophils, mcv, mch, mchc,
-                            sodium, potassium, creatinine, calcium, phosphorus, urea_nitrogen, albumin
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            sodium, potassium, creatinine, calcium, phosphorus, urea_nitrogen, albumin,
+                            created_at, created_by
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
                     """, (
-                        st.session_state.adding_lab_for, str(test_date), rbc, hematocrit, hemoglobin, wbc,
+                        patient_id, str(test_date), rbc, hematocrit, hemoglobin, wbc,
                         platelet_count, neutrophils, lymphocytes, monocytes, basophils, eosinophils, mcv,
-                        mch, mchc, sodium, potassium, creatinine, calcium, phosphorus, urea_nitrogen, albumin
+                        mch, mchc, sodium, potassium, creatinine, calcium, phosphorus, urea_nitrogen, albumin,
+                        username
                     ))
-                    conn.commit()
+                    after = row_snapshot(conn, "lab_results", "id", cursor.lastrowid)
+                    # Check only this row (and the patient's previous one) against the alert rules
+                    evaluate_lab_result(conn, cursor.lastrowid)
+                    if creatinine.strip():
+                        recheck_active_prescriptions(conn, [patient_id])
+                    audit_event(conn, username, "lab_results", cursor.lastrowid, "INSERT", after=after,
+                                patient_id=patient_id)
+                write_clinic(insert)
                 st.success("Lab values added successfully!")
                 st.session_state.adding_lab_for = None
                 st.rerun()
@@ -1291,12 +2053,111 @@ def add_lab_values_form():
                 st.rerun()
 
 
+@track_page("ward_round_labs")
+def show_ward_round_labs():
+    show_profile_button()
+    st.header("🧪 Ward Round Labs")
+    st.caption("One row per patient; leave tests that were not done blank. Completely blank rows are skipped.")
+    
+    if "ward_round_saved" in st.session_state:
+        count, raised = st.session_state.pop("ward_round_saved")
+        st.success(f"Saved lab values for {count} patient(s)")
+        for message in raised:
+            st.warning(f"⚠️ {message}")
+    
+    with get_db_connection() as conn:
+        names = dict(conn.execute("SELECT id, full_name FROM patients ORDER BY full_name").fetchall())
+    selected = st.multiselect(
+        "Patients", list(names),
+        format_func=lambda pid: f"{names[pid]} (ID: {pid})",
+        key="ward_round_patients"
+    )
+    if st.checkbox("All patients", key="ward_round_all"):
+        selected = list(names)
+    if not selected:
+        st.info("Choose the patients on this round")
+        return
+    
+    # A new key after each save starts the grid empty again
+    version = st.session_state.get("ward_round_version", 0)
+    with st.form("ward_round_form"):
+        test_date = st.date_input("Test Date*", value=date.today())
+        grid = st.data_editor(
+            empty_grid([(pid, names[pid]) for pid in selected if pid in names]),
+            column_config={
+                "patient_id": None,
+                "Patient": st.column_config.TextColumn("Patient", disabled=True),
+                **{analyte: st.column_config.TextColumn(lab_label(analyte)) for analyte in LAB_ANALYTES},
+            },
+            hide_index=True,
+            use_container_width=True,
+            key=f"ward_round_grid_{version}"
+        )
+        submitted = st.form_submit_button("Validate & Save", type="primary")
+    if not submitted:
+        return
+    
+    values, invalid, filled = validate_lab_grid(grid)
+    if invalid.values.any():
+        errors = describe_errors(grid, values, invalid)
+        st.error(f"{len(errors)} cell(s) need correcting; nothing was saved")
+        # The editor cannot be styled, so show the submitted grid with the bad cells marked
+        highlight = invalid.replace({True: "background-color: #f8d7da; color: #842029", False: ""})
+        st.dataframe(
+            grid.drop(columns=["patient_id"]).style.apply(lambda _: highlight, axis=None, subset=LAB_ANALYTES),
+            use_container_width=True,
+            hide_index=True
+        )
+        for error in errors:
+            st.markdown(f"- {error}")
+        return
+    if not filled.any():
+        st.warning("No values entered")
+        return
+    
+    username = st.session_state.username
+    def save(conn):
+        saved, raised = save_lab_grid(conn, grid, values, filled, test_date, username)
+        for lab_id, patient_id, after in saved:
+            audit_event(conn, username, "lab_results", lab_id, "INSERT", after=after, patient_id=patient_id)
+        # New creatinine values change eGFRs: recheck those patients' active prescriptions
+        creatinine_patients = sorted({patient_id for _, patient_id, after in saved if after.get("creatinine")})
+        return saved, raised + recheck_active_prescriptions(conn, creatinine_patients)
+    saved, raised = write_clinic(save)
+    st.session_state.ward_round_version = version + 1
+    st.session_state.ward_round_saved = (
+        len(saved), [f"{names.get(pid, f'Patient {pid}')}: {message}" for pid, message in raised]
+    )
+    st.rerun()
+
+
 # ======================
 # MAIN APP
 # ======================
+def resume_session():
+    token = st.query_params.get("session")
+    if not token:
+        return
+    with get_directory_connection() as conn:
+        user = validate_session(conn, token)
+        clinic = user and conn.execute("SELECT clinic FROM users WHERE username = ?", (user[0],)).fetchone()
+    if user and clinic:
+        st.session_state.authenticated = True
+        st.session_state.username, st.session_state.user_type, st.session_state.full_name = user
+        st.session_state.clinic = clinic[0]
+    else:
+        del st.query_params["session"]
+
 def main():
     init_db()
+    for _, db_path in clinic_router.clinics().values():
+        start_snapshot_scheduler(db_path)
+        start_maintenance_scheduler(db_path)
+    start_metrics_server()
+    db_size_bytes.callback = database_sizes
     
+    if not st.session_state.authenticated:
+        resume_session()
     if not st.session_state.authenticated:
         show_login()
         return
@@ -1306,6 +2167,22 @@ def main():
         st.markdown('<div class="logo-container">', unsafe_allow_html=True)
         st.image(logo, width=150)
         st.markdown('</div>', unsafe_allow_html=True)
+        
+        # Admins can work in any clinic; everyone else stays in their own
+        clinics = clinic_router.clinics()
+        if st.session_state.user_type == "Admin" and len(clinics) > 1:
+            clinic = st.selectbox(
+                "Clinic", list(clinics),
+                index=list(clinics).index(st.session_state.clinic),
+                format_func=lambda code: clinics[code][0]
+            )
+            if clinic != st.session_state.clinic:
+                st.session_state.clinic = clinic
+                st.session_state.viewing_patient = None
+                st.session_state.editing_patient = None
+                st.rerun()
+        else:
+            st.caption(f"🏥 {clinics[st.session_state.clinic][0]}")
         st.markdown("---")
         
         # Define navigation items
@@ -1314,10 +2191,16 @@ def main():
             {"label": "👥 Patients", "page": "Patient Management"},
             {"label": "📊 Reports", "page": "Reports"}
         ]
+        if st.session_state.user_type in ["Admin", "Staff"]:
+            nav_items.append({"label": "🧪 Ward Round Labs", "page": "Ward Round Labs"})
+        if st.session_state.user_type in ["Admin", "Doctor"]:
+            nav_items.append({"label": "📈 Cohort Analytics", "page": "Cohort Analytics"})
         
         # Add Admin items if applicable
         if st.session_state.user_type == "Admin":
             nav_items.insert(2, {"label": "👤 Users", "page": "User Management"})
+            nav_items.append({"label": "📜 Audit Log", "page": "Audit Log"})
+            nav_items.append({"label": "🩺 Database Health", "page": "Database Health"})
         
         # Render navigation items
         for item in nav_items:
@@ -1335,10 +2218,17 @@ def main():
         
         st.markdown("---")
         if st.button("🚪 Logout", type="primary", use_container_width=True):
+            if "session" in st.query_params:
+                def logout(conn, token=st.query_params["session"], username=st.session_state.username):
+                    revoke_session(conn, token)
+                    audit_event(conn, username, "user_sessions", username, "UPDATE", after={"revoked": 1})
+                write_directory(logout)
+                del st.query_params["session"]
             st.session_state.authenticated = False
             st.session_state.username = ""
             st.session_state.user_type = ""
             st.session_state.full_name = ""
+            st.session_state.clinic = DEFAULT_CLINIC
             st.rerun()
     
     # Page Routing
@@ -1353,14 +2243,16 @@ def main():
     elif st.session_state.adding_diag_for:
         add_diagnostic_form()
     elif st.session_state.generating_report_for:
-        pdf_bytes = generate_patient_report(st.session_state.generating_report_for)
-        with get_db_connection() as conn:
-            patient_name = conn.execute(
-                "SELECT full_name FROM patients WHERE id = ?",
-                (st.session_state.generating_report_for,)
-            ).fetchone()[0]
-        create_download_button(pdf_bytes, patient_name)
-        st.session_state.generating_report_for = None
+        patient = cached_patient(st.session_state.generating_report_for)
+        st.header(f"Patient Report: {patient[1]}" if patient else "Patient Report")
+        if st.button("⬅️ Back to Patient", type="secondary"):
+            st.session_state.generating_report_for = None
+            st.rerun()
+        show_report_preview(
+            st.session_state.generating_report_for,
+            include_history=st.session_state.get("report_with_history", False),
+            key="patient_report"
+        )
     elif st.session_state.current_page == "Home":
         show_home()
     elif st.session_state.current_page == "Patient Management":
@@ -1371,6 +2263,14 @@ def main():
         manage_profile()
     elif st.session_state.current_page == "Reports":
         show_reports()
+    elif st.session_state.current_page == "Ward Round Labs" and st.session_state.user_type in ["Admin", "Staff"]:
+        show_ward_round_labs()
+    elif st.session_state.current_page == "Cohort Analytics" and st.session_state.user_type in ["Admin", "Doctor"]:
+        show_cohort_analytics()
+    elif st.session_state.current_page == "Audit Log" and st.session_state.user_type == "Admin":
+        show_audit_log()
+    elif st.session_state.current_page == "Database Health" and st.session_state.user_type == "Admin":
+        show_database_health()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
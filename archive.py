@@ -0,0 +1,138 @@
+"""Move cold clinical rows into an attached archive database.
+
+Rows older than the horizon leave the hot tables (and their indexes) for
+renal_tracker_archive.db. Views that want the full record ATTACH the
+archive on demand and read both through a UNION ALL.
+
+    python archive.py [--db renal_tracker.db] [--horizon-days 730]
+"""
+import argparse
+import os
+import sqlite3
+from datetime import date, timedelta
+
+from changefeed import current_revision
+from query_cache import invalidate
+
+DEFAULT_HORIZON_DAYS = int(os.getenv("RENAL_ARCHIVE_HORIZON_DAYS", 730))
+
+# What counts as cold, per table. Medication courses are archived only once
+# they have ended, however old their start date. Rows that live views still
+# point at stay hot however old they are: diagnostics with attachments, and
+# lab results behind an open alert. (Activity feed entries carry their own
+# summary and read nothing from the archived row.)
+ARCHIVE_RULES = {
+    "medications": ("end_date IS NOT NULL AND end_date < ?", "end_date"),
+    "diagnostics": ("test_date < ? AND id NOT IN (SELECT diagnostic_id FROM main.diagnostic_attachments)",
+                    "test_date"),
+    "lab_results": ("""test_date < ? AND id NOT IN (
+                           SELECT lab_result_id FROM main.alerts
+                           WHERE status = 'open' AND lab_result_id IS NOT NULL)""",
+                    "test_date"),
+}
+
+
+def archive_path(db_path):
+    base, ext = os.path.splitext(db_path)
+    return f"{base}_archive{ext}"
+
+
+def _columns(conn, schema, table):
+    return [col[1] for col in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _ensure_archive_tables(conn):
+    for table, (_, date_column) in ARCHIVE_RULES.items():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+        # Keep up with columns added to the hot table since the last run
+        existing = set(_columns(conn, "archive", table))
+        for column in _columns(conn, "main", table):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_patient_date ON {table}(patient_id, {date_column})"
+        )
+
+
+def _is_attached(conn):
+    return any(row[1] == "archive" for row in conn.execute("PRAGMA database_list"))
+
+
+def attach_archive(conn, db_path):
+    """ATTACH the archive of ``db_path`` as ``archive`` if it exists.
+
+    Returns True when history is available on ``conn``.
+    """
+    if _is_attached(conn):
+        return True
+    path = archive_path(db_path)
+    if not os.path.exists(path):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    return True
+
+
+def history_source(conn, table, columns, include_history):
+    """FROM-clause source for ``table``: hot rows, plus archived ones if asked.
+
+    ``conn`` must already have the archive attached for history to be used;
+    ``columns`` must cover everything the outer query reads.
+    """
+    if not include_history or not _is_attached(conn):
+        return f"main.{table}"
+    column_list = ", ".join(columns)
+    return (f"(SELECT {column_list} FROM main.{table} "
+            f"UNION ALL SELECT {column_list} FROM archive.{table})")
+
+
+def archive_old_rows(db_path, horizon_days=DEFAULT_HORIZON_DAYS):
+    """Move rows older than ``horizon_days`` to the archive in one transaction.
+
+    Returns ``{table: rows_moved}``.
+    """
+    cutoff = str(date.today() - timedelta(days=horizon_days))
+    conn = sqlite3.connect(db_path, timeout=30)
+    moved = {}
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(db_path),))
+        _ensure_archive_tables(conn)
+        conn.commit()
+
+        conn.execute("BEGIN IMMEDIATE")
+        revision_before = current_revision(conn)
+        for table, (condition, _) in ARCHIVE_RULES.items():
+            column_list = ", ".join(_columns(conn, "main", table))
+            conn.execute(
+                f"INSERT INTO archive.{table} ({column_list}) SELECT {column_list} FROM main.{table} WHERE {condition}",
+                (cutoff,)
+            )
+            moved[table] = conn.execute(f"DELETE FROM main.{table} WHERE {condition}", (cutoff,)).rowcount
+        # The delete triggers left tombstones; tell change-feed consumers
+        # these rows were archived rather than deleted
+        conn.execute(
+            "UPDATE change_tombstones SET archived = 1 WHERE revision > ?",
+            (revision_before,)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate(db_path, *ARCHIVE_RULES, "change_tombstones")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move cold clinical rows to the archive database.")
+    parser.add_argument("--db", default="renal_tracker.db")
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS,
+                        help="keep rows newer than this many days in the hot tables")
+    args = parser.parse_args()
+    moved = archive_old_rows(args.db, args.horizon_days)
+    for table, count in moved.items():
+        print(f"{table}: {count} row(s) archived to {archive_path(args.db)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Query results for st.dataframe, built as typed Arrow tables straight from
+# cursor batches. st.dataframe serializes an Arrow table as-is, so there is
+# no object-dtype DataFrame in between: dates become date32, TEXT lab
+# values float64 and repetitive text such as drug names is
+# dictionary-encoded.
+BATCH_ROWS = 2048
+
+TEXT = "text"
+CATEGORY = "category"
+DATE = "date"
+FLOAT = "float"
+INT = "int"
+
+
+def _strings(values):
+    try:
+        return pa.array(values, pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # A REAL or INTEGER slipped into a TEXT column
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _column(values, kind):
+    if kind == INT:
+        return pa.array(values, pa.int64())
+    strings = _strings(values)
+    if kind == DATE:
+        # Keep only the date part, so "2024-05-01 08:30:00" parses as well
+        day = pc.utf8_slice_codeunits(strings, 0, 10)
+        return pc.cast(pc.strptime(day, format="%Y-%m-%d", unit="s", error_is_null=True), pa.date32())
+    return strings
+
+
+def _to_float(strings):
+    """float64 column, or the strings unchanged if any entry is not a number.
+
+    Blank entries become nulls; a column with entries such as "<5" or
+    "hemolyzed" stays text so nothing a clinician typed is hidden.
+    """
+    trimmed = pc.utf8_trim_whitespace(strings)
+    try:
+        return pc.cast(pc.if_else(pc.equal(trimmed, ""), pa.scalar(None, pa.string()), trimmed), pa.float64())
+    except pa.ArrowInvalid:
+        return strings
+
+
+def _finish(batches, schema, columns):
+    table = pa.Table.from_batches(batches, schema=schema).combine_chunks()
+    # Whole-column conversions, so every chunk shares one type and dictionary
+    for i, (name, kind) in enumerate(columns):
+        if kind == CATEGORY:
+            table = table.set_column(i, name, table.column(i).dictionary_encode())
+        elif kind == FLOAT:
+            table = table.set_column(i, name, _to_float(table.column(i)))
+    return table
+
+
+def _schema(columns):
+    # FLOAT columns are collected as text and converted in _finish
+    types = {TEXT: pa.string(), CATEGORY: pa.string(), DATE: pa.date32(), FLOAT: pa.string(), INT: pa.int64()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _batch(rows, schema, columns):
+    if not rows:
+        return pa.RecordBatch.from_pylist([], schema=schema)
+    values = list(zip(*rows))
+    return pa.RecordBatch.from_arrays([_column(list(v), kind) for v, (_, kind) in zip(values, columns)],
+                                      schema=schema)
+
+
+def fetch_arrow(cursor, columns, batch_rows=BATCH_ROWS):
+    """Drain ``cursor`` into an Arrow table.
+
+    ``columns`` is ``[(display_name, kind), ...]`` in select-list order,
+    with kind one of TEXT, CATEGORY, DATE, FLOAT or INT.
+    """
+    schema = _schema(columns)
+    batches = []
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        batches.append(_batch(rows, schema, columns))
+    return _finish(batches, schema, columns)
+
+
+def rows_to_arrow(rows, columns):
+    """Arrow table from rows already fetched (see ``fetch_arrow``)."""
+    schema = _schema(columns)
+    return _finish([_batch(rows, schema, columns)], schema, columns)
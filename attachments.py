@@ -0,0 +1,216 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Attachment bytes live on disk under <db>_attachments/, named by their
+# SHA-256, so the same scan uploaded twice is stored once. The database
+# only records which diagnostic points at which hash. Uploads are hashed
+# and written in chunks, and downloads open the file only when clicked.
+CHUNK_SIZE = 1024 * 1024
+# Unreferenced blobs younger than this may belong to an upload whose rows
+# are still queued for the writer, so the sweep leaves them alone
+ORPHAN_GRACE_SECONDS = 6 * 60 * 60
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_WORKERS = 2
+
+_thumbnail_pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+_pending = set()
+_failed = set()
+_pending_lock = threading.Lock()
+
+
+def init_attachment_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attachment_blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mime_type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS diagnostic_attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            diagnostic_id INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            uploaded_by TEXT,
+            FOREIGN KEY (diagnostic_id) REFERENCES diagnostics(id),
+            FOREIGN KEY (sha256) REFERENCES attachment_blobs(sha256)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_diagnostic_attachments_diagnostic ON diagnostic_attachments(diagnostic_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_diagnostic_attachments_sha256 ON diagnostic_attachments(sha256)")
+
+
+def store_dir(db_path):
+    base, _ = os.path.splitext(db_path)
+    return f"{base}_attachments"
+
+
+def blob_path(db_path, sha256):
+    return os.path.join(store_dir(db_path), sha256[:2], sha256)
+
+
+def thumbnail_path(db_path, sha256):
+    return os.path.join(store_dir(db_path), "thumbs", f"{sha256}.png")
+
+
+def store_blob(db_path, stream):
+    """Copy ``stream`` into the store; returns ``(sha256, size, deduplicated)``.
+
+    The file is hashed while it is copied to a temporary file, which is then
+    either moved into place or dropped if the content is already stored.
+    Touches no database, so uploads are stored before the write is queued
+    and the writer never waits on file I/O.
+    """
+    root = store_dir(db_path)
+    os.makedirs(root, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=root, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        target = blob_path(db_path, sha256)
+        deduplicated = os.path.exists(target)
+        if deduplicated:
+            # Fresh again, so the sweep cannot take it for an orphan before
+            # this upload's rows commit
+            os.utime(target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return sha256, size, deduplicated
+
+
+def record_attachment(conn, db_path, diagnostic_id, filename, sha256, size, mime_type=None, uploaded_by=None):
+    """Point a diagnostic at a stored blob; returns the attachment id.
+
+    The rows are written on ``conn``; the caller commits.
+    """
+    mime_type = mime_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    conn.execute(
+        "INSERT OR IGNORE INTO attachment_blobs (sha256, size, mime_type) VALUES (?, ?, ?)",
+        (sha256, size, mime_type)
+    )
+    cursor = conn.execute(
+        "INSERT INTO diagnostic_attachments (diagnostic_id, sha256, filename, uploaded_by) VALUES (?, ?, ?, ?)",
+        (diagnostic_id, sha256, os.path.basename(filename), uploaded_by)
+    )
+    request_thumbnail(db_path, sha256, mime_type)
+    return cursor.lastrowid
+
+
+def sweep_orphaned_blobs(conn, db_path, grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Remove stored files no attachment row references; returns how many.
+
+    Blobs are never deleted inline: a failed save can leave one behind, but
+    another upload of the same bytes may be about to reference it. Only
+    files untouched for ``grace_seconds`` (``store_blob`` touches a blob it
+    deduplicates against) and unknown to ``attachment_blobs`` are removed,
+    along with abandoned ``.part`` files.
+    """
+    root = store_dir(db_path)
+    if not os.path.isdir(root):
+        return 0
+    referenced = {row[0] for row in conn.execute("SELECT sha256 FROM attachment_blobs")}
+    candidates = []
+    for entry in os.scandir(root):
+        if entry.is_file() and entry.name.endswith(".part"):
+            candidates.append(entry.path)
+        elif entry.is_dir() and entry.name != "thumbs":
+            candidates.extend(blob.path for blob in os.scandir(entry.path)
+                              if blob.is_file() and blob.name not in referenced)
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for path in candidates:
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def attachments_for_patient(conn, patient_id):
+    """``{diagnostic_id: [(id, filename, sha256, size, mime_type, uploaded_at, uploaded_by), ...]}``."""
+    rows = conn.execute(
+        """SELECT a.diagnostic_id, a.id, a.filename, a.sha256, b.size, b.mime_type, a.uploaded_at, a.uploaded_by
+           FROM diagnostic_attachments a
+           JOIN attachment_blobs b ON b.sha256 = a.sha256
+           WHERE a.diagnostic_id IN (SELECT id FROM diagnostics WHERE patient_id = ?)
+           ORDER BY a.diagnostic_id, a.id""",
+        (patient_id,)
+    ).fetchall()
+    grouped = {}
+    for diagnostic_id, *attachment in rows:
+        grouped.setdefault(diagnostic_id, []).append(tuple(attachment))
+    return grouped
+
+
+def open_attachment(db_path, sha256):
+    """Binary file object for a stored attachment (for deferred downloads)."""
+    return open(blob_path(db_path, sha256), "rb")
+
+
+def _make_thumbnail(source, target):
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(source) as img:
+            img.thumbnail(THUMBNAIL_SIZE)
+            tmp = target + ".tmp"
+            img.convert("RGB").save(tmp, "PNG")
+        os.replace(tmp, target)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Not a readable image after all; don't try again this process
+        with _pending_lock:
+            _failed.add(target)
+    finally:
+        with _pending_lock:
+            _pending.discard(target)
+
+
+def request_thumbnail(db_path, sha256, mime_type):
+    """Path of the cached thumbnail, or None while it is (or cannot be) made.
+
+    Thumbnails are only made for images, once per content hash, on a small
+    background pool so uploads and page reruns never wait for them.
+    """
+    if not mime_type.startswith("image/"):
+        return None
+    target = thumbnail_path(db_path, sha256)
+    if os.path.exists(target):
+        return target
+    with _pending_lock:
+        if target in _pending or target in _failed:
+            return None
+        _pending.add(target)
+    _thumbnail_pool.submit(_make_thumbnail, blob_path(db_path, sha256), target)
+    return None
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timezone
+
+# Events are written by the writer-queue operation that makes the change,
+# so they share its savepoint and the writer's group commit: an audited
+# save costs one more row in a transaction that commits anyway, never a
+# second commit, and a rolled-back save leaves no history behind.
+REDACTED_COLUMNS = {"password"}
+# Entities audited in the directory database, whichever clinic is selected
+DIRECTORY_ENTITIES = ("users", "user_sessions", "clinics")
+
+
+def init_audit_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS audit_events (
+            id INTEGER PRIMARY KEY,
+            occurred_at TEXT NOT NULL,
+            username TEXT,
+            patient_id INTEGER,
+            entity TEXT NOT NULL,
+            entity_id TEXT,
+            action TEXT NOT NULL CHECK(action IN ('INSERT', 'UPDATE', 'DELETE')),
+            before_json TEXT,
+            after_json TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_patient_time ON audit_events(patient_id, occurred_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_user_time ON audit_events(username, occurred_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_time ON audit_events(occurred_at)")
+    # Append-only: history can be added to but never rewritten
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_events_no_update
+        BEFORE UPDATE ON audit_events
+        BEGIN SELECT RAISE(ABORT, 'audit_events is append-only'); END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_events_no_delete
+        BEFORE DELETE ON audit_events
+        BEGIN SELECT RAISE(ABORT, 'audit_events is append-only'); END
+    """)
+
+
+def row_snapshot(conn, table, key_column, key):
+    """Return the row as a dict (with secrets redacted), or None."""
+    cursor = conn.execute(f"SELECT * FROM {table} WHERE {key_column} = ?", (key,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    columns = [col[0] for col in cursor.description]
+    return {
+        col: ("***" if col in REDACTED_COLUMNS and value else value)
+        for col, value in zip(columns, row)
+    }
+
+
+def audit_event(conn, username, entity, entity_id, action, before=None, after=None, patient_id=None):
+    """Append one event on ``conn``, inside the operation making the change.
+
+    Run from a writer-queue operation, the event commits (or rolls back)
+    together with the change it describes and rides the same batch commit.
+    """
+    conn.execute(
+        """INSERT INTO audit_events (
+               occurred_at, username, patient_id, entity,
+               entity_id, action, before_json, after_json
+           ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (
+            datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            username,
+            patient_id,
+            entity,
+            None if entity_id is None else str(entity_id),
+            action,
+            json.dumps(before, default=str) if before is not None else None,
+            json.dumps(after, default=str) if after is not None else None,
+        )
+    )
+
+
+def query_events(conn, patient_id=None, username=None, since=None, until=None, limit=200, entities=None):
+    """Most recent audit events matching the filters, newest first.
+
+    Every filter combination is served by one of the (patient_id,
+    occurred_at), (username, occurred_at) or (occurred_at) indexes.
+    """
+    clauses, params = [], []
+    if patient_id is not None:
+        clauses.append("patient_id = ?")
+        params.append(patient_id)
+    if username:
+        clauses.append("username = ?")
+        params.append(username)
+    if since:
+        clauses.append("occurred_at >= ?")
+        params.append(str(since))
+    if until:
+        clauses.append("occurred_at < ?")
+        params.append(str(until))
+    if entities:
+        clauses.append(f"entity IN ({', '.join('?' for _ in entities)})")
+        params.extend(entities)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.append(limit)
+    return conn.execute(
+        f"""SELECT occurred_at, username, patient_id, entity, entity_id,
+                   action, before_json, after_json
+            FROM audit_events {where}
+            ORDER BY occurred_at DESC, id DESC
+            LIMIT ?""",
+        params
+    ).fetchall()
@@ -0,0 +1,260 @@
+import hashlib
+import hmac
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ======================
+# PASSWORD HASHING
+# ======================
+# scrypt cost: 128 * r * n bytes (16 MiB) of memory per hash
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_MAXMEM = 64 * 1024 * 1024
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=SCRYPT_MAXMEM, dklen=KEY_BYTES
+    )
+
+
+def hash_password(password):
+    """Return a salted scrypt hash as ``scrypt$n$r$p$salt$digest``."""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+
+def _is_legacy_hash(stored):
+    # Unsalted SHA-256 hex digests written by earlier versions
+    return len(stored) == 64 and all(c in "0123456789abcdef" for c in stored)
+
+
+def _verify_uncached(password, stored):
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            salt, digest = bytes.fromhex(salt), bytes.fromhex(digest)
+        except ValueError:
+            return False, False
+        ok = hmac.compare_digest(_scrypt(password, salt, n, r, p), digest)
+        return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    if _is_legacy_hash(stored):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        ok = hmac.compare_digest(legacy, stored)
+        return ok, ok
+    return False, False
+
+
+# Recently verified credentials, keyed by (username, stored hash) so a
+# password change invalidates the entry. Only a keyed HMAC of the password
+# is kept, never the password itself.
+_VERIFY_CACHE_SIZE = 256
+_cache_key = os.urandom(32)
+_verified = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+_dummy_hash = None
+
+
+def _unknown_user_hash():
+    # A real scrypt hash to check against when the account does not exist,
+    # so "no such user" takes as long as "wrong password"
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(16).hex())
+    return _dummy_hash
+
+
+def _password_tag(password):
+    return hmac.new(_cache_key, password.encode(), hashlib.sha256).digest()
+
+
+def verify_password(username, password, stored):
+    """Check ``password`` against ``stored``.
+
+    Returns ``(ok, needs_rehash)``. ``needs_rehash`` is set when the stored
+    hash is a legacy SHA-256 digest or uses outdated scrypt parameters.
+    Pass ``stored=None`` for an unknown account: the password is still
+    hashed, so response time does not reveal whether the account exists.
+    """
+    if not stored:
+        _verify_uncached(password, _unknown_user_hash())
+        return False, False
+    key = (username, stored)
+    tag = _password_tag(password)
+    with _verified_lock:
+        cached = _verified.get(key)
+        if cached is not None:
+            _verified.move_to_end(key)
+    # The cached tag belongs to the known-good password for this hash. Only
+    # a match short-cuts; a wrong password pays for scrypt like any other,
+    # so a fast failure does not reveal a recently active account
+    if cached is not None and hmac.compare_digest(cached, tag):
+        return True, False
+
+    ok, needs_rehash = _verify_uncached(password, stored)
+    if ok and not needs_rehash:
+        with _verified_lock:
+            _verified[key] = tag
+            while len(_verified) > _VERIFY_CACHE_SIZE:
+                _verified.popitem(last=False)
+    return ok, needs_rehash
+
+
+# ======================
+# LOGIN RATE LIMITING
+# ======================
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+
+class RateLimiter:
+    """Token buckets keyed by an arbitrary string, bounded in number."""
+
+    def __init__(self, capacity, refill_per_second, max_keys=10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, now)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            elapsed = now - bucket.updated
+            bucket.tokens = min(self.capacity, bucket.tokens + elapsed * self.refill_per_second)
+            bucket.updated = now
+        return bucket
+
+    def retry_after(self, key, now):
+        """Seconds until ``key`` has a token available (0 if available now)."""
+        bucket = self._bucket(key, now)
+        if bucket.tokens >= 1:
+            return 0.0
+        return (1 - bucket.tokens) / self.refill_per_second
+
+    def consume(self, key, now):
+        self._bucket(key, now).tokens -= 1
+
+
+# Per account: a short burst, then one attempt every 30 seconds
+username_limiter = RateLimiter(capacity=5, refill_per_second=1 / 30)
+# Per client address: allows a shared ward PC, stops a single stuffing source
+ip_limiter = RateLimiter(capacity=20, refill_per_second=1 / 3)
+# Whole process: caps scrypt work at roughly a third of one core so a
+# distributed burst cannot starve the page reruns of logged-in users.
+# Addresses with a recent successful login skip it, so a ward PC that is
+# already in use is not locked out by someone else's attack.
+global_limiter = RateLimiter(capacity=10, refill_per_second=5)
+TRUSTED_ADDRESS_SECONDS = 12 * 60 * 60
+
+_limiter_lock = threading.Lock()
+_trusted_addresses = OrderedDict()
+
+# Client address used when the real one is unknown: Streamlit reports no
+# address for loopback peers, which is every request behind a local
+# reverse proxy that is not listed in RENAL_TRUSTED_PROXIES. Such clients
+# share one rate-limit bucket and never earn the trusted-address exemption.
+LOCAL_CLIENT = "local"
+
+
+def _parse_networks(spec):
+    networks = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+
+# Reverse proxies whose X-Forwarded-For is believed, e.g. "127.0.0.1,10.0.0.0/8"
+TRUSTED_PROXIES = _parse_networks(os.getenv("RENAL_TRUSTED_PROXIES", ""))
+
+
+def _address(text):
+    try:
+        return ipaddress.ip_address(text.strip())
+    except ValueError:
+        return None
+
+
+def _is_proxy(address, proxies):
+    return address is not None and any(address in network for network in proxies)
+
+
+def client_address(peer, forwarded_for, proxies=None):
+    """Rate-limit key for a request from ``peer`` (None for loopback).
+
+    X-Forwarded-For is only read when the peer is a trusted proxy, and then
+    from the right: the first hop that is not itself a trusted proxy is the
+    client. Entries to its left are whatever the client chose to send.
+    """
+    proxies = TRUSTED_PROXIES if proxies is None else proxies
+    address = _address(peer) if peer else ipaddress.ip_address("127.0.0.1")
+    if not _is_proxy(address, proxies):
+        return str(address) if peer and address else LOCAL_CLIENT
+    for hop in reversed((forwarded_for or "").split(",")):
+        hop_address = _address(hop)
+        if hop_address is None:
+            break
+        if not _is_proxy(hop_address, proxies):
+            return str(hop_address)
+    return str(address) if peer else LOCAL_CLIENT
+
+
+def record_login_success(client_ip):
+    if client_ip == LOCAL_CLIENT:
+        return
+    with _limiter_lock:
+        _trusted_addresses[client_ip] = time.monotonic()
+        _trusted_addresses.move_to_end(client_ip)
+        while len(_trusted_addresses) > ip_limiter.max_keys:
+            _trusted_addresses.popitem(last=False)
+
+
+def _is_trusted(client_ip, now):
+    trusted_at = _trusted_addresses.get(client_ip)
+    if trusted_at is None:
+        return False
+    if now - trusted_at > TRUSTED_ADDRESS_SECONDS:
+        del _trusted_addresses[client_ip]
+        return False
+    return True
+
+
+def login_retry_after(username, client_ip):
+    """Reserve a login attempt for ``username`` from ``client_ip``.
+
+    Returns 0 and consumes a token from every applicable bucket if the
+    attempt may proceed, otherwise the number of seconds to wait.
+    """
+    now = time.monotonic()
+    with _limiter_lock:
+        checks = [(username_limiter, username.lower()), (ip_limiter, client_ip)]
+        if not _is_trusted(client_ip, now):
+            checks.append((global_limiter, "*"))
+        wait = max(limiter.retry_after(key, now) for limiter, key in checks)
+        if wait > 0:
+            return wait
+        for limiter, key in checks:
+            limiter.consume(key, now)
+    return 0.0
@@ -0,0 +1,127 @@
+"""Patient table rendering: object-dtype DataFrames vs. typed Arrow tables.
+
+Fills an in-memory database with a long medication and lab history, then
+times the two ways of getting a query result into st.dataframe's wire
+format: fetchall() into a pandas DataFrame that Streamlit converts to
+Arrow, and arrow_results.fetch_arrow() serialized directly. Each run
+happens in a fresh process so peak memory (Python heap plus Arrow pool)
+belongs to that path alone.
+
+    python benchmarks/bench_arrow.py [--meds 20000] [--labs 50000] [--runs 5]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+from streamlit import dataframe_util  # noqa: E402
+
+from arrow_results import fetch_arrow, TEXT, CATEGORY, DATE, FLOAT  # noqa: E402
+from labs import LAB_ANALYTES  # noqa: E402
+
+TABLES = {
+    "medications": (
+        "SELECT medication_name, dosage, frequency, start_date, end_date, notes FROM medications ORDER BY start_date DESC",
+        [("Medication", CATEGORY), ("Dosage", CATEGORY), ("Frequency", CATEGORY),
+         ("Start Date", DATE), ("End Date", DATE), ("Notes", TEXT)],
+    ),
+    "lab_results": (
+        f"SELECT test_date, {', '.join(LAB_ANALYTES)} FROM lab_results ORDER BY test_date DESC",
+        [("test_date", DATE)] + [(analyte, FLOAT) for analyte in LAB_ANALYTES],
+    ),
+}
+
+
+def build_database(n_meds, n_labs, seed=3):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""CREATE TABLE medications (medication_name TEXT, dosage TEXT, frequency TEXT,
+                    start_date TEXT, end_date TEXT, notes TEXT)""")
+    conn.execute(f"CREATE TABLE lab_results (test_date TEXT, {', '.join(f'{a} TEXT' for a in LAB_ANALYTES)})")
+    start = date(2010, 1, 1)
+    drugs = [f"Medication {i}" for i in range(60)]
+    conn.executemany(
+        "INSERT INTO medications VALUES (?, ?, ?, ?, ?, ?)",
+        [(rng.choice(drugs), f"{rng.choice([250, 500, 1000])} mg", rng.choice(["OD", "BID", "TID"]),
+          str(start + timedelta(days=rng.randint(0, 5000))),
+          None if rng.random() < 0.3 else str(start + timedelta(days=rng.randint(0, 5000))),
+          "Take with meals" if rng.random() < 0.2 else None)
+         for _ in range(n_meds)]
+    )
+    conn.executemany(
+        f"INSERT INTO lab_results VALUES (?, {', '.join('?' for _ in LAB_ANALYTES)})",
+        [(str(start + timedelta(days=rng.randint(0, 5000))),
+          *(f"{rng.uniform(1, 150):.1f}" if rng.random() < 0.9 else "" for _ in LAB_ANALYTES))
+         for _ in range(n_labs)]
+    )
+    return conn
+
+
+def to_bytes_pandas(conn, table, limit=-1):
+    query, columns = TABLES[table]
+    df = pd.DataFrame(conn.execute(f"{query} LIMIT ?", (limit,)).fetchall(), columns=[name for name, _ in columns])
+    return dataframe_util.convert_anything_to_arrow_bytes(df)
+
+
+def to_bytes_arrow(conn, table, limit=-1):
+    query, columns = TABLES[table]
+    return dataframe_util.convert_arrow_table_to_arrow_bytes(fetch_arrow(conn.execute(f"{query} LIMIT ?", (limit,)), columns))
+
+
+PATHS = {"object DataFrame": to_bytes_pandas, "Arrow table": to_bytes_arrow}
+
+
+def measure(path, table, n_meds, n_labs, runs, results):
+    conn = build_database(n_meds, n_labs)
+    convert = PATHS[path]
+    # Warm up lazy imports on a few rows, so the Arrow pool's high-water
+    # mark (which never goes down) stays below the measured run
+    convert(conn, table, limit=10)
+    pool = pa.default_memory_pool()
+    arrow_before = pool.max_memory()
+    tracemalloc.start()
+    payload = convert(conn, table)
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow_peak = max(0, pool.max_memory() - arrow_before)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        convert(conn, table)
+        timings.append(time.perf_counter() - started)
+    results.put((path, table, min(timings), heap_peak, arrow_peak, len(payload)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meds", type=int, default=20000)
+    parser.add_argument("--labs", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    print(f"{args.meds} medication rows, {args.labs} lab rows; best of {args.runs}\n")
+    print(f"{'table':<13} {'path':<17} {'time ms':>9} {'py heap MiB':>12} {'arrow MiB':>10} {'payload KiB':>12}")
+    for table in TABLES:
+        for path in PATHS:
+            worker = ctx.Process(target=measure, args=(path, table, args.meds, args.labs, args.runs, results))
+            worker.start()
+            path, table, seconds, heap_peak, arrow_peak, size = results.get()
+            worker.join()
+            print(f"{table:<13} {path:<17} {seconds * 1000:>9.1f} {heap_peak / 2**20:>12.1f} "
+                  f"{arrow_peak / 2**20:>10.1f} {size / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Login throughput under a simulated credential-stuffing burst.
+
+Runs the same attack twice, once verifying every attempt and once going
+through the token-bucket limiter, and reports how many attempts reached
+the KDF, CPU usage and how long legitimate staff take to get logged in.
+
+    python benchmarks/bench_login.py [--seconds 5] [--rate 300] [--threads 8]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import auth  # noqa: E402
+
+
+def reset_state():
+    auth._verified.clear()
+    auth._trusted_addresses.clear()
+    for limiter in (auth.username_limiter, auth.ip_limiter, auth.global_limiter):
+        limiter._buckets.clear()
+
+
+def run(users, seconds, rate, threads, limited):
+    reset_state()
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"offered": 0, "verified": 0, "rejected": 0}
+    legit_latency = []
+    legit_ok = 0
+    legit_throttled = 0
+    targets = [name for name in users if name.startswith("user")]
+
+    def attacker(seed):
+        rng = random.Random(seed)
+        interval = threads / rate
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            next_at += interval
+            pause = next_at - time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
+            username = rng.choice(targets)
+            ip = f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 50)}"
+            with lock:
+                stats["offered"] += 1
+            if limited and auth.login_retry_after(username, ip):
+                with lock:
+                    stats["rejected"] += 1
+                continue
+            auth.verify_password(username, f"guess{rng.random()}", users[username])
+            with lock:
+                stats["verified"] += 1
+
+    workers = [threading.Thread(target=attacker, args=(i,)) for i in range(threads)]
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for worker in workers:
+        worker.start()
+
+    # Ward staff logging in every 200 ms, each from their own workstation,
+    # pressing Login again when told to wait
+    deadline = wall_start + seconds
+    staff = 0
+    while time.perf_counter() < deadline:
+        username, ip = f"nurse{staff}", f"192.168.1.{staff % 250 + 1}"
+        staff += 1
+        t0 = time.perf_counter()
+        while limited:
+            wait = auth.login_retry_after(username, ip)
+            if not wait:
+                break
+            legit_throttled += 1
+            time.sleep(wait)
+        ok, _ = auth.verify_password(username, "correct horse", users["nurse"])
+        if ok and limited:
+            auth.record_login_success(ip)
+        legit_ok += ok
+        legit_latency.append(time.perf_counter() - t0)
+        time.sleep(0.2)
+
+    stop.set()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    label = "with limiter" if limited else "no limiter"
+    legit_latency.sort()
+    p95 = legit_latency[int(len(legit_latency) * 0.95) - 1]
+    print(f"{label:>13}: offered {stats['offered'] / wall:8.1f}/s  "
+          f"KDF {stats['verified'] / wall:7.1f}/s  "
+          f"rejected {stats['rejected'] / wall:9.1f}/s  "
+          f"CPU {cpu / wall:5.0%}  "
+          f"staff p50 {statistics.median(legit_latency) * 1000:6.1f} ms  "
+          f"p95 {p95 * 1000:6.1f} ms  "
+          f"staff ok {legit_ok}  retries {legit_throttled}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", type=float, default=300, help="attack attempts per second")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    stored = auth.hash_password("correct horse")
+    print(f"single scrypt hash: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    users = {f"user{i}": stored for i in range(200)}
+    users["nurse"] = stored
+    print(f"attack: {args.rate:.0f} attempts/s against 200 accounts from 200 addresses")
+    run(users, args.seconds, args.rate, args.threads, limited=False)
+    run(users, args.seconds, args.rate, args.threads, limited=True)
+
+
+if __name__ == "__main__":
+    main()
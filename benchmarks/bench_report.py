@@ -0,0 +1,81 @@
+"""Patient report rendering throughput and memory.
+
+Builds a synthetic long-term patient history (about 50 pages), renders it
+repeatedly with a shared ReportTemplate and reports pages per second and
+the peak Python heap used by a single render.
+
+    python benchmarks/bench_report.py [--runs 10] [--labs 70]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+from labs import LAB_ANALYTES  # noqa: E402
+from report import ReportTemplate  # noqa: E402
+
+
+def synthetic_history(n_meds, n_labs, n_diags, seed=7):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    patient = (1, "Juan Dela Cruz", "1958-03-14", "Male", 67, "Manila", "0917", "Maria", "ESRD on hemodialysis")
+    medications = [
+        (f"Medication {i}", f"{rng.randint(1, 500)} mg", "TID", str(start + timedelta(days=30 * i)), None,
+         "Take with meals" if i % 4 == 0 else None)
+        for i in range(n_meds)
+    ]
+    labs = [
+        (str(start + timedelta(days=30 * i)),) + tuple(f"{rng.uniform(1, 150):.1f}" for _ in LAB_ANALYTES)
+        for i in range(n_labs)
+    ]
+    diagnostics = [
+        (f"Renal ultrasound {i}", str(start + timedelta(days=90 * i)),
+         "Bilateral small echogenic kidneys, no hydronephrosis. " * rng.randint(1, 4),
+         "Compare with prior" if i % 3 == 0 else None)
+        for i in range(n_diags)
+    ]
+    return {"patient": patient, "medications": medications, "labs": labs, "diagnostics": diagnostics}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--meds", type=int, default=40)
+    parser.add_argument("--labs", type=int, default=70)
+    parser.add_argument("--diags", type=int, default=40)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)  # so the template finds the logo
+    data = synthetic_history(args.meds, args.labs, args.diags)
+
+    t0 = time.perf_counter()
+    template = ReportTemplate()
+    setup = time.perf_counter() - t0
+
+    tracemalloc.start()
+    pdf = template.build(data, "Benchmark (bench)")
+    pdf_bytes = pdf.output(dest='S')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pages = pdf.page_no()
+
+    t0 = time.perf_counter()
+    for _ in range(args.runs):
+        template.render(data, "Benchmark (bench)")
+    elapsed = time.perf_counter() - t0
+
+    print(f"template setup:   {setup * 1000:.1f} ms (once per process)")
+    print(f"report size:      {pages} pages, {len(pdf_bytes) / 1024:.0f} KiB")
+    print(f"render time:      {elapsed / args.runs * 1000:.1f} ms per report")
+    print(f"throughput:       {pages * args.runs / elapsed:.0f} pages/s")
+    print(f"peak heap:        {peak / 1024 / 1024:.1f} MiB per render")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Form-save throughput with many concurrent sessions.
+
+Builds the app schema in a scratch directory, then has N sessions (threads,
+as Streamlit runs them) save lab results as fast as they can, first the
+old way -- each save on its own pooled connection with its own commit --
+and then through the single-writer queue, which group-commits whatever
+has queued up. Each save is what the lab form does: the insert, its audit
+snapshot and the alert check. Reports writes per second, p50/p95 save
+latency and, for the queue, how many saves shared each commit.
+
+    python benchmarks/bench_writes.py [--sessions 20] [--saves 50] [--patients 200]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from alerts import evaluate_lab_result  # noqa: E402
+from audit import row_snapshot  # noqa: E402
+from clinics import ConnectionPool  # noqa: E402
+from labs import LAB_ANALYTES  # noqa: E402
+from writer import get_writer  # noqa: E402
+
+APP = os.path.join(ROOT, "app.py")
+DB = "renal_tracker.db"
+
+
+def build_database(n_patients):
+    # One AppTest run creates the full schema (triggers, alert tables, ...)
+    AppTest.from_file(APP, default_timeout=120).run()
+    conn = sqlite3.connect(DB)
+    conn.executemany(
+        "INSERT INTO patients (full_name, birthday, sex, age, created_by) VALUES (?, '1960-01-01', 'Female', 65, 'admin')",
+        [(f"Patient {i}",) for i in range(n_patients)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def save_lab(conn, patient_id, rng):
+    # Same statements as add_lab_values_form
+    values = [f"{rng.uniform(1, 150):.1f}" for _ in LAB_ANALYTES]
+    cursor = conn.execute(
+        f"""INSERT INTO lab_results (patient_id, test_date, {', '.join(LAB_ANALYTES)})
+            VALUES (?, date('now'), {', '.join('?' for _ in LAB_ANALYTES)})""",
+        (patient_id, *values)
+    )
+    row_snapshot(conn, "lab_results", "id", cursor.lastrowid)
+    evaluate_lab_result(conn, cursor.lastrowid)
+    return cursor.lastrowid
+
+
+def run_sessions(n_sessions, n_saves, n_patients, save):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(n_sessions + 1)
+
+    def session(index):
+        rng = random.Random(index)
+        mine = []
+        barrier.wait()
+        for _ in range(n_saves):
+            started = time.perf_counter()
+            try:
+                save(rng.randint(1, n_patients), rng)
+            except sqlite3.Error as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(n_sessions)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, errors
+
+
+def report(label, elapsed, latencies, errors, extra=""):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    p50 = statistics.median(latencies) if latencies else 0.0
+    print(f"{label:<16} {len(latencies) / elapsed:>9.0f} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} "
+          f"{len(errors):>7}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--saves", type=int, default=50, help="saves per session")
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--dir", help="scratch directory (default: a new temporary one)")
+    args = parser.parse_args()
+
+    os.chdir(args.dir or tempfile.mkdtemp(prefix="bench_writes_"))
+    build_database(args.patients)
+    db_path = os.path.abspath(DB)
+    print(f"{args.sessions} sessions x {args.saves} lab saves on {db_path}\n")
+    print(f"{'mode':<16} {'writes/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+
+    pool = ConnectionPool(db_path, max_idle=args.sessions)
+
+    def save_direct(patient_id, rng):
+        with pool.acquire() as conn:
+            save_lab(conn, patient_id, rng)
+            conn.commit()
+
+    elapsed, latencies, errors = run_sessions(args.sessions, args.saves, args.patients, save_direct)
+    report("commit per save", elapsed, latencies, errors)
+    pool.close()
+
+    writer = get_writer(db_path)
+
+    def save_queued(patient_id, rng):
+        writer.submit(lambda conn: save_lab(conn, patient_id, rng)).result()
+
+    elapsed, latencies, errors = run_sessions(args.sessions, args.saves, args.patients, save_queued)
+    report("group commit", elapsed, latencies, errors,
+           f"({writer.operations / max(writer.batches, 1):.1f} saves per commit)")
+    if errors:
+        print("\nfirst error:", errors[0])
+
+
+if __name__ == "__main__":
+    main()
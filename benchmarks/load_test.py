@@ -0,0 +1,331 @@
+"""Concurrent-session load test of app.py through streamlit's AppTest.
+
+Builds a synthetic database in a scratch directory, then drives many
+simulated sessions in parallel through login, patient search, patient
+details, lab entry and PDF generation. Reports p50/p95/p99 rerun latency
+per page and how long SQLite statements waited on locks, and exits
+non-zero if any page's p95 exceeds its budget.
+
+AppTest keeps process-wide runtime state, so each session runs in its own
+worker process; they all share the one database file.
+
+    python benchmarks/load_test.py [--sessions 20] [--iterations 3] [--patients 2000]
+                                   [--budget generate_pdf=1500 ...]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import auth  # noqa: E402
+import clinics  # noqa: E402
+from labs import LAB_ANALYTES  # noqa: E402
+
+APP = os.path.join(ROOT, "app.py")
+PASSWORD = "load-test"
+PAGES = ("login", "patient_search", "patient_details", "add_labs", "generate_pdf")
+# p95 budgets in milliseconds for the default run; override with --budget page=ms.
+# add_labs includes the rerun back to the (unpaginated) patient list.
+DEFAULT_BUDGETS = {
+    "login": 1500,
+    "patient_search": 1500,
+    "patient_details": 1500,
+    "add_labs": 6000,
+    "generate_pdf": 2500,
+}
+BUSY_TIMEOUT = 30.0
+
+
+# ======================
+# LOCK WAIT ACCOUNTING
+# ======================
+class LockWaits:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = []
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.waits.append(seconds)
+            self.timeouts += timed_out
+
+
+lock_waits = LockWaits()
+
+
+def _with_busy_retry(call, *args):
+    # Instrumented connections have busy_timeout = 0; retrying here, with
+    # the same deadline the app's own timeout gives, makes every wait visible
+    started = None
+    delay = 0.001
+    while True:
+        try:
+            result = call(*args)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            now = time.perf_counter()
+            if started is None:
+                started = now
+            elif now - started > BUSY_TIMEOUT:
+                lock_waits.record(now - started, timed_out=True)
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+            continue
+        if started is not None:
+            lock_waits.record(time.perf_counter() - started)
+        return result
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return _with_busy_retry(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _with_busy_retry(super().executemany, sql, seq_of_parameters)
+
+
+class InstrumentedConnection(clinics.PooledConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        super().execute("PRAGMA busy_timeout = 0")
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        return _with_busy_retry(super().commit)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        return super().__exit__(exc_type, exc, tb)
+
+
+# ======================
+# SYNTHETIC DATABASE
+# ======================
+def build_database(n_patients, n_users, seed=11):
+    # One AppTest run creates the schema and the default admin
+    AppTest.from_file(APP, default_timeout=120).run()
+    rng = random.Random(seed)
+    conn = sqlite3.connect("renal_tracker.db")
+    stored = auth.hash_password(PASSWORD)
+    conn.executemany(
+        "INSERT INTO users (username, password, full_name, user_type) VALUES (?, ?, ?, 'Staff')",
+        [(f"load{i}", stored, f"Load User {i}") for i in range(n_users)]
+    )
+    surnames = ["Santos", "Reyes", "Cruz", "Bautista", "Garcia", "Mendoza", "Torres", "Flores"]
+    diagnoses = ["ESRD on hemodialysis", "CKD stage 4", "Diabetic nephropathy", "Hypertensive nephrosclerosis"]
+    conn.executemany(
+        """INSERT INTO patients (full_name, birthday, sex, age, diagnosis, created_by)
+           VALUES (?, ?, ?, ?, ?, 'admin')""",
+        [(f"Patient {i} {rng.choice(surnames)}", str(date(1940, 1, 1) + timedelta(days=rng.randint(0, 25000))),
+          rng.choice(["Male", "Female"]), rng.randint(18, 90), rng.choice(diagnoses))
+         for i in range(n_patients)]
+    )
+    start = date.today() - timedelta(days=700)
+    conn.executemany(
+        f"""INSERT INTO lab_results (patient_id, test_date, {', '.join(LAB_ANALYTES)})
+            VALUES (?, ?, {', '.join('?' for _ in LAB_ANALYTES)})""",
+        [(pid, str(start + timedelta(days=30 * k)), *(f"{rng.uniform(1, 150):.1f}" for _ in LAB_ANALYTES))
+         for pid in range(1, n_patients + 1) for k in range(20)]
+    )
+    conn.executemany(
+        """INSERT INTO medications (patient_id, medication_name, dosage, frequency, start_date, end_date)
+           VALUES (?, ?, '500 mg', 'BID', ?, ?)""",
+        [(pid, f"Medication {k}", str(start + timedelta(days=60 * k)),
+          None if k % 2 else str(start + timedelta(days=60 * k + 90)))
+         for pid in range(1, n_patients + 1) for k in range(6)]
+    )
+    conn.commit()
+    conn.close()
+
+
+# ======================
+# SCENARIO
+# ======================
+def _errors(at):
+    return [str(e.value) for e in at.exception]
+
+
+def session_worker(index, iterations, n_patients, workdir, barrier, results):
+    # All AppTest sessions share one client address and the accounts log in
+    # repeatedly, so the per-address and per-account limiters are lifted
+    auth.ip_limiter = auth.RateLimiter(capacity=10 ** 9, refill_per_second=10 ** 9)
+    auth.username_limiter = auth.RateLimiter(capacity=10 ** 9, refill_per_second=10 ** 9)
+    clinics.PooledConnection = InstrumentedConnection
+    os.chdir(workdir)
+    # Warm up imports, then start every session at the same moment
+    AppTest.from_file(APP, default_timeout=120).run()
+    barrier.wait()
+    try:
+        results.put(run_session(index, iterations, n_patients))
+    except Exception as e:
+        results.put(({page: [] for page in PAGES}, [], 0, [f"session {index} crashed: {e!r}"]))
+
+
+def run_session(index, iterations, n_patients):
+    """Run one simulated session; returns ``(timings, lock_waits, timeouts, failures)``."""
+    rng = random.Random(index)
+    timings = {page: [] for page in PAGES}
+    failures = []
+
+    def timed(page, action):
+        t0 = time.perf_counter()
+        at = action()
+        elapsed = time.perf_counter() - t0
+        timings[page].append(elapsed)
+        errors = _errors(at)
+        if errors:
+            failures.append(f"session {index} {page}: {errors[0]}")
+        return at
+
+    for _ in range(iterations):
+        at = AppTest.from_file(APP, default_timeout=120)
+        at.run()
+        at.text_input[0].input(f"load{index}")
+        at.text_input[1].input(PASSWORD)
+        timed("login", lambda: at.button[0].click().run())
+        if not at.session_state.authenticated:
+            failures.append(f"session {index} login failed: {[e.value for e in at.error]}")
+            continue
+
+        at.session_state.current_page = "Patient Management"
+        at.run()
+        search = at.text_input(key="patient_search")
+        timed("patient_search", lambda: search.input(f"Patient {rng.randint(0, n_patients - 1)} ").run())
+
+        patient_id = rng.randint(1, n_patients)
+        at.session_state.viewing_patient = patient_id
+        timed("patient_details", at.run)
+
+        at.session_state.adding_lab_for = patient_id
+        at.run()
+        for label, value in (("Hemoglobin", "10.5"), ("Potassium", "4.8"), ("Creatinine", "6.2")):
+            [t for t in at.text_input if t.label == label][0].input(value)
+        save = [b for b in at.button if b.label == "Save Lab Values"][0]
+        timed("add_labs", lambda: save.click().run())
+
+        at.session_state.generating_report_for = patient_id
+        timed("generate_pdf", at.run)
+    return timings, lock_waits.waits, lock_waits.timeouts, failures
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+
+def parse_budgets(specs):
+    budgets = dict(DEFAULT_BUDGETS)
+    for spec in specs or []:
+        page, _, ms = spec.partition("=")
+        if page not in budgets:
+            raise SystemExit(f"Unknown page in budget {spec!r}; pages are {', '.join(PAGES)}")
+        budgets[page] = float(ms)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--budget", action="append", metavar="PAGE=MS",
+                        help="p95 budget for a page in milliseconds (repeatable)")
+    args = parser.parse_args()
+    budgets = parse_budgets(args.budget)
+
+    workdir = tempfile.mkdtemp(prefix="renal_load_")
+    os.chdir(workdir)
+    context = multiprocessing.get_context("spawn")
+    t0 = time.perf_counter()
+    # AppTest replaces __main__, so the parent process never runs it itself
+    builder = context.Process(target=build_database, args=(args.patients, args.sessions))
+    builder.start()
+    builder.join()
+    if builder.exitcode:
+        raise SystemExit("building the synthetic database failed")
+    print(f"synthetic database: {args.patients} patients, {args.sessions} users "
+          f"in {workdir} ({time.perf_counter() - t0:.1f} s)")
+
+    timings = {page: [] for page in PAGES}
+    waits, timeouts, failures = [], 0, []
+    barrier = context.Barrier(args.sessions + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(target=session_worker,
+                        args=(i, args.iterations, args.patients, workdir, barrier, results))
+        for i in range(args.sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for _ in workers:
+        session_timings, session_waits, session_timeouts, session_failures = results.get()
+        for page, values in session_timings.items():
+            timings[page].extend(values)
+        waits.extend(session_waits)
+        timeouts += session_timeouts
+        failures.extend(session_failures)
+    wall = time.perf_counter() - t0
+    for worker in workers:
+        worker.join()
+
+    print(f"\n{args.sessions} sessions x {args.iterations} iterations in {wall:.1f} s")
+    print(f"{'page':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'budget':>10}")
+    over = []
+    for page in PAGES:
+        values = timings[page]
+        if not values:
+            print(f"{page:<16}{0:>6}")
+            continue
+        p50, p95, p99 = (percentile(values, pct) * 1000 for pct in (50, 95, 99))
+        flag = ""
+        if p95 > budgets[page]:
+            over.append(page)
+            flag = "  OVER"
+        print(f"{page:<16}{len(values):>6}{p50:>10.0f}{p95:>10.0f}{p99:>10.0f}{budgets[page]:>10.0f}{flag}")
+
+    if waits:
+        print(f"\nSQLite lock waits: {len(waits)} statement(s) waited, total {sum(waits):.2f} s, "
+              f"mean {statistics.mean(waits) * 1000:.1f} ms, p95 {percentile(waits, 95) * 1000:.1f} ms, "
+              f"max {max(waits) * 1000:.1f} ms, timeouts {timeouts}")
+    else:
+        print("\nSQLite lock waits: none")
+
+    for failure in failures[:10]:
+        print(f"error: {failure}")
+    if failures or over:
+        if over:
+            print(f"\nFAIL: p95 over budget for {', '.join(over)}")
+        if failures:
+            print(f"FAIL: {len(failures)} scenario error(s)")
+        sys.exit(1)
+    print("\nOK: all pages within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import pandas as pd
+
+from alerts import evaluate_lab_result
+from labs import LAB_ANALYTES, PLAUSIBLE_RANGES, lab_label
+
+# Ward-round entry: one grid row per patient, one column per analyte, all
+# checked with whole-column pandas operations and saved in one
+# executemany() inside a single transaction.
+_LOWS = pd.Series({analyte: low for analyte, (low, _) in PLAUSIBLE_RANGES.items()})
+_HIGHS = pd.Series({analyte: high for analyte, (_, high) in PLAUSIBLE_RANGES.items()})
+
+
+def empty_grid(patients):
+    """Editable grid for ``[(patient_id, full_name), ...]`` with blank analytes."""
+    grid = pd.DataFrame(patients, columns=["patient_id", "Patient"])
+    for analyte in LAB_ANALYTES:
+        grid[analyte] = pd.Series([None] * len(grid), dtype="string")
+    return grid
+
+
+def validate_lab_grid(grid):
+    """Check every analyte cell at once.
+
+    Returns ``(values, invalid, filled)``: the stripped cell text (NA for
+    blank), a boolean frame marking cells that are not numbers or fall
+    outside PLAUSIBLE_RANGES, and a boolean series marking rows with at
+    least one value.
+    """
+    values = grid[LAB_ANALYTES].astype("string").apply(lambda column: column.str.strip())
+    values = values.mask(values.eq(""))
+    numbers = values.apply(pd.to_numeric, errors="coerce").astype("float64")
+    out_of_range = numbers.lt(_LOWS[LAB_ANALYTES], axis=1) | numbers.gt(_HIGHS[LAB_ANALYTES], axis=1)
+    invalid = values.notna() & (numbers.isna() | out_of_range)
+    return values, invalid, values.notna().any(axis=1)
+
+
+def describe_errors(grid, values, invalid):
+    """One message per invalid cell, in grid order."""
+    messages = []
+    for row, analyte in invalid.stack().loc[lambda cells: cells].index:
+        low, high = PLAUSIBLE_RANGES[analyte]
+        messages.append(
+            f"{grid.at[row, 'Patient']}: {lab_label(analyte)} \"{values.at[row, analyte]}\" "
+            f"is not a number between {low:g} and {high:g}"
+        )
+    return messages
+
+
+def save_lab_grid(conn, grid, values, filled, test_date, username):
+    """Insert the filled rows in one executemany() and check them for alerts.
+
+    Runs on the caller's connection inside its transaction; returns
+    ``[(lab_result_id, patient_id, {analyte: value}), ...]`` and the alerts
+    raised as ``[(patient_id, message), ...]``.
+    """
+    rows = values[filled].astype(object).where(values[filled].notna(), None)
+    patient_ids = grid.loc[filled, "patient_id"].tolist()
+    params = [
+        (int(patient_id), str(test_date), *cells, username)
+        for patient_id, cells in zip(patient_ids, rows.itertuples(index=False, name=None))
+    ]
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM lab_results").fetchone()[0]
+    conn.executemany(
+        f"""INSERT INTO lab_results (patient_id, test_date, {', '.join(LAB_ANALYTES)}, created_at, created_by)
+            VALUES (?, ?, {', '.join('?' for _ in LAB_ANALYTES)}, CURRENT_TIMESTAMP, ?)""",
+        params
+    )
+    # One transaction, so the new ids follow the previous maximum in order
+    lab_ids = [row[0] for row in conn.execute("SELECT id FROM lab_results WHERE id > ? ORDER BY id", (last_id,))]
+    saved, raised = [], []
+    for lab_id, (patient_id, _, *cells, _) in zip(lab_ids, params):
+        raised.extend((patient_id, message) for message in evaluate_lab_result(conn, lab_id))
+        saved.append((lab_id, patient_id, {a: v for a, v in zip(LAB_ANALYTES, cells) if v is not None}))
+    return saved, raised
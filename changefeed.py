@@ -0,0 +1,171 @@
+"""Incremental change feed for downstream sync (e.g. the EMR bridge).
+
+Every insert or update on a tracked table stamps the row with the next
+value of a single database-wide revision counter; deletes leave a
+tombstone. A consumer remembers the last revision it saw and asks only
+for what changed after it:
+
+    python changefeed.py --since 1200 --table patients --table lab_results
+"""
+import argparse
+import heapq
+import json
+import sqlite3
+import sys
+
+TRACKED_TABLES = ("patients", "medications", "diagnostics", "lab_results")
+
+
+def init_changefeed_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_revisions (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL
+        )
+    """)
+    # Runs on every page load; checked first so an existing database is only read
+    if not conn.execute("SELECT 1 FROM change_revisions WHERE id = 1").fetchone():
+        conn.execute("INSERT INTO change_revisions (id, revision) VALUES (1, 0)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_tombstones (
+            revision INTEGER PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL
+        )
+    """)
+    tombstone_columns = [col[1] for col in conn.execute("PRAGMA table_info(change_tombstones)")]
+    if "archived" not in tombstone_columns:
+        conn.execute("ALTER TABLE change_tombstones ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+    for table in TRACKED_TABLES:
+        columns = [col[1] for col in conn.execute(f"PRAGMA table_info({table})")]
+        if "revision" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN revision INTEGER")
+            _backfill(conn, table)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_revision ON {table}(revision)")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_revision_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                UPDATE change_revisions SET revision = revision + 1 WHERE id = 1;
+                UPDATE {table} SET revision = (SELECT revision FROM change_revisions WHERE id = 1)
+                WHERE id = NEW.id;
+            END
+        """)
+        # The WHEN guard skips the trigger's own stamping update
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_revision_update
+            AFTER UPDATE ON {table}
+            WHEN NEW.revision IS OLD.revision
+            BEGIN
+                UPDATE change_revisions SET revision = revision + 1 WHERE id = 1;
+                UPDATE {table} SET revision = (SELECT revision FROM change_revisions WHERE id = 1)
+                WHERE id = NEW.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_revision_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                UPDATE change_revisions SET revision = revision + 1 WHERE id = 1;
+                INSERT INTO change_tombstones (revision, table_name, row_id)
+                VALUES ((SELECT revision FROM change_revisions WHERE id = 1), '{table}', OLD.id);
+            END
+        """)
+
+
+def _backfill(conn, table):
+    # Existing rows get distinct revisions above everything issued so far
+    base = current_revision(conn)
+    top = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+    if top is None:
+        return
+    conn.execute(f"UPDATE {table} SET revision = ? + id", (base,))
+    conn.execute("UPDATE change_revisions SET revision = ? WHERE id = 1", (base + top,))
+
+
+def current_revision(conn):
+    return conn.execute("SELECT revision FROM change_revisions WHERE id = 1").fetchone()[0]
+
+
+def table_revision(conn, table):
+    """Latest revision that touched ``table``; usable as a cache key."""
+    latest = conn.execute(f"SELECT MAX(revision) FROM {table}").fetchone()[0] or 0
+    deleted = conn.execute(
+        "SELECT MAX(revision) FROM change_tombstones WHERE table_name = ?", (table,)
+    ).fetchone()[0] or 0
+    return max(latest, deleted)
+
+
+def _upserts(conn, table, since, upto, batch_size):
+    while True:
+        cursor = conn.execute(
+            f"SELECT * FROM {table} WHERE revision > ? AND revision <= ? ORDER BY revision LIMIT ?",
+            (since, upto, batch_size)
+        )
+        columns = [col[0] for col in cursor.description]
+        rows = cursor.fetchall()
+        for row in rows:
+            record = dict(zip(columns, row))
+            yield record["revision"], {"table": table, "op": "upsert", "revision": record["revision"], "row": record}
+        if len(rows) < batch_size:
+            return
+        since = rows[-1][columns.index("revision")]
+
+
+def _deletes(conn, tables, since, upto, batch_size):
+    placeholders = ", ".join("?" for _ in tables)
+    while True:
+        rows = conn.execute(
+            f"""SELECT revision, table_name, row_id, archived FROM change_tombstones
+                WHERE revision > ? AND revision <= ? AND table_name IN ({placeholders})
+                ORDER BY revision LIMIT ?""",
+            (since, upto, *tables, batch_size)
+        ).fetchall()
+        for revision, table, row_id, archived in rows:
+            op = "archive" if archived else "delete"
+            yield revision, {"table": table, "op": op, "revision": revision, "row": {"id": row_id}}
+        if len(rows) < batch_size:
+            return
+        since = rows[-1][0]
+
+
+def changes_since(conn, since, tables=TRACKED_TABLES, upto=None, batch_size=500):
+    """Yield change records with ``since < revision <= upto`` in revision order.
+
+    Each record is ``{"table", "op", "revision", "row"}`` where ``op`` is
+    "upsert", "delete", or "archive" for rows moved to the archive database.
+    Rows are fetched through the revision indexes in keyset batches, so the
+    cost is proportional to the number of changes, not the table sizes.
+    """
+    if upto is None:
+        upto = current_revision(conn)
+    streams = [_upserts(conn, table, since, upto, batch_size) for table in tables]
+    streams.append(_deletes(conn, tables, since, upto, batch_size))
+    for _, record in heapq.merge(*streams, key=lambda item: item[0]):
+        yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream rows changed since a revision as JSON lines.")
+    parser.add_argument("--db", default="renal_tracker.db")
+    parser.add_argument("--since", type=int, default=0, help="last revision already synced")
+    parser.add_argument("--table", action="append", choices=TRACKED_TABLES,
+                        help="limit to these tables (repeatable; default all)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        # One read transaction so every table is read at the same point in time
+        conn.execute("BEGIN")
+        upto = current_revision(conn)
+        for record in changes_since(conn, args.since, tuple(args.table or TRACKED_TABLES), upto):
+            print(json.dumps(record, default=str))
+        conn.rollback()
+    finally:
+        conn.close()
+    # The consumer stores this and passes it as --since next time
+    print(f"revision {upto}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
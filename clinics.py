@@ -0,0 +1,218 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from audit import audit_event
+from metrics import db_acquire_seconds, db_hold_seconds
+from writer import run_write
+
+# Each dialysis unit keeps its clinical data in its own database file, so a
+# busy unit never holds the write lock another unit needs. The primary
+# database doubles as the directory: it holds users, sessions and the
+# clinic registry, plus the clinical data of the default clinic.
+DEFAULT_CLINIC = "main"
+DEFAULT_CLINIC_NAME = "Main Unit"
+POOL_MAX_IDLE = 8
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that returns to its pool when its ``with`` block ends."""
+
+    pool = None
+    acquired_at = None
+
+    def __exit__(self, exc_type, exc, tb):
+        result = super().__exit__(exc_type, exc, tb)
+        if self.pool is not None:
+            db_hold_seconds.observe(time.perf_counter() - self.acquired_at, self.pool.label)
+            self.pool.release(self)
+        return result
+
+
+class ConnectionPool:
+    """Keeps up to ``max_idle`` open connections to one database file.
+
+    Connections are handed out LIFO so the warmest page cache is reused;
+    when none are idle a new one is opened, so callers never wait.
+    """
+
+    def __init__(self, db_path, max_idle=POOL_MAX_IDLE):
+        self.db_path = db_path
+        self.label = os.path.basename(db_path)
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        started = time.perf_counter()
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            # Streamlit runs each session in its own thread; a pooled connection
+            # is only ever used by one of them at a time
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, factory=PooledConnection)
+            conn.pool = self
+        conn.acquired_at = time.perf_counter()
+        db_acquire_seconds.observe(conn.acquired_at - started, self.label)
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        # Views with history ATTACH the archive; the next borrower must get
+        # a plain connection and the archive file must not stay open
+        try:
+            for _, name, _ in conn.execute("PRAGMA database_list").fetchall():
+                if name not in ("main", "temp"):
+                    conn.execute(f"DETACH DATABASE {name}")
+        except sqlite3.Error:
+            conn.pool = None
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.pool = None
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.pool = None
+            conn.close()
+
+
+def init_clinic_registry(conn, directory_path):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS clinics (
+            code TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            db_path TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Runs on every page load; checked first so the directory is only read
+    if not conn.execute("SELECT 1 FROM clinics WHERE code = ?", (DEFAULT_CLINIC,)).fetchone():
+        conn.execute(
+            "INSERT INTO clinics (code, name, db_path) VALUES (?, ?, ?)",
+            (DEFAULT_CLINIC, DEFAULT_CLINIC_NAME, directory_path)
+        )
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(users)")]
+    if "clinic" not in columns:
+        conn.execute(f"ALTER TABLE users ADD COLUMN clinic TEXT NOT NULL DEFAULT '{DEFAULT_CLINIC}'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_clinic ON users(clinic)")
+
+
+def clinic_db_path(directory_path, code):
+    """Database file for a new clinic, next to the directory database."""
+    base, ext = os.path.splitext(directory_path)
+    return f"{base}_{code}{ext}"
+
+
+class ClinicRouter:
+    """Maps clinic codes to database files and hands out pooled connections.
+
+    The registry is read from the directory database and cached; call
+    ``reload()`` after adding a clinic.
+    """
+
+    def __init__(self, directory_path):
+        self.directory_path = directory_path
+        self._pools = {}
+        self._clinics = None
+        self._lock = threading.Lock()
+
+    def _pool(self, db_path):
+        with self._lock:
+            pool = self._pools.get(db_path)
+            if pool is None:
+                pool = self._pools[db_path] = ConnectionPool(db_path)
+            return pool
+
+    def directory(self):
+        """Pooled connection to the directory (users, sessions, clinics)."""
+        return self._pool(self.directory_path).acquire()
+
+    def clinics(self):
+        """``{code: (name, db_path)}`` for every registered clinic."""
+        if self._clinics is None:
+            with self.directory() as conn:
+                rows = conn.execute("SELECT code, name, db_path FROM clinics ORDER BY code").fetchall()
+            self._clinics = {code: (name, db_path) for code, name, db_path in rows}
+        return self._clinics
+
+    def reload(self):
+        self._clinics = None
+
+    def db_path(self, clinic):
+        entry = self.clinics().get(clinic or DEFAULT_CLINIC)
+        if entry is None:
+            raise KeyError(f"Unknown clinic: {clinic}")
+        return entry[1]
+
+    def connect(self, clinic):
+        """Pooled connection to ``clinic``'s database."""
+        return self._pool(self.db_path(clinic)).acquire()
+
+    def add_clinic(self, code, name, username=None):
+        """Register a clinic with its own database file and return the path.
+
+        The row (and its audit event, by ``username``) is written through
+        the directory's writer.
+        """
+        if not re.fullmatch(r"[a-z0-9_]+", code or ""):
+            raise ValueError("Clinic code may only contain lowercase letters, digits and underscores")
+        db_path = clinic_db_path(self.directory_path, code)
+        def insert(conn):
+            conn.execute("INSERT INTO clinics (code, name, db_path) VALUES (?, ?, ?)", (code, name, db_path))
+            audit_event(conn, username, "clinics", code, "INSERT", after={"name": name, "db_path": db_path})
+        run_write(self.directory_path, insert)
+        self.reload()
+        return db_path
+
+    def federated(self, query, params=(), connect=None):
+        """Run ``query`` on every clinic and return ``{code: rows}``.
+
+        ``connect(db_path)`` opens the connection to read from (e.g. the
+        report snapshot); by default the clinic's pool is used. A clinic
+        whose database cannot be read maps to None rather than failing the
+        whole fan-out.
+        """
+        results = {}
+        for code, (_, db_path) in self.clinics().items():
+            try:
+                if connect is None:
+                    with self._pool(db_path).acquire() as conn:
+                        results[code] = conn.execute(query, params).fetchall()
+                else:
+                    conn = connect(db_path)
+                    try:
+                        results[code] = conn.execute(query, params).fetchall()
+                    finally:
+                        conn.close()
+            except sqlite3.Error:
+                results[code] = None
+        return results
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(directory_path):
+    """Process-wide router for ``directory_path`` (survives Streamlit reruns)."""
+    with _routers_lock:
+        router = _routers.get(directory_path)
+        if router is None:
+            router = _routers[directory_path] = ClinicRouter(directory_path)
+        return router
@@ -0,0 +1,207 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from changefeed import current_revision
+
+# Cohort filters are compiled into single aggregate queries; patients are
+# never pulled into Python one by one. Results are cached per filter
+# signature and database revision, so any write invalidates them.
+AGE_BANDS = [
+    ("<18", 0, 17),
+    ("18-39", 18, 39),
+    ("40-59", 40, 59),
+    ("60-74", 60, 74),
+    ("75+", 75, 200),
+]
+LAB_FILTER_ANALYTES = ["hemoglobin", "potassium", "phosphorus", "calcium", "creatinine", "albumin"]
+LAB_FILTER_OPERATORS = {"<": "<", "<=": "<=", ">": ">", ">=": ">="}
+COHORT_CACHE_SIZE = 64
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _numeric(expr):
+    # Lab values are free TEXT; only well-formed numbers become REALs
+    return (f"CASE WHEN TRIM({expr}) GLOB '*[0-9]*' AND TRIM({expr}) NOT GLOB '*[^0-9.]*' "
+            f"THEN CAST(TRIM({expr}) AS REAL) END")
+
+
+def _age_band_case():
+    whens = " ".join(f"WHEN age BETWEEN {low} AND {high} THEN '{label}'" for label, low, high in AGE_BANDS)
+    return f"CASE {whens} ELSE 'Unknown' END"
+
+
+def build_cohort_cte(filters):
+    """Return ``(sql, params)`` for a ``WITH ... cohort AS (...)`` prefix.
+
+    ``cohort`` has one row per matching patient with their age, age band,
+    sex and latest lab values (as REAL) plus the latest lab date.
+    """
+    lab_columns = ",\n".join(
+        f"               {_numeric('l.' + analyte)} AS {analyte}" for analyte in LAB_FILTER_ANALYTES
+    )
+    clauses, params = [], []
+    if filters.get("diagnosis"):
+        clauses.append("p.diagnosis LIKE ?")
+        params.append(f"%{filters['diagnosis']}%")
+    if filters.get("sex"):
+        clauses.append(f"p.sex IN ({', '.join('?' for _ in filters['sex'])})")
+        params.extend(filters["sex"])
+    if filters.get("medication"):
+        clauses.append("""EXISTS (
+                   SELECT 1 FROM medications m
+                   WHERE m.patient_id = p.id AND m.medication_name LIKE ?
+                     AND (m.end_date IS NULL OR m.end_date >= date('now')))""")
+        params.append(f"%{filters['medication']}%")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    outer, outer_params = [], []
+    if filters.get("age_bands"):
+        outer.append(f"age_band IN ({', '.join('?' for _ in filters['age_bands'])})")
+        outer_params.extend(filters["age_bands"])
+    for analyte, op, value in filters.get("labs", []):
+        if analyte not in LAB_FILTER_ANALYTES or op not in LAB_FILTER_OPERATORS:
+            raise ValueError(f"Unsupported lab filter: {analyte} {op}")
+        outer.append(f"{analyte} {LAB_FILTER_OPERATORS[op]} ?")
+        outer_params.append(float(value))
+    outer_where = f"WHERE {' AND '.join(outer)}" if outer else ""
+
+    sql = f"""
+        WITH latest_labs AS (
+            SELECT * FROM (
+                SELECT lr.*, ROW_NUMBER() OVER (
+                    PARTITION BY lr.patient_id ORDER BY lr.test_date DESC, lr.id DESC
+                ) AS rn
+                FROM lab_results lr
+            ) WHERE rn = 1
+        ),
+        base AS (
+            SELECT p.id, p.sex,
+                   CAST((julianday('now') - julianday(p.birthday)) / 365.25 AS INTEGER) AS age,
+                   l.test_date AS lab_date,
+{lab_columns}
+            FROM patients p
+            LEFT JOIN latest_labs l ON l.patient_id = p.id
+            {where}
+        ),
+        banded AS (
+            SELECT *, {_age_band_case()} AS age_band FROM base
+        ),
+        cohort AS (
+            SELECT * FROM banded {outer_where}
+        )
+    """
+    return sql, params + outer_params
+
+
+def _summary(conn, cte, params):
+    row = conn.execute(
+        cte + """
+        SELECT COUNT(*),
+               AVG(age),
+               SUM(lab_date >= date('now', '-1 month') AND hemoglobin IS NOT NULL),
+               SUM(lab_date >= date('now', '-1 month') AND hemoglobin < 10)
+        FROM cohort""",
+        params
+    ).fetchone()
+    patients, mean_age, hb_tested, hb_low = row
+    return {
+        "patients": patients,
+        "mean_age": mean_age,
+        "hb_tested_last_month": hb_tested or 0,
+        "hb_below_10_last_month": hb_low or 0,
+        "hb_below_10_pct": (hb_low or 0) / hb_tested * 100 if hb_tested else None,
+    }
+
+
+def _age_sex(conn, cte, params):
+    counts = pd.read_sql_query(
+        cte + "SELECT age_band, COALESCE(sex, 'Unknown') AS sex, COUNT(*) AS patients FROM cohort GROUP BY 1, 2",
+        conn, params=params
+    )
+    if counts.empty:
+        return counts
+    order = [label for label, _, _ in AGE_BANDS] + ["Unknown"]
+    table = counts.pivot_table(index="age_band", columns="sex", values="patients", fill_value=0, aggfunc="sum")
+    return table.reindex([band for band in order if band in table.index])
+
+
+def _phosphorus_by_sex(conn, cte, params):
+    # Binned in SQL (0.5 mg/dL steps); only the histogram crosses into pandas
+    bins = pd.read_sql_query(
+        cte + """
+        SELECT COALESCE(sex, 'Unknown') AS sex,
+               CAST(phosphorus * 2 AS INTEGER) / 2.0 AS phosphorus_bin,
+               COUNT(*) AS patients
+        FROM cohort WHERE phosphorus IS NOT NULL
+        GROUP BY 1, 2""",
+        conn, params=params
+    )
+    if bins.empty:
+        return bins, bins
+    histogram = bins.pivot_table(index="phosphorus_bin", columns="sex", values="patients", fill_value=0, aggfunc="sum")
+    # Weighted summary statistics straight from the bins
+    weights = histogram.to_numpy()
+    centers = histogram.index.to_numpy()[:, None] + 0.25
+    totals = weights.sum(axis=0)
+    means = (weights * centers).sum(axis=0) / totals
+    cumulative = weights.cumsum(axis=0) / totals
+    medians = centers[(cumulative >= 0.5).argmax(axis=0), 0]
+    stats = pd.DataFrame({"patients": totals, "mean": means, "median": medians}, index=histogram.columns)
+    return histogram, stats
+
+
+def _medication_usage(conn, cte, params, limit=20):
+    return pd.read_sql_query(
+        cte + """
+        SELECT LOWER(TRIM(m.medication_name)) AS medication,
+               COUNT(DISTINCT m.patient_id) AS patients
+        FROM medications m JOIN cohort c ON c.id = m.patient_id
+        WHERE m.end_date IS NULL OR m.end_date >= date('now')
+        GROUP BY 1
+        ORDER BY patients DESC, medication
+        LIMIT ?""",
+        conn, params=params + [limit]
+    )
+
+
+def filter_signature(filters):
+    return json.dumps(filters, sort_keys=True, default=str)
+
+
+def run_cohort(conn, filters):
+    """Aggregate figures for the cohort described by ``filters``.
+
+    Cached by database file, filter signature, revision and day, so
+    repeated views are free until something is written or the date moves
+    on (date windows, ages and active courses are relative to SQLite's
+    'now', which is UTC).
+    """
+    # Each clinic has its own database and its own revision counter
+    db_file = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == "main")
+    key = (db_file, filter_signature(filters), current_revision(conn),
+           datetime.now(timezone.utc).date())
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    cte, params = build_cohort_cte(filters)
+    histogram, phosphorus_stats = _phosphorus_by_sex(conn, cte, params)
+    result = {
+        "summary": _summary(conn, cte, params),
+        "age_sex": _age_sex(conn, cte, params),
+        "phosphorus_histogram": histogram,
+        "phosphorus_stats": phosphorus_stats,
+        "medication_usage": _medication_usage(conn, cte, params),
+    }
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > COHORT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
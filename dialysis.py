@@ -0,0 +1,158 @@
+import math
+import sys
+from array import array
+
+# Intradialytic vitals are stored one row per session, each channel packed
+# as a little-endian float32 array (NaN = missing reading). A year of
+# thrice-weekly sessions is ~150 rows instead of ~2,400 rows per channel,
+# and list views read only the per-session summary columns.
+CHANNELS = ("sbp", "dbp", "blood_flow", "uf_volume")
+CHANNEL_LABELS = {
+    "sbp": "Systolic BP (mmHg)",
+    "dbp": "Diastolic BP (mmHg)",
+    "blood_flow": "Blood flow (mL/min)",
+    "uf_volume": "UF volume (mL)",
+}
+DEFAULT_INTERVAL_MINUTES = 15
+
+
+def init_dialysis_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dialysis_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            session_date TEXT NOT NULL,
+            start_time TEXT,
+            interval_minutes INTEGER NOT NULL DEFAULT 15,
+            n_readings INTEGER NOT NULL DEFAULT 0,
+            pre_sbp REAL,
+            post_sbp REAL,
+            min_sbp REAL,
+            mean_blood_flow REAL,
+            uf_removed REAL,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dialysis_sessions_patient_date ON dialysis_sessions(patient_id, session_date)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dialysis_vitals (
+            session_id INTEGER PRIMARY KEY,
+            sbp BLOB,
+            dbp BLOB,
+            blood_flow BLOB,
+            uf_volume BLOB,
+            FOREIGN KEY (session_id) REFERENCES dialysis_sessions(id)
+        )
+    """)
+
+
+def pack(values):
+    packed = array("f", (math.nan if v is None else float(v) for v in values))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack(blob):
+    values = array("f")
+    if blob:
+        values.frombytes(blob)
+        if sys.byteorder == "big":
+            values.byteswap()
+    return values
+
+
+def _present(values):
+    return [v for v in values if v is not None and not math.isnan(v)]
+
+
+def _summarize(readings):
+    sbp = _present(readings.get("sbp", []))
+    flow = _present(readings.get("blood_flow", []))
+    uf = _present(readings.get("uf_volume", []))
+    return {
+        "pre_sbp": sbp[0] if sbp else None,
+        "post_sbp": sbp[-1] if sbp else None,
+        "min_sbp": min(sbp) if sbp else None,
+        "mean_blood_flow": sum(flow) / len(flow) if flow else None,
+        # UF volume is charted cumulatively, so the largest reading is the total
+        "uf_removed": max(uf) if uf else None,
+    }
+
+
+def save_session(conn, patient_id, session_date, start_time, readings,
+                 interval_minutes=DEFAULT_INTERVAL_MINUTES, notes=None, created_by=None):
+    """Store one session; ``readings`` maps channel name to a list of values."""
+    n_readings = max((len(readings.get(ch, [])) for ch in CHANNELS), default=0)
+    summary = _summarize(readings)
+    cursor = conn.execute(
+        """INSERT INTO dialysis_sessions (
+               patient_id, session_date, start_time, interval_minutes, n_readings,
+               pre_sbp, post_sbp, min_sbp, mean_blood_flow, uf_removed, notes, created_by
+           ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (patient_id, str(session_date), start_time, interval_minutes, n_readings,
+         summary["pre_sbp"], summary["post_sbp"], summary["min_sbp"],
+         summary["mean_blood_flow"], summary["uf_removed"], notes, created_by)
+    )
+    session_id = cursor.lastrowid
+    blobs = []
+    for ch in CHANNELS:
+        values = list(readings.get(ch, []))
+        values += [None] * (n_readings - len(values))
+        blobs.append(pack(values))
+    conn.execute(
+        "INSERT INTO dialysis_vitals (session_id, sbp, dbp, blood_flow, uf_volume) VALUES (?, ?, ?, ?, ?)",
+        (session_id, *blobs)
+    )
+    return session_id
+
+
+def list_sessions(conn, patient_id, since, until):
+    """Session summaries in a date range; never touches the packed readings."""
+    return conn.execute(
+        """SELECT id, session_date, start_time, interval_minutes, n_readings, pre_sbp, post_sbp,
+                  min_sbp, mean_blood_flow, uf_removed, notes
+           FROM dialysis_sessions
+           WHERE patient_id = ? AND session_date BETWEEN ? AND ?
+           ORDER BY session_date DESC, id DESC""",
+        (patient_id, str(since), str(until))
+    ).fetchall()
+
+
+def load_readings(conn, session_id, channels=CHANNELS):
+    """Decode the packed readings of one session into ``{channel: array}``."""
+    channels = [ch for ch in channels if ch in CHANNELS]
+    row = conn.execute(
+        f"SELECT {', '.join(channels)} FROM dialysis_vitals WHERE session_id = ?",
+        (session_id,)
+    ).fetchone()
+    if row is None:
+        return {}
+    return {ch: unpack(blob) for ch, blob in zip(channels, row)}
+
+
+def downsample(values, max_points):
+    """Min/max bucket downsampling that keeps peaks and troughs.
+
+    Returns ``(indices, values)`` with at most ``max_points`` points,
+    skipping missing (NaN) readings.
+    """
+    points = [(i, v) for i, v in enumerate(values) if not math.isnan(v)]
+    if len(points) <= max_points:
+        return [i for i, _ in points], [v for _, v in points]
+    buckets = max(1, max_points // 2)
+    size = len(points) / buckets
+    indices, out = [], []
+    for b in range(buckets):
+        bucket = points[int(b * size):int((b + 1) * size)]
+        if not bucket:
+            continue
+        low = min(bucket, key=lambda p: p[1])
+        high = max(bucket, key=lambda p: p[1])
+        for i, v in sorted({low, high}):
+            indices.append(i)
+            out.append(v)
+    return indices, out
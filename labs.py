@@ -0,0 +1,24 @@
+# Analyte columns of lab_results, in form and report order
+LAB_ANALYTES = [
+    "rbc", "hematocrit", "hemoglobin", "wbc", "platelet_count",
+    "neutrophils", "lymphocytes", "monocytes", "basophils", "eosinophils",
+    "mcv", "mch", "mchc", "sodium", "potassium", "creatinine",
+    "calcium", "phosphorus", "urea_nitrogen", "albumin"
+]
+
+
+def lab_label(analyte):
+    return analyte.replace("_", " ").title()
+
+
+# Hard limits for bulk entry, wide enough for both conventional and SI
+# units (e.g. creatinine in mg/dL or µmol/L). They catch typos such as a
+# misplaced decimal point, not abnormal results.
+PLAUSIBLE_RANGES = {
+    "rbc": (0.5, 10), "hematocrit": (0.05, 80), "hemoglobin": (1, 250), "wbc": (0, 500),
+    "platelet_count": (0, 3000), "neutrophils": (0, 100), "lymphocytes": (0, 100),
+    "monocytes": (0, 100), "basophils": (0, 100), "eosinophils": (0, 100),
+    "mcv": (40, 160), "mch": (10, 60), "mchc": (15, 450), "sodium": (90, 200),
+    "potassium": (1, 12), "creatinine": (0.1, 3000), "calcium": (0.5, 25),
+    "phosphorus": (0.2, 25), "urea_nitrogen": (0.5, 400), "albumin": (0.5, 70),
+}
@@ -0,0 +1,179 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from attachments import sweep_orphaned_blobs
+from writer import get_writer
+
+# Keeps each clinic database healthy: integrity check, fresh planner
+# statistics, reclaimed free pages and orphaned attachment files swept
+# from its store. Runs once a day inside an off-peak
+# window (RENAL_MAINTENANCE_HOURS, local time, default "2-5") on the
+# database's writer thread, so it is serialized with every form save
+# instead of racing them for the lock. Each run is recorded in the
+# database it maintained.
+DEFAULT_WINDOW = "2-5"
+MIN_INTERVAL_SECONDS = 20 * 60 * 60
+CHECK_SECONDS = 15 * 60
+# Fall back to a full VACUUM when this share of the file is free pages
+VACUUM_FREE_RATIO = 0.2
+INTEGRITY_MAX_ERRORS = 20
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def init_maintenance_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP NOT NULL,
+            duration_seconds REAL NOT NULL,
+            page_size INTEGER,
+            pages_before INTEGER,
+            pages_after INTEGER,
+            freelist_before INTEGER,
+            freelist_after INTEGER,
+            integrity TEXT,
+            vacuum TEXT,
+            triggered_by TEXT
+        )
+    """)
+
+
+def maintenance_window():
+    """``(start_hour, end_hour)`` of the off-peak window, local time."""
+    start, end = os.getenv("RENAL_MAINTENANCE_HOURS", DEFAULT_WINDOW).split("-")
+    return int(start), int(end)
+
+
+def in_window(now=None):
+    start, end = maintenance_window()
+    hour = (now or datetime.now()).hour
+    # A window such as 22-4 wraps around midnight
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _maintain(conn, db_path, triggered_by):
+    started_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    started = time.perf_counter()
+    page_size = _pragma(conn, "page_size")
+    pages_before = _pragma(conn, "page_count")
+    freelist_before = _pragma(conn, "freelist_count")
+
+    problems = [row[0] for row in conn.execute(f"PRAGMA integrity_check({INTEGRITY_MAX_ERRORS})")]
+    integrity = "ok" if problems == ["ok"] else "\n".join(problems)
+
+    vacuum = "skipped"
+    if integrity == "ok":
+        vacuum = "none"
+        conn.execute("ANALYZE")
+        if _pragma(conn, "auto_vacuum") == 2:
+            # execute() would step it once, freeing a single page
+            conn.executescript("PRAGMA incremental_vacuum;")
+            vacuum = "incremental"
+        elif pages_before and freelist_before / pages_before >= VACUUM_FREE_RATIO:
+            # The rebuild also switches the file to incremental auto-vacuum,
+            # so later runs can reclaim pages without rewriting everything
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            vacuum = "full"
+        conn.execute("PRAGMA optimize")
+        sweep_orphaned_blobs(conn, db_path)
+
+    run = (
+        started_at, time.perf_counter() - started, page_size, pages_before, _pragma(conn, "page_count"),
+        freelist_before, _pragma(conn, "freelist_count"), integrity, vacuum, triggered_by
+    )
+    conn.execute(
+        """INSERT INTO maintenance_runs (started_at, duration_seconds, page_size, pages_before, pages_after,
+               freelist_before, freelist_after, integrity, vacuum, triggered_by)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        run
+    )
+    return run
+
+
+def run_maintenance(db_path, triggered_by="scheduler", timeout=None):
+    """Run one maintenance pass on ``db_path`` and return the recorded run.
+
+    Form saves queued meanwhile wait on the writer until it is done.
+    """
+    return get_writer(db_path).submit_exclusive(lambda conn: _maintain(conn, db_path, triggered_by)).result(timeout)
+
+
+def last_run(conn):
+    """Most recent row of ``maintenance_runs``, or None."""
+    return conn.execute(
+        """SELECT started_at, duration_seconds, page_size, pages_before, pages_after,
+                  freelist_before, freelist_after, integrity, vacuum, triggered_by
+           FROM maintenance_runs ORDER BY id DESC LIMIT 1"""
+    ).fetchone()
+
+
+def recent_runs(conn, limit=10):
+    return conn.execute(
+        """SELECT started_at, duration_seconds, pages_before, pages_after,
+                  freelist_before, freelist_after, integrity, vacuum, triggered_by
+           FROM maintenance_runs ORDER BY id DESC LIMIT ?""",
+        (limit,)
+    ).fetchall()
+
+
+def object_sizes(conn):
+    """``[(name, type, table, pages, bytes), ...]`` per table and index, largest first.
+
+    Uses the dbstat virtual table, which scans the whole file; returns None
+    when SQLite was built without it.
+    """
+    try:
+        return conn.execute(
+            """SELECT s.name, COALESCE(m.type, 'table'), COALESCE(m.tbl_name, s.name), s.pageno, s.pgsize
+               FROM dbstat AS s LEFT JOIN sqlite_schema AS m ON m.name = s.name
+               WHERE s.aggregate = TRUE
+               ORDER BY s.pgsize DESC"""
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+
+
+def _seconds_since_last_run(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        row = conn.execute(
+            "SELECT CAST(strftime('%s', 'now') - strftime('%s', MAX(started_at)) AS REAL) FROM maintenance_runs"
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0]
+
+
+def _run_scheduler(db_path, interval):
+    while True:
+        try:
+            elapsed = _seconds_since_last_run(db_path)
+            if in_window() and (elapsed is None or elapsed >= MIN_INTERVAL_SECONDS):
+                run_maintenance(db_path)
+        except sqlite3.Error:
+            # Try again at the next check; nothing was changed half-way
+            pass
+        time.sleep(interval)
+
+
+def start_maintenance_scheduler(db_path, interval=CHECK_SECONDS):
+    """Start (once per database) a background thread that runs maintenance off-peak."""
+    with _schedulers_lock:
+        if db_path in _schedulers:
+            return
+        thread = threading.Thread(
+            target=_run_scheduler, args=(db_path, interval),
+            name=f"maintenance-{os.path.basename(db_path)}", daemon=True
+        )
+        _schedulers[db_path] = thread
+        thread.start()
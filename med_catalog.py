@@ -0,0 +1,279 @@
+"""Medication dictionary: one catalog row per drug, every name it goes by.
+
+Prescriptions keep their free-text name, dosage and frequency for display,
+and carry a catalog_id plus structured dose, unit and frequency code so
+usage can be aggregated per drug. Names and synonyms are stored
+normalized in medication_terms, whose primary key doubles as the prefix
+index for autocomplete: a prefix is a single range scan.
+
+Rows entered before the catalog existed are mapped once with
+
+    python med_catalog.py [--db renal_tracker.db]
+"""
+import argparse
+import re
+import sqlite3
+
+# Canonical name -> (drug class, synonyms and brand names)
+CATALOG = {
+    "Epoetin alfa": ("ESA", ["EPO", "Epogen", "Eprex", "Procrit", "Erythropoietin"]),
+    "Epoetin beta": ("ESA", ["Recormon", "Neorecormon"]),
+    "Darbepoetin alfa": ("ESA", ["Aranesp"]),
+    "Methoxy polyethylene glycol-epoetin beta": ("ESA", ["Mircera", "CERA"]),
+    "Iron sucrose": ("Iron", ["Venofer"]),
+    "Ferric carboxymaltose": ("Iron", ["Ferinject", "Injectafer"]),
+    "Ferrous sulfate": ("Iron", ["FeSO4"]),
+    "Sevelamer carbonate": ("Phosphate binder", ["Renvela"]),
+    "Sevelamer hydrochloride": ("Phosphate binder", ["Renagel"]),
+    "Calcium carbonate": ("Phosphate binder", ["CaCO3", "Tums"]),
+    "Calcium acetate": ("Phosphate binder", ["PhosLo"]),
+    "Lanthanum carbonate": ("Phosphate binder", ["Fosrenol"]),
+    "Sucroferric oxyhydroxide": ("Phosphate binder", ["Velphoro"]),
+    "Calcitriol": ("Vitamin D", ["Rocaltrol"]),
+    "Alfacalcidol": ("Vitamin D", ["One-Alpha"]),
+    "Paricalcitol": ("Vitamin D", ["Zemplar"]),
+    "Cinacalcet": ("Calcimimetic", ["Sensipar", "Mimpara"]),
+    "Sodium bicarbonate": ("Alkali", ["NaHCO3", "Bicarb"]),
+    "Sodium polystyrene sulfonate": ("Potassium binder", ["Kayexalate", "SPS"]),
+    "Patiromer": ("Potassium binder", ["Veltassa"]),
+    "Furosemide": ("Diuretic", ["Lasix", "Frusemide"]),
+    "Spironolactone": ("Diuretic", ["Aldactone"]),
+    "Amlodipine": ("Antihypertensive", ["Norvasc"]),
+    "Losartan": ("Antihypertensive", ["Cozaar"]),
+    "Lisinopril": ("Antihypertensive", ["Zestril", "Prinivil"]),
+    "Metoprolol": ("Antihypertensive", ["Lopressor", "Betaloc"]),
+    "Carvedilol": ("Antihypertensive", ["Coreg"]),
+    "Atorvastatin": ("Statin", ["Lipitor"]),
+    "Folic acid": ("Vitamin", ["Folate"]),
+    "Heparin": ("Anticoagulant", ["Unfractionated heparin", "UFH"]),
+    "Enoxaparin": ("Anticoagulant", ["Lovenox", "Clexane"]),
+    "Metformin": ("Antidiabetic", ["Glucophage"]),
+    "Insulin glargine": ("Antidiabetic", ["Lantus", "Basaglar"]),
+    "Gabapentin": ("Neuropathic pain", ["Neurontin"]),
+    "Pregabalin": ("Neuropathic pain", ["Lyrica"]),
+    "Allopurinol": ("Gout", ["Zyloprim"]),
+    "Ciprofloxacin": ("Antibiotic", ["Cipro"]),
+    "Vancomycin": ("Antibiotic", ["Vancocin"]),
+    "Amoxicillin": ("Antibiotic", ["Amoxil"]),
+    "Nitrofurantoin": ("Antibiotic", ["Macrobid"]),
+}
+
+DOSE_UNITS = ["mg", "g", "mcg", "IU", "units", "mL", "mmol", "mEq"]
+
+# Frequency code -> label written to medications.frequency
+FREQUENCIES = {
+    "OD": "Once daily",
+    "BID": "Twice daily",
+    "TID": "Three times daily",
+    "QID": "Four times daily",
+    "QHS": "At bedtime",
+    "TIW": "Three times weekly",
+    "QW": "Once weekly",
+    "Q2W": "Every 2 weeks",
+    "Q4W": "Every 4 weeks",
+    "PRN": "As needed",
+    "WM": "With meals",
+}
+
+# Free-text frequencies seen in old rows (normalized) -> code
+FREQUENCY_ALIASES = {
+    "od": "OD", "qd": "OD", "daily": "OD", "once a day": "OD", "once daily": "OD", "1x daily": "OD",
+    "bid": "BID", "bd": "BID", "twice a day": "BID", "twice daily": "BID", "2x daily": "BID",
+    "tid": "TID", "tds": "TID", "three times a day": "TID", "three times daily": "TID", "3x daily": "TID",
+    "qid": "QID", "four times a day": "QID", "four times daily": "QID", "4x daily": "QID",
+    "qhs": "QHS", "hs": "QHS", "at bedtime": "QHS", "nightly": "QHS",
+    "tiw": "TIW", "3x weekly": "TIW", "3x a week": "TIW", "three times weekly": "TIW",
+    "three times a week": "TIW", "every dialysis": "TIW", "post dialysis": "TIW",
+    "qw": "QW", "weekly": "QW", "once weekly": "QW", "once a week": "QW",
+    "q2w": "Q2W", "every 2 weeks": "Q2W", "biweekly": "Q2W", "every other week": "Q2W",
+    "q4w": "Q4W", "every 4 weeks": "Q4W", "monthly": "Q4W", "once a month": "Q4W",
+    "prn": "PRN", "as needed": "PRN",
+    "with meals": "WM", "with each meal": "WM",
+}
+
+_UNIT_ALIASES = {unit.lower(): unit for unit in DOSE_UNITS}
+_UNIT_ALIASES.update({"u": "units", "unit": "units", "iu": "IU", "ug": "mcg", "µg": "mcg", "ml": "mL"})
+# The whole text must be an amount and a unit: "5 mg/kg" or "1000 mg/m2" is
+# not a 5 mg or 1000 mg dose, so anything left over rejects the parse
+_DOSE_PATTERN = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*([a-zµ]+)\s*$", re.IGNORECASE)
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}\b)")
+
+AUTOCOMPLETE_LIMIT = 10
+# Upper bound for a prefix range: sorts after any character a name can contain
+_PREFIX_END = "\U0010ffff"
+
+
+def normalize_name(text):
+    """Lower-case, punctuation folded to spaces, whitespace collapsed."""
+    return " ".join(re.sub(r"[^\w%+]+", " ", (text or "").lower()).split())
+
+
+def parse_dosage(text):
+    """``(amount, unit)`` from free text such as "4,000 IU" or "500mg", else None.
+
+    Weight- or area-based and rate doses ("5 mg/kg", "0.5 mcg/kg/min") and
+    text with anything after the unit are left unparsed.
+    """
+    match = _DOSE_PATTERN.match(_THOUSANDS.sub("", text or ""))
+    if not match:
+        return None
+    unit = _UNIT_ALIASES.get(match.group(2).lower())
+    if unit is None:
+        return None
+    return float(match.group(1).replace(",", ".")), unit
+
+
+def parse_frequency(text):
+    return FREQUENCY_ALIASES.get(normalize_name(text)) or (text if text in FREQUENCIES else None)
+
+
+def format_dosage(amount, unit):
+    return f"{amount:g} {unit}"
+
+
+# Distinct normalized names and synonyms, i.e. rows of a fully seeded medication_terms
+_TERM_COUNT = len({
+    normalize_name(term) for name, (_, synonyms) in CATALOG.items() for term in (name, *synonyms)
+})
+
+
+def init_medication_catalog(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medication_catalog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            drug_class TEXT
+        )
+    """)
+    # Canonical names and synonyms, normalized; the key is the prefix index
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medication_terms (
+            term TEXT PRIMARY KEY,
+            catalog_id INTEGER NOT NULL REFERENCES medication_catalog(id),
+            is_synonym INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(medications)")]
+    for column, column_type in (("catalog_id", "INTEGER"), ("dose_amount", "REAL"),
+                                ("dose_unit", "TEXT"), ("frequency_code", "TEXT")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE medications ADD COLUMN {column} {column_type}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medications_catalog ON medications(catalog_id)")
+
+    # Runs on every page load: only write (and take the write lock) when
+    # the catalog is missing drugs or names, e.g. on a new clinic database
+    names = conn.execute("SELECT COUNT(*) FROM medication_catalog").fetchone()[0]
+    terms = conn.execute("SELECT COUNT(*) FROM medication_terms").fetchone()[0]
+    if names >= len(CATALOG) and terms >= _TERM_COUNT:
+        return
+    for name, (drug_class, synonyms) in CATALOG.items():
+        conn.execute(
+            "INSERT OR IGNORE INTO medication_catalog (name, drug_class) VALUES (?, ?)",
+            (name, drug_class)
+        )
+        catalog_id = conn.execute("SELECT id FROM medication_catalog WHERE name = ?", (name,)).fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO medication_terms (term, catalog_id, is_synonym) VALUES (?, ?, ?)",
+            [(normalize_name(name), catalog_id, 0)]
+            + [(normalize_name(synonym), catalog_id, 1) for synonym in synonyms]
+        )
+
+
+SEARCH_SQL = """
+    SELECT c.id, c.name, c.drug_class,
+           CASE WHEN MIN(t.is_synonym) = 1 THEN MIN(t.term) END AS synonym
+    FROM medication_terms t JOIN medication_catalog c ON c.id = t.catalog_id
+    WHERE t.term >= ? AND t.term < ?
+    GROUP BY c.id
+    ORDER BY MIN(t.is_synonym), c.name
+    LIMIT ?
+"""
+
+
+def search_params(text, limit=AUTOCOMPLETE_LIMIT):
+    """Parameters for SEARCH_SQL: every term starting with ``text``."""
+    prefix = normalize_name(text)
+    return (prefix, prefix + _PREFIX_END, limit)
+
+
+def search_catalog(conn, text, limit=AUTOCOMPLETE_LIMIT):
+    """Catalog drugs with a name or synonym starting with ``text``.
+
+    Rows are ``(id, name, drug_class, synonym)``, canonical-name matches
+    first; ``synonym`` is the matching synonym when only a synonym matched.
+    """
+    return conn.execute(SEARCH_SQL, search_params(text, limit)).fetchall()
+
+
+def match_catalog(terms, text):
+    """Catalog id for free text, given ``{term: catalog_id}``.
+
+    Tries the whole normalized name, then ever shorter leading runs of
+    words, so "Epoetin alfa 4000 IU SC" still finds Epoetin alfa.
+    """
+    words = normalize_name(text).split()
+    for end in range(len(words), 0, -1):
+        catalog_id = terms.get(" ".join(words[:end]))
+        if catalog_id is not None:
+            return catalog_id
+    return None
+
+
+def normalize_medications(conn):
+    """Fill catalog_id and structured dosing on rows that lack them.
+
+    Returns ``(rows_checked, rows_matched)``; rows whose name matches no
+    catalog term keep catalog_id NULL and are reported by
+    ``unmatched_names``.
+    """
+    terms = dict(conn.execute("SELECT term, catalog_id FROM medication_terms"))
+    rows = conn.execute(
+        """SELECT id, medication_name, dosage, frequency FROM medications
+           WHERE catalog_id IS NULL OR dose_amount IS NULL OR frequency_code IS NULL"""
+    ).fetchall()
+    updates, matched = [], 0
+    for medication_id, name, dosage, frequency in rows:
+        catalog_id = match_catalog(terms, name)
+        dose = parse_dosage(dosage) or (None, None)
+        matched += catalog_id is not None
+        updates.append((catalog_id, *dose, parse_frequency(frequency), medication_id))
+    conn.executemany(
+        """UPDATE medications SET
+               catalog_id = COALESCE(catalog_id, ?),
+               dose_amount = COALESCE(dose_amount, ?),
+               dose_unit = COALESCE(dose_unit, ?),
+               frequency_code = COALESCE(frequency_code, ?)
+           WHERE id = ?""",
+        updates
+    )
+    return len(rows), matched
+
+
+def unmatched_names(conn, limit=20):
+    """Most common free-text names still without a catalog entry."""
+    return conn.execute(
+        """SELECT medication_name, COUNT(*) FROM medications WHERE catalog_id IS NULL
+           GROUP BY medication_name ORDER BY COUNT(*) DESC LIMIT ?""",
+        (limit,)
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map free-text medication rows to the medication catalog.")
+    parser.add_argument("--db", default="renal_tracker.db")
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        init_medication_catalog(conn)
+        checked, matched = normalize_medications(conn)
+        conn.commit()
+        leftovers = unmatched_names(conn)
+    finally:
+        conn.close()
+    print(f"{checked} row(s) checked, {matched} mapped to the catalog")
+    for name, count in leftovers:
+        print(f"  unmatched: {name!r} ({count} row(s))")
+
+
+if __name__ == "__main__":
+    main()
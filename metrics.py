@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process-wide counters and histograms, exposed in the Prometheus text
+# format on a local port (RENAL_METRICS_PORT, default 9464; "0" disables).
+# Recording is a dict lookup and an add under a lock, so it is cheap
+# enough to sit on every page rerun and every database checkout.
+DEFAULT_PORT = 9464
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts plus sum and count; cumulated on collect
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *label_values):
+        """Context manager that observes the duration of its block."""
+        return _Timer(self, label_values)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+
+class CallbackGauge:
+    """Gauge whose samples are computed at scrape time.
+
+    ``callback()`` returns ``[(label_values, value), ...]``; it can be
+    replaced at any time, e.g. when the set of databases changes.
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.callback = None
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        callback = self.callback
+        samples = callback() if callback is not None else []
+        for label_values, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+page_reruns = Counter("renal_page_reruns_total", "Script reruns that rendered a page.", ["page"])
+page_errors = Counter("renal_page_errors_total", "Page renders that raised an exception.", ["page"])
+page_seconds = Histogram("renal_page_render_seconds", "Time to render a page.", ["page"])
+db_acquire_seconds = Histogram(
+    "renal_db_connection_acquire_seconds", "Time to check a connection out of the pool.", ["db"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+)
+db_hold_seconds = Histogram(
+    "renal_db_connection_hold_seconds", "Time a pooled connection was in use (queries and commit).", ["db"]
+)
+report_seconds = Histogram("renal_report_generation_seconds", "Time to load and render a patient PDF.")
+report_failures = Counter("renal_report_failures_total", "Patient PDFs that could not be generated.")
+login_attempts = Counter("renal_login_attempts_total", "Login attempts by outcome.", ["result"])
+write_batch_size = Histogram(
+    "renal_write_batch_operations", "Form saves committed together in one writer transaction.", ["db"],
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+query_cache_lookups = Counter(
+    "renal_query_cache_lookups_total", "Cached read queries by outcome (hit, miss, stale).", ["result"]
+)
+db_size_bytes = CallbackGauge("renal_db_size_bytes", "Size of each database file on disk.", ["db"])
+
+REGISTRY = [
+    page_reruns, page_errors, page_seconds, db_acquire_seconds, db_hold_seconds,
+    report_seconds, report_failures, login_attempts, write_batch_size, query_cache_lookups,
+    db_size_bytes,
+]
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.collect())
+        except Exception:
+            # A failing gauge callback must not take the whole scrape down
+            continue
+    return "\n".join(lines) + "\n"
+
+
+def track_page(page):
+    """Decorator counting reruns, errors and render time of a page function.
+
+    st.rerun()/st.stop() raise BaseExceptions, so they are timed but not
+    counted as errors.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            page_reruns.inc(page)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                page_errors.inc(page)
+                raise
+            finally:
+                page_seconds.observe(time.perf_counter() - started, page)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread (once per process).
+
+    Returns the bound port, or None if disabled or the port is taken (for
+    instance by another app process on the same host).
+    """
+    global _server, _server_started
+    with _server_lock:
+        if not _server_started:
+            # Only the first call tries to bind, so reruns never pay for it again
+            _server_started = True
+            if port is None:
+                port = int(os.getenv("RENAL_METRICS_PORT", DEFAULT_PORT))
+            if port:
+                try:
+                    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+                except OSError:
+                    _server = None
+                else:
+                    _server.daemon_threads = True
+                    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server.server_address[1] if _server is not None else None
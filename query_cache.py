@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import query_cache_lookups
+
+# Results of repeated read queries (user list, patient search, patient
+# headers), shared by every session in the process. An entry is keyed by
+# database, SQL text and parameters and remembers the generation of each
+# table it reads; every write bumps the generations of the tables it
+# touched, so an entry is served only while none of its tables changed.
+# The writer thread finds those tables itself (see writer.py); the few
+# direct writes call ``invalidate``. Writes from other processes (the
+# archive CLI, a second app instance) are bounded by the TTL.
+MAX_ENTRIES = 512
+TTL_SECONDS = 60
+
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def _versions(self, db_path, tables):
+        return tuple(self._generations.get((db_path, table), 0) for table in tables)
+
+    def fetch(self, db_path, connect, sql, params=(), tables=()):
+        """Rows of ``sql`` from the cache, or from ``connect()`` on a miss.
+
+        ``tables`` lists every table the query reads; ``connect`` is only
+        called (and a connection checked out) on a miss.
+        """
+        db_path = os.path.abspath(db_path)
+        tables = tuple(sorted(tables))
+        key = (db_path, sql, tuple(params))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                versions, stored_at, rows = entry
+                if versions == self._versions(db_path, tables) and now - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    query_cache_lookups.inc("hit")
+                    return list(rows)
+                del self._entries[key]
+                self.stale += 1
+                query_cache_lookups.inc("stale")
+            else:
+                self.misses += 1
+                query_cache_lookups.inc("miss")
+            # Taken before the query: a write committed while it runs makes
+            # the stored entry stale rather than wrong
+            versions = self._versions(db_path, tables)
+
+        with connect() as conn:
+            rows = tuple(conn.execute(sql, params).fetchall())
+
+        with self._lock:
+            self._entries[key] = (versions, now, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return list(rows)
+
+    def invalidate(self, db_path, tables):
+        """Bump the generation of ``tables`` in ``db_path``; call after the commit."""
+        db_path = os.path.abspath(db_path)
+        with self._lock:
+            for table in tables:
+                key = (db_path, table)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else None,
+            }
+
+
+_cache = QueryCache()
+
+
+def cached_rows(db_path, connect, sql, params=(), tables=()):
+    """``fetchall()`` of ``sql`` through the process-wide cache."""
+    return _cache.fetch(db_path, connect, sql, params, tables)
+
+
+def cached_row(db_path, connect, sql, params=(), tables=()):
+    """First row of ``sql`` (or None) through the process-wide cache."""
+    rows = _cache.fetch(db_path, connect, sql, params, tables)
+    return rows[0] if rows else None
+
+
+def invalidate(db_path, *tables):
+    _cache.invalidate(db_path, tables)
+
+
+def cache_stats():
+    return _cache.stats()
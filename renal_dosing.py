@@ -0,0 +1,203 @@
+from datetime import date, datetime
+
+# Renal dose checks: a patient's eGFR from their latest creatinine, age and
+# sex, compared with the thresholds below. The thresholds are a plain dict
+# loaded with the module, so checking a prescription is a lookup and a few
+# comparisons. Latest creatinine comes from a partial index holding only
+# lab rows that have one, so it is a single index seek however many other
+# draws the patient has.
+
+# Catalog name (see med_catalog.CATALOG) -> [(below eGFR, severity,
+# max daily dose in mg or None, advice)], lowest threshold first. The
+# first threshold the patient's eGFR is under applies. Rules with a
+# maximum only warn when the prescribed daily dose is above it (or
+# unknown); rules without one always warn.
+RENAL_DOSE_RULES = {
+    "Metformin": [
+        (30, "critical", None, "contraindicated"),
+        (45, "high", 1000, "do not exceed 1000 mg/day"),
+    ],
+    "Gabapentin": [
+        (15, "high", 300, "do not exceed 300 mg/day"),
+        (30, "high", 700, "do not exceed 700 mg/day"),
+        (60, "high", 1400, "do not exceed 1400 mg/day"),
+    ],
+    "Pregabalin": [
+        (15, "high", 75, "do not exceed 75 mg/day"),
+        (30, "high", 150, "do not exceed 150 mg/day"),
+        (60, "high", 300, "do not exceed 300 mg/day"),
+    ],
+    "Enoxaparin": [
+        (30, "high", None, "give once daily (30 mg for prophylaxis, 1 mg/kg for treatment)"),
+    ],
+    "Allopurinol": [
+        (30, "high", 100, "start at no more than 100 mg/day and titrate slowly"),
+    ],
+    "Ciprofloxacin": [
+        (30, "high", 500, "do not exceed 500 mg/day"),
+    ],
+    "Amoxicillin": [
+        (10, "high", 500, "do not exceed 500 mg/day"),
+        (30, "high", 1000, "do not exceed 1000 mg/day"),
+    ],
+    "Nitrofurantoin": [
+        (30, "high", None, "avoid: ineffective and toxic at this clearance"),
+    ],
+    "Spironolactone": [
+        (30, "critical", None, "avoid: high risk of hyperkalemia"),
+    ],
+    "Vancomycin": [
+        (50, "high", None, "dose by trough levels"),
+    ],
+    "Insulin glargine": [
+        (30, "high", None, "reduce dose by about 25% and monitor glucose"),
+    ],
+}
+
+# Frequency code (see med_catalog.FREQUENCIES) -> doses per day
+DOSES_PER_DAY = {
+    "OD": 1, "BID": 2, "TID": 3, "QID": 4, "QHS": 1, "WM": 3,
+    "TIW": 3 / 7, "QW": 1 / 7, "Q2W": 1 / 14, "Q4W": 1 / 28,
+}
+MG_PER_UNIT = {"mg": 1, "g": 1000, "mcg": 0.001}
+
+# Creatinine is entered in mg/dL or µmol/L. Dialysis patients run well
+# above 20 mg/dL, but not to 40; a µmol/L result that low (0.45 mg/dL) is
+# rare, and misreading one only errs towards a warning, never hides one
+UMOL_CUTOFF = 40
+UMOL_PER_MG_DL = 88.4
+
+
+def init_renal_dosing_indexes(conn):
+    conn.execute(
+        """CREATE INDEX IF NOT EXISTS idx_lab_results_latest_creatinine
+           ON lab_results(patient_id, test_date) WHERE creatinine <> ''"""
+    )
+
+
+def _age(birthday, recorded_age):
+    if birthday:
+        try:
+            born = datetime.strptime(birthday, "%Y-%m-%d").date()
+        except ValueError:
+            born = None
+        if born:
+            today = date.today()
+            return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+    return recorded_age
+
+
+def ckd_epi_2021(creatinine_mg_dl, age, female):
+    """eGFR in mL/min/1.73m² by the race-free CKD-EPI 2021 creatinine equation."""
+    kappa, alpha = (0.7, -0.241) if female else (0.9, -0.302)
+    ratio = creatinine_mg_dl / kappa
+    egfr = 142 * min(ratio, 1) ** alpha * max(ratio, 1) ** -1.200 * 0.9938 ** age
+    return egfr * 1.012 if female else egfr
+
+
+def kidney_function(conn, patient_id):
+    """The patient's current eGFR, or None if it cannot be estimated.
+
+    Returns ``{"egfr", "creatinine", "test_date", "lab_result_id"}`` with
+    creatinine in mg/dL; needs a numeric creatinine, an age (birthday or
+    recorded age) and sex Male or Female.
+    """
+    patient = conn.execute("SELECT birthday, age, sex FROM patients WHERE id = ?", (patient_id,)).fetchone()
+    lab = conn.execute(
+        """SELECT id, test_date, creatinine FROM lab_results
+           WHERE patient_id = ? AND creatinine <> ''
+           ORDER BY test_date DESC, id DESC LIMIT 1""",
+        (patient_id,)
+    ).fetchone()
+    if not patient or not lab:
+        return None
+    birthday, recorded_age, sex = patient
+    age = _age(birthday, recorded_age)
+    try:
+        creatinine = float(str(lab[2]).strip())
+    except ValueError:
+        return None
+    if not age or sex not in ("Male", "Female") or creatinine <= 0:
+        return None
+    if creatinine > UMOL_CUTOFF:
+        creatinine /= UMOL_PER_MG_DL
+    return {
+        "egfr": ckd_epi_2021(creatinine, age, sex == "Female"),
+        "creatinine": creatinine,
+        "test_date": lab[1],
+        "lab_result_id": lab[0],
+    }
+
+
+def has_renal_rule(drug_name):
+    return drug_name in RENAL_DOSE_RULES
+
+
+def daily_dose_mg(dose_amount, dose_unit, frequency_code):
+    per_day = DOSES_PER_DAY.get(frequency_code)
+    per_unit = MG_PER_UNIT.get(dose_unit)
+    if dose_amount is None or per_day is None or per_unit is None:
+        return None
+    return dose_amount * per_unit * per_day
+
+
+def check_prescription(drug_name, egfr, dose_amount=None, dose_unit=None, frequency_code=None):
+    """``(severity, message)`` if the dose needs review at ``egfr``, else None."""
+    for below, severity, max_daily, advice in RENAL_DOSE_RULES.get(drug_name, ()):
+        if egfr >= below:
+            continue
+        daily = daily_dose_mg(dose_amount, dose_unit, frequency_code)
+        if max_daily is not None and daily is not None and daily <= max_daily:
+            return None
+        prescribed = f"; prescribed {daily:g} mg/day" if daily is not None else ""
+        return severity, f"{drug_name} at eGFR {egfr:.0f} (< {below}): {advice}{prescribed}"
+    return None
+
+
+def recheck_active_prescriptions(conn, patient_ids=None):
+    """Check active catalog prescriptions against current kidney function.
+
+    Census-wide by default, or only for ``patient_ids``. Runs on the
+    caller's connection (so alerts commit with the labs that prompted
+    them) and raises one alert per prescription, skipped while an earlier
+    one for it is still open. Returns ``[(patient_id, message), ...]``.
+    """
+    drugs = list(RENAL_DOSE_RULES)
+    patient_filter, params = "", []
+    if patient_ids is not None:
+        if not patient_ids:
+            return []
+        patient_filter = f"AND m.patient_id IN ({', '.join('?' for _ in patient_ids)})"
+        params = list(patient_ids)
+    prescriptions = conn.execute(
+        f"""SELECT m.id, m.patient_id, c.name, m.dose_amount, m.dose_unit, m.frequency_code
+            FROM medications m JOIN medication_catalog c ON c.id = m.catalog_id
+            WHERE c.name IN ({', '.join('?' for _ in drugs)})
+              AND (m.end_date IS NULL OR m.end_date >= date('now')) {patient_filter}
+            ORDER BY m.patient_id""",
+        drugs + params
+    ).fetchall()
+    open_rules = {
+        row for row in conn.execute(
+            "SELECT patient_id, rule FROM alerts WHERE status = 'open' AND rule LIKE 'renal_dose:%'"
+        )
+    }
+    raised, function = [], {}
+    for medication_id, patient_id, drug_name, dose_amount, dose_unit, frequency_code in prescriptions:
+        if patient_id not in function:
+            function[patient_id] = kidney_function(conn, patient_id)
+        kidney = function[patient_id]
+        rule = f"renal_dose:{medication_id}"
+        if kidney is None or (patient_id, rule) in open_rules:
+            continue
+        finding = check_prescription(drug_name, kidney["egfr"], dose_amount, dose_unit, frequency_code)
+        if finding is None:
+            continue
+        severity, message = finding
+        conn.execute(
+            """INSERT INTO alerts (patient_id, lab_result_id, rule, analyte, value, severity, message)
+               VALUES (?, ?, ?, 'creatinine', ?, ?, ?)""",
+            (patient_id, kidney["lab_result_id"], rule, kidney["creatinine"], severity, message)
+        )
+        raised.append((patient_id, message))
+    return raised
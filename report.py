@@ -0,0 +1,333 @@
+import os
+from datetime import datetime, date
+from html import escape
+
+from fpdf import FPDF
+
+from active_meds import get_active_medications
+from archive import history_source
+from labs import LAB_ANALYTES, lab_label
+
+LOGO_PATH = "renal_tracker_logo.png"
+# The preview shows the newest lab draws; the PDF has them all
+PREVIEW_LAB_ROWS = 20
+
+
+# ======================
+# DATA LOADING
+# ======================
+def load_report_data(conn, patient_id, include_history=False):
+    """Everything a patient report shows, or None if the patient is unknown.
+
+    Shared by the PDF renderer and the in-app preview. With
+    ``include_history`` (and the archive attached to ``conn``) archived
+    labs and diagnostics are included too.
+    """
+    patient = conn.execute(
+        """SELECT id, full_name, birthday, sex, age, address, contact_no,
+                  emergency_contact, diagnosis
+           FROM patients WHERE id = ?""",
+        (patient_id,)
+    ).fetchone()
+    if not patient:
+        return None
+    lab_columns = ["patient_id", "test_date"] + LAB_ANALYTES
+    labs = conn.execute(
+        f"""SELECT test_date, {', '.join(LAB_ANALYTES)}
+            FROM {history_source(conn, "lab_results", lab_columns, include_history)}
+            WHERE patient_id = ? ORDER BY test_date DESC""",
+        (patient_id,)
+    ).fetchall()
+    diagnostics = conn.execute(
+        f"""SELECT test_name, test_date, results, notes
+            FROM {history_source(conn, "diagnostics", ["patient_id", "test_name", "test_date", "results", "notes"], include_history)}
+            WHERE patient_id = ?
+            ORDER BY test_date DESC""",
+        (patient_id,)
+    ).fetchall()
+    return {
+        "patient": patient,
+        "medications": get_active_medications(conn, patient_id),
+        "labs": labs,
+        "diagnostics": diagnostics,
+    }
+
+
+def _age_years(birthday):
+    born = datetime.strptime(birthday, "%Y-%m-%d").date()
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def patient_info_rows(patient):
+    age = f" ({_age_years(patient[2])} years)" if patient[2] else ""
+    return [
+        ("Full Name", patient[1]),
+        ("Date of Birth", f"{patient[2]}{age}" if patient[2] else "Not specified"),
+        ("Primary Diagnosis", patient[8] or "Not specified"),
+    ]
+
+
+# ======================
+# HTML PREVIEW
+# ======================
+def _html_table(headers, rows):
+    head = "".join(f"<th style='text-align:left'>{escape(h)}</th>" for h in headers)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{escape(str(cell))}</td>" for cell in row) + "</tr>"
+        for row in rows
+    )
+    return f"<table style='width:100%'><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def report_html(data, generated_by, generated_at=None):
+    """The report for ``data`` (see load_report_data) as one HTML fragment.
+
+    Same sections and wording as the PDF, for showing in the page with
+    st.markdown; building it is string joins, so it is ready long before
+    FPDF would have laid out the first page.
+    """
+    generated_at = generated_at or datetime.now()
+    parts = [
+        "<div class='patient-card'>",
+        "<h3>Patient Monthly Medical Report</h3>",
+        f"<p style='text-align:right'><small>Generated on: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}"
+        f" by {escape(generated_by)}</small></p>",
+        "<h4>Patient Information</h4>",
+        "".join(f"<p><strong>{escape(label)}:</strong> {escape(str(value))}</p>"
+                for label, value in patient_info_rows(data["patient"])),
+        "<h4>Current Medications</h4>",
+    ]
+
+    medications = data["medications"]
+    if medications:
+        parts.append(_html_table(
+            ["Medication", "Dosage", "Frequency", "Start Date", "End Date", "Notes"],
+            [(name or "", dosage or "", frequency or "", start or "", end or "Ongoing", notes or "")
+             for name, dosage, frequency, start, end, notes in medications]
+        ))
+    else:
+        parts.append("<p>No medications recorded</p>")
+
+    parts.append("<h4>Laboratory Values</h4>")
+    labs = data["labs"]
+    if labs:
+        shown = labs[:PREVIEW_LAB_ROWS]
+        # Only analytes measured at least once in the rows shown
+        columns = [i for i in range(len(LAB_ANALYTES)) if any(lab[i + 1] for lab in shown)]
+        parts.append(_html_table(
+            ["Test Date"] + [lab_label(LAB_ANALYTES[i]) for i in columns],
+            [[lab[0]] + [lab[i + 1] or "" for i in columns] for lab in shown]
+        ))
+        if len(labs) > len(shown):
+            parts.append(f"<p><small>{len(labs) - len(shown)} earlier result(s) are in the PDF</small></p>")
+    else:
+        parts.append("<p>No laboratory results recorded</p>")
+
+    parts.append("<h4>Diagnostic Tests</h4>")
+    diagnostics = data["diagnostics"]
+    if diagnostics:
+        parts.append(_html_table(
+            ["Test Name", "Test Date", "Results", "Notes"],
+            [(test_name or "", test_date or "", results or "No results", notes or "")
+             for test_name, test_date, results, notes in diagnostics]
+        ))
+    else:
+        parts.append("<p>No diagnostic tests recorded</p>")
+    parts.append("</div>")
+    return "".join(parts)
+
+
+# ======================
+# LAYOUT
+# ======================
+class TableSpec:
+    """Column layout for a bordered table whose header repeats on every page."""
+
+    def __init__(self, columns, row_height=8, font_size=10):
+        self.headers = [header for header, _, _ in columns]
+        self.widths = [width for _, width, _ in columns]
+        self.aligns = [align for _, _, align in columns]
+        self.total_width = sum(self.widths)
+        self.row_height = row_height
+        self.font_size = font_size
+
+    def draw_header(self, pdf):
+        pdf.set_font("Arial", 'B', self.font_size)
+        for header, width in zip(self.headers, self.widths):
+            pdf.cell(width, self.row_height, header, 1, 0, 'C')
+        pdf.ln()
+
+
+class _ReportPDF(FPDF):
+    def __init__(self, footer_text):
+        super().__init__()
+        self.footer_text = footer_text
+        self.table = None
+        self.alias_nb_pages()
+
+    def header(self):
+        # add_page() restores the body font after this returns
+        if self.table is not None:
+            self.table.draw_header(self)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("Arial", 'I', 8)
+        # Centered by the cell itself; no string-width measuring needed
+        self.cell(0, 10, f"{self.footer_text} | Page {self.page_no()}/{{nb}}", 0, 0, 'C')
+
+
+class ReportTemplate:
+    """Static layout for patient reports, computed once and reused.
+
+    Column widths, the lab label column (measured from the real font
+    metrics) and the logo check are all resolved here, so rendering a
+    report is a tight loop over pre-formatted rows.
+    """
+
+    def __init__(self, logo_path=LOGO_PATH):
+        self.logo_path = logo_path if os.path.exists(logo_path) else None
+        self.medications = TableSpec([
+            ("Medication", 60, 'L'), ("Dosage", 30, 'L'), ("Frequency", 30, 'L'),
+            ("Start Date", 30, 'L'), ("End Date", 30, 'L'),
+        ])
+        self.diagnostics = TableSpec([
+            ("Test Name", 70, 'L'), ("Test Date", 30, 'L'), ("Results", 90, 'L'),
+        ])
+        self.lab_labels = {analyte: f"{lab_label(analyte)}: " for analyte in LAB_ANALYTES}
+        measure = FPDF()
+        measure.add_page()
+        measure.set_font("Arial", '', 11)
+        self.lab_label_width = max(measure.get_string_width(label) for label in self.lab_labels.values()) + 4
+
+    def build(self, data, generated_by, generated_at=None):
+        """Lay out the report for ``data`` (see load_report_data) and return the FPDF."""
+        generated_at = generated_at or datetime.now()
+        pdf = _ReportPDF(f"Generated by: {generated_by} | Renal Tracker Pro")
+        pdf.set_auto_page_break(auto=True, margin=20)
+        pdf.add_page()
+        self._title_block(pdf, generated_at)
+        self._patient_info(pdf, data["patient"])
+        self._medications(pdf, data["medications"])
+        self._labs(pdf, data["labs"])
+        self._diagnostics(pdf, data["diagnostics"])
+        return pdf
+
+    def render(self, data, generated_by, generated_at=None):
+        pdf_output = self.build(data, generated_by, generated_at).output(dest='S')
+        if isinstance(pdf_output, str):
+            return pdf_output.encode('latin1')
+        return bytes(pdf_output)
+
+    def _title_block(self, pdf, generated_at):
+        if self.logo_path:
+            pdf.image(self.logo_path, x=10, y=8, w=40)
+        pdf.set_y(40)
+        pdf.set_font("Arial", 'B', 16)
+        pdf.cell(0, 10, "Patient Monthly Medical Report", 0, 1, 'C')
+        pdf.ln(10)
+        pdf.set_font("Arial", '', 10)
+        pdf.cell(0, 5, f"Generated on: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}", 0, 1, 'R')
+        pdf.ln(10)
+
+    def _section_title(self, pdf, title):
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, title, 0, 1, 'L')
+        pdf.ln(5)
+
+    def _patient_info(self, pdf, patient):
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "Patient Information", 0, 1, 'L')
+        for label, value in patient_info_rows(patient):
+            pdf.set_font("Arial", 'B', 12)
+            pdf.cell(50, 8, label + ":", 0, 0, 'L')
+            pdf.set_font("Arial", '', 12)
+            pdf.multi_cell(0, 8, str(value), 0, 'L')
+            pdf.ln(2)
+        pdf.ln(10)
+
+    def _medications(self, pdf, medications):
+        self._section_title(pdf, "Current Medications")
+        if not medications:
+            pdf.set_font("Arial", '', 12)
+            pdf.cell(0, 8, "No medications recorded", 0, 1, 'L')
+            pdf.ln(15)
+            return
+
+        spec = self.medications
+        # Format every cell up front; the draw loop below only emits cells
+        rows = [
+            [name or "", dosage or "", frequency or "", start or "", end or "Ongoing"]
+            for name, dosage, frequency, start, end, _ in medications
+        ]
+        notes = [f"Notes: {med[5]}" if med[5] else None for med in medications]
+
+        spec.draw_header(pdf)
+        pdf.table = spec
+        pdf.set_font("Arial", '', 10)
+        for row, note in zip(rows, notes):
+            for text, width, align in zip(row, spec.widths, spec.aligns):
+                pdf.cell(width, spec.row_height, text, 1, 0, align)
+            pdf.ln()
+            if note:
+                pdf.set_font("Arial", 'I', 8)
+                pdf.cell(spec.total_width, 6, note, 0, 1, 'L')
+                pdf.set_font("Arial", '', 10)
+        pdf.table = None
+        pdf.ln(15)
+
+    def _labs(self, pdf, labs):
+        self._section_title(pdf, "Laboratory Values")
+        if not labs:
+            pdf.set_font("Arial", '', 12)
+            pdf.cell(0, 8, "No laboratory results recorded", 0, 1, 'L')
+            pdf.ln(10)
+            return
+
+        labels = [self.lab_labels[analyte] for analyte in LAB_ANALYTES]
+        width = self.lab_label_width
+        for lab in labs:
+            pdf.set_font("Arial", 'B', 12)
+            pdf.cell(0, 8, f"Test Date: {lab[0]}", 0, 1)
+            pdf.set_font("Arial", '', 11)
+            for label, value in zip(labels, lab[1:]):
+                if value:
+                    pdf.cell(width, 8, label, 0, 0)
+                    pdf.cell(0, 8, str(value), 0, 1)
+            pdf.ln(5)
+        pdf.ln(10)
+
+    def _diagnostics(self, pdf, diagnostics):
+        self._section_title(pdf, "Diagnostic Tests")
+        if not diagnostics:
+            pdf.set_font("Arial", '', 12)
+            pdf.cell(0, 8, "No diagnostic tests recorded", 0, 1, 'L')
+            return
+
+        spec = self.diagnostics
+        name_width, date_width, results_width = spec.widths
+        spec.draw_header(pdf)
+        pdf.table = spec
+        pdf.set_font("Arial", '', 10)
+        for test_name, test_date, results, notes in diagnostics:
+            pdf.cell(name_width, spec.row_height, test_name or "", 1, 0, 'L')
+            pdf.cell(date_width, spec.row_height, test_date or "", 1, 0, 'L')
+            pdf.multi_cell(results_width, spec.row_height, results or "No results", 1, 'L')
+            if notes:
+                pdf.set_font("Arial", 'I', 8)
+                pdf.cell(20, 6, "Notes:", 0, 0, 'L')
+                pdf.multi_cell(0, 6, notes, 0, 'L')
+                pdf.set_font("Arial", '', 10)
+        pdf.table = None
+
+
+_default_template = None
+
+
+def render_patient_report(data, generated_by):
+    """PDF bytes for ``data``, using a process-wide template."""
+    global _default_template
+    if _default_template is None:
+        _default_template = ReportTemplate()
+    return _default_template.render(data, generated_by)
@@ -0,0 +1,149 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Signed tokens look like "<token_id>.<expires_at>.<signature>" and live in
+# the page URL (?session=...), so a browser refresh or websocket reconnect
+# can resume without going through the login form again.
+SESSION_TTL_SECONDS = 12 * 60 * 60
+SESSION_CACHE_SIZE = 1024
+
+_secret = None
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def init_session_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS app_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            token_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at INTEGER NOT NULL,
+            revoked INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (username) REFERENCES users(username)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_username ON user_sessions(username)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions(expires_at)")
+    # Generated once per database and kept with it, unless configured
+    if not os.getenv("RENAL_TRACKER_SECRET") and not conn.execute(
+        "SELECT 1 FROM app_settings WHERE key = 'session_secret'"
+    ).fetchone():
+        conn.execute(
+            "INSERT INTO app_settings (key, value) VALUES ('session_secret', ?)",
+            (secrets.token_hex(32),)
+        )
+
+
+def _get_secret(conn):
+    global _secret
+    if _secret is None:
+        configured = os.getenv("RENAL_TRACKER_SECRET")
+        if configured:
+            _secret = configured.encode()
+        else:
+            # Created by init_session_schema
+            _secret = conn.execute(
+                "SELECT value FROM app_settings WHERE key = 'session_secret'"
+            ).fetchone()[0].encode()
+    return _secret
+
+
+def _sign(conn, token_id, expires_at):
+    message = f"{token_id}.{expires_at}".encode()
+    return hmac.new(_get_secret(conn), message, hashlib.sha256).hexdigest()
+
+
+def create_session(conn, username):
+    """Persist a new session for ``username`` and return its signed token.
+
+    Writes on ``conn`` (the directory's writer); the caller commits.
+    """
+    token_id = secrets.token_urlsafe(24)
+    expires_at = int(time.time()) + SESSION_TTL_SECONDS
+    conn.execute(
+        "INSERT INTO user_sessions (token_id, username, expires_at) VALUES (?, ?, ?)",
+        (token_id, username, expires_at)
+    )
+    # Opportunistic cleanup; cheap thanks to the expires_at index
+    conn.execute("DELETE FROM user_sessions WHERE expires_at < ?", (int(time.time()),))
+    return f"{token_id}.{expires_at}.{_sign(conn, token_id, expires_at)}"
+
+
+def validate_session(conn, token):
+    """Return ``(username, user_type, full_name)`` for a valid token, else None.
+
+    Tokens seen recently are answered from memory; otherwise the session and
+    user rows are checked once and the result cached until expiry.
+    """
+    try:
+        token_id, expires_at, signature = token.split(".")
+        expires_at = int(expires_at)
+    except (AttributeError, ValueError):
+        return None
+    now = time.time()
+    if expires_at < now:
+        return None
+    if not hmac.compare_digest(signature, _sign(conn, token_id, expires_at)):
+        return None
+
+    with _lock:
+        cached = _cache.get(token_id)
+        if cached is not None:
+            _cache.move_to_end(token_id)
+            return cached
+
+    row = conn.execute(
+        """SELECT u.username, u.user_type, u.full_name
+           FROM user_sessions s JOIN users u ON s.username = u.username
+           WHERE s.token_id = ? AND s.expires_at = ? AND s.revoked = 0
+             AND u.status = 'active'""",
+        (token_id, expires_at)
+    ).fetchone()
+    if row is None:
+        return None
+
+    user = tuple(row)
+    with _lock:
+        _cache[token_id] = user
+        while len(_cache) > SESSION_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return user
+
+
+def revoke_session(conn, token):
+    """End the session for ``token``; written on ``conn``, the caller commits."""
+    token_id = (token or "").split(".")[0]
+    conn.execute("UPDATE user_sessions SET revoked = 1 WHERE token_id = ?", (token_id,))
+    with _lock:
+        _cache.pop(token_id, None)
+
+
+def invalidate_user_sessions(conn, username, revoke=False, keep_token=None):
+    """Drop cached sessions for ``username`` (after a profile change, say).
+
+    With ``revoke=True`` the sessions are also ended server-side, e.g. when
+    the account is deleted or its password changes; ``keep_token`` spares
+    the session making the change. The revocation is written on ``conn``
+    (the directory's writer) and the caller commits.
+    """
+    keep_id = (keep_token or "").split(".")[0]
+    if revoke:
+        conn.execute(
+            "UPDATE user_sessions SET revoked = 1 WHERE username = ? AND token_id != ?",
+            (username, keep_id)
+        )
+    with _lock:
+        for token_id in [t for t, user in _cache.items() if user[0] == username and t != keep_id]:
+            del _cache[token_id]
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Reports, dashboard aggregates and exports read from a periodic copy of
+# the database so long scans never hold locks the form handlers need.
+SNAPSHOT_REFRESH_SECONDS = 5 * 60
+BACKUP_PAGES_PER_STEP = 256
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+_refresh_locks = {}
+
+
+def snapshot_path(db_path):
+    base, ext = os.path.splitext(db_path)
+    return f"{base}_snapshot{ext}"
+
+
+def refresh_snapshot(db_path):
+    """Copy ``db_path`` with the online backup API and swap it in atomically."""
+    with _schedulers_lock:
+        lock = _refresh_locks.setdefault(db_path, threading.Lock())
+    with lock:
+        target = snapshot_path(db_path)
+        tmp = target + ".tmp"
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(tmp)
+        try:
+            # Copy in small steps so writers can get in between them
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=0.005)
+        finally:
+            dst.close()
+            src.close()
+        # Readers holding the old file keep it until they close
+        os.replace(tmp, target)
+
+
+def snapshot_age(db_path):
+    """Seconds since the snapshot was taken, or None if there is none."""
+    try:
+        return max(0.0, time.time() - os.path.getmtime(snapshot_path(db_path)))
+    except OSError:
+        return None
+
+
+def get_snapshot_connection(db_path):
+    """Read-only connection to the snapshot, or to ``db_path`` if none exists yet."""
+    target = snapshot_path(db_path)
+    if not os.path.exists(target):
+        return sqlite3.connect(db_path)
+    return sqlite3.connect(f"{Path(target).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def _run_scheduler(db_path, interval):
+    while True:
+        age = snapshot_age(db_path)
+        if age is None or age >= interval:
+            try:
+                refresh_snapshot(db_path)
+            except sqlite3.Error:
+                # Try again next round; readers keep using the previous copy
+                pass
+            age = 0
+        time.sleep(max(1.0, interval - age))
+
+
+def start_snapshot_scheduler(db_path, interval=SNAPSHOT_REFRESH_SECONDS):
+    """Start (once per database) a background thread that keeps the snapshot fresh."""
+    with _schedulers_lock:
+        if db_path in _schedulers:
+            return
+        thread = threading.Thread(
+            target=_run_scheduler, args=(db_path, interval),
+            name=f"snapshot-{os.path.basename(db_path)}", daemon=True
+        )
+        _schedulers[db_path] = thread
+        thread.start()
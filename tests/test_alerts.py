@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from alerts import DEFAULT_RULES, evaluate_lab_result, init_alert_schema
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY, full_name TEXT)")
+    conn.execute("""
+        CREATE TABLE lab_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER, test_date TEXT NOT NULL,
+            hemoglobin TEXT, potassium TEXT, creatinine TEXT
+        )
+    """)
+    conn.execute("INSERT INTO patients VALUES (1, 'Test Patient')")
+    init_alert_schema(conn)
+    yield conn
+    conn.close()
+
+
+def add_lab(conn, test_date, **values):
+    columns = ["patient_id", "test_date", *values]
+    cursor = conn.execute(
+        f"INSERT INTO lab_results ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        (1, test_date, *values.values())
+    )
+    return cursor.lastrowid
+
+
+def stored_rules(conn):
+    return [row[0] for row in conn.execute("SELECT rule FROM alerts ORDER BY id")]
+
+
+def test_normal_values_raise_nothing(conn):
+    lab_id = add_lab(conn, "2024-01-01", potassium="4.5", hemoglobin="11", creatinine="5")
+    assert evaluate_lab_result(conn, lab_id, DEFAULT_RULES) == []
+    assert stored_rules(conn) == []
+
+
+def test_thresholds(conn):
+    lab_id = add_lab(conn, "2024-01-01", potassium=" 6.5 ", hemoglobin="7.2")
+    raised = evaluate_lab_result(conn, lab_id, DEFAULT_RULES)
+    assert raised == ["Hyperkalemia: potassium 6.5 (> 6)", "Low hemoglobin: 7.2 (< 8)"]
+    assert stored_rules(conn) == ["hyperkalemia", "low_hemoglobin"]
+
+
+def test_blank_and_non_numeric_values_skipped(conn):
+    lab_id = add_lab(conn, "2024-01-01", potassium="", hemoglobin="hemolysed")
+    assert evaluate_lab_result(conn, lab_id, DEFAULT_RULES) == []
+
+
+def test_rise_against_previous_draw(conn):
+    add_lab(conn, "2024-01-01", creatinine="4.0")
+    add_lab(conn, "2024-01-10", creatinine="8.0")
+    # Entered late: compared with the draw before it by date, not by entry order
+    lab_id = add_lab(conn, "2024-01-05", creatinine="5.6")
+    assert evaluate_lab_result(conn, lab_id, DEFAULT_RULES) == ["Creatinine up 40% (4 → 5.6)"]
+    row = conn.execute("SELECT value, previous_value, lab_result_id FROM alerts").fetchone()
+    assert row == (5.6, 4.0, lab_id)
+
+
+def test_rise_below_threshold_or_without_previous(conn):
+    first = add_lab(conn, "2024-01-01", creatinine="4.0")
+    assert evaluate_lab_result(conn, first, DEFAULT_RULES) == []
+    second = add_lab(conn, "2024-01-02", creatinine="5.0")
+    assert evaluate_lab_result(conn, second, DEFAULT_RULES) == []
+
+
+def test_missing_row(conn):
+    assert evaluate_lab_result(conn, 999, DEFAULT_RULES) == []
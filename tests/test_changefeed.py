@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from changefeed import TRACKED_TABLES, changes_since, current_revision, init_changefeed_schema
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    for table in TRACKED_TABLES:
+        conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, note TEXT)")
+    init_changefeed_schema(conn)
+    yield conn
+    conn.close()
+
+
+def ops(records):
+    return [(r["table"], r["op"], r["row"]["id"]) for r in records]
+
+
+def test_changes_in_revision_order(conn):
+    conn.execute("INSERT INTO patients (note) VALUES ('a')")
+    conn.execute("INSERT INTO lab_results (note) VALUES ('b')")
+    conn.execute("UPDATE patients SET note = 'c' WHERE id = 1")
+    conn.execute("INSERT INTO medications (note) VALUES ('d')")
+    conn.execute("DELETE FROM medications WHERE id = 1")
+    records = list(changes_since(conn, 0))
+    # The updated patient moves past the lab row; the deleted medication
+    # only appears as its tombstone
+    assert ops(records) == [
+        ("lab_results", "upsert", 1),
+        ("patients", "upsert", 1),
+        ("medications", "delete", 1),
+    ]
+    assert [r["revision"] for r in records] == [2, 3, 5]
+    assert records[1]["row"]["note"] == "c"
+    assert current_revision(conn) == 5
+
+
+def test_since_skips_seen_changes(conn):
+    conn.execute("INSERT INTO patients (note) VALUES ('a')")
+    seen = current_revision(conn)
+    conn.execute("INSERT INTO patients (note) VALUES ('b')")
+    assert ops(changes_since(conn, seen)) == [("patients", "upsert", 2)]
+    assert list(changes_since(conn, current_revision(conn))) == []
+
+
+def test_table_filter_and_batches(conn):
+    conn.executemany("INSERT INTO diagnostics (note) VALUES (?)", [(str(i),) for i in range(7)])
+    conn.execute("INSERT INTO patients (note) VALUES ('x')")
+    conn.execute("DELETE FROM diagnostics WHERE id = 3")
+    records = list(changes_since(conn, 0, tables=("diagnostics",), batch_size=2))
+    assert ops(records) == [("diagnostics", "upsert", i) for i in (1, 2, 4, 5, 6, 7)] + [
+        ("diagnostics", "delete", 3)
+    ]
+
+
+def test_archived_tombstone(conn):
+    conn.execute("INSERT INTO lab_results (note) VALUES ('a')")
+    conn.execute("DELETE FROM lab_results WHERE id = 1")
+    conn.execute("UPDATE change_tombstones SET archived = 1")
+    assert ops(changes_since(conn, 0)) == [("lab_results", "archive", 1)]
+
+
+def test_init_is_idempotent(conn):
+    conn.execute("INSERT INTO patients (note) VALUES ('a')")
+    init_changefeed_schema(conn)
+    assert current_revision(conn) == 1
@@ -0,0 +1,56 @@
+import pytest
+
+from med_catalog import match_catalog, parse_dosage, parse_frequency
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("500mg", (500.0, "mg")),
+    ("500 MG", (500.0, "mg")),
+    ("4,000 IU", (4000.0, "IU")),
+    ("1,5 mg", (1.5, "mg")),
+    ("0.25 mcg", (0.25, "mcg")),
+    ("2 u", (2.0, "units")),
+    ("10 ml", (10.0, "mL")),
+])
+def test_parse_dosage(text, expected):
+    assert parse_dosage(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "5 mg/kg", "1000 mg/m2", "0.5 mcg/kg/min", "500 mg twice", "two tablets", "500 furlongs", "", None,
+])
+def test_parse_dosage_rejects(text):
+    assert parse_dosage(text) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("BID", "BID"),
+    ("twice daily", "BID"),
+    ("Twice a day", "BID"),
+    ("every dialysis", "TIW"),
+    ("Q2W", "Q2W"),
+    ("once a month", "Q4W"),
+])
+def test_parse_frequency(text, expected):
+    assert parse_frequency(text) == expected
+
+
+def test_parse_frequency_unknown():
+    assert parse_frequency("whenever") is None
+
+
+TERMS = {"epoetin alfa": 1, "epoetin": 2, "metformin": 3}
+
+
+def test_match_catalog_whole_name():
+    assert match_catalog(TERMS, "Metformin") == 3
+
+
+def test_match_catalog_longest_leading_run():
+    assert match_catalog(TERMS, "Epoetin alfa 4000 IU SC") == 1
+    assert match_catalog(TERMS, "Epoetin beta") == 2
+
+
+def test_match_catalog_no_match():
+    assert match_catalog(TERMS, "Alfa epoetin") is None
+    assert match_catalog(TERMS, "") is None
@@ -0,0 +1,73 @@
+import pytest
+
+from renal_dosing import check_prescription, ckd_epi_2021, daily_dose_mg
+
+
+def test_ckd_epi_2021_male():
+    # 60-year-old man, creatinine 1.0 mg/dL: published value 86
+    assert ckd_epi_2021(1.0, 60, female=False) == pytest.approx(86.2, abs=0.1)
+
+
+def test_ckd_epi_2021_female_below_kappa():
+    # Below kappa only the alpha term applies, plus the female factor
+    expected = 142 * (0.6 / 0.7) ** -0.241 * 0.9938 ** 50 * 1.012
+    assert ckd_epi_2021(0.6, 50, female=True) == pytest.approx(expected)
+
+
+def test_ckd_epi_2021_falls_with_creatinine_and_age():
+    assert ckd_epi_2021(3.0, 60, False) < ckd_epi_2021(1.5, 60, False)
+    assert ckd_epi_2021(1.5, 80, False) < ckd_epi_2021(1.5, 40, False)
+
+
+@pytest.mark.parametrize("amount, unit, freq, expected", [
+    (500, "mg", "BID", 1000),
+    (1, "g", "TID", 3000),
+    (100, "mcg", "OD", 0.1),
+    (700, "mg", "QW", 100),
+])
+def test_daily_dose_mg(amount, unit, freq, expected):
+    assert daily_dose_mg(amount, unit, freq) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("amount, unit, freq", [
+    (None, "mg", "OD"),
+    (4000, "IU", "TIW"),
+    (500, "mg", "PRN"),
+    (500, "mg", None),
+])
+def test_daily_dose_mg_unknown(amount, unit, freq):
+    assert daily_dose_mg(amount, unit, freq) is None
+
+
+def test_check_prescription_no_rule_or_adequate_egfr():
+    assert check_prescription("Paracetamol", 10) is None
+    assert check_prescription("Metformin", 60, 1000, "mg", "BID") is None
+
+
+def test_check_prescription_contraindicated_regardless_of_dose():
+    severity, message = check_prescription("Metformin", 25, 250, "mg", "OD")
+    assert severity == "critical"
+    assert "contraindicated" in message
+    assert "eGFR 25 (< 30)" in message
+
+
+def test_check_prescription_dose_within_maximum():
+    assert check_prescription("Metformin", 40, 500, "mg", "BID") is None
+
+
+def test_check_prescription_dose_above_maximum():
+    severity, message = check_prescription("Metformin", 40, 1000, "mg", "BID")
+    assert severity == "high"
+    assert message.endswith("prescribed 2000 mg/day")
+
+
+def test_check_prescription_unknown_dose_warns():
+    severity, message = check_prescription("Gabapentin", 20)
+    assert severity == "high"
+    assert "700 mg/day" in message
+    assert "prescribed" not in message
+
+
+def test_check_prescription_uses_lowest_matching_threshold():
+    _, message = check_prescription("Gabapentin", 10, 400, "mg", "OD")
+    assert "(< 15)" in message
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+import sessions
+from sessions import create_session, init_session_schema, revoke_session, validate_session
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    monkeypatch.delenv("RENAL_TRACKER_SECRET", raising=False)
+    monkeypatch.setattr(sessions, "_secret", None)
+    sessions._cache.clear()
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE users (
+            username TEXT PRIMARY KEY, user_type TEXT, full_name TEXT, status TEXT
+        )
+    """)
+    conn.execute("INSERT INTO users VALUES ('nurse', 'Nurse', 'Nina Nurse', 'active')")
+    init_session_schema(conn)
+    yield conn
+    sessions._cache.clear()
+    conn.close()
+
+
+def test_valid_token(conn):
+    token = create_session(conn, "nurse")
+    assert validate_session(conn, token) == ("nurse", "Nurse", "Nina Nurse")
+
+
+@pytest.mark.parametrize("token", [None, "", "garbage", "a.b.c", "a.1.c.d"])
+def test_malformed_token(conn, token):
+    assert validate_session(conn, token) is None
+
+
+def test_tampered_token(conn):
+    token_id, expires_at, signature = create_session(conn, "nurse").split(".")
+    assert validate_session(conn, f"{token_id}.{int(expires_at) + 60}.{signature}") is None
+    assert validate_session(conn, f"{token_id}.{expires_at}.{'0' * len(signature)}") is None
+
+
+def test_expired_token(conn, monkeypatch):
+    token = create_session(conn, "nurse")
+    monkeypatch.setattr(sessions.time, "time", lambda: 10 ** 12)
+    assert validate_session(conn, token) is None
+
+
+def test_revoked_token(conn):
+    token = create_session(conn, "nurse")
+    assert validate_session(conn, token) is not None
+    revoke_session(conn, token)
+    assert validate_session(conn, token) is None
+
+
+def test_inactive_user(conn):
+    token = create_session(conn, "nurse")
+    conn.execute("UPDATE users SET status = 'inactive'")
+    assert validate_session(conn, token) is None
+
+
+def test_secret_seeded_once(conn):
+    init_session_schema(conn)
+    assert conn.execute("SELECT COUNT(*) FROM app_settings WHERE key = 'session_secret'").fetchone()[0] == 1
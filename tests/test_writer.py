@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+
+import pytest
+
+from writer import WriteQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "writer.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def names(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT name FROM items ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def insert(name):
+    return lambda conn: conn.execute("INSERT INTO items (name) VALUES (?)", (name,)).lastrowid
+
+
+def test_failed_operation_rolls_back_only_itself(db_path):
+    writer = WriteQueue(db_path)
+    started, release = threading.Event(), threading.Event()
+
+    def hold(conn):
+        started.set()
+        release.wait(5)
+
+    # Holds the writer so everything below is queued into the next batch
+    blocker = writer.submit(hold)
+    started.wait(5)
+
+    def partial_then_fail(conn):
+        conn.execute("INSERT INTO items (name) VALUES ('partial')")
+        conn.execute("INSERT INTO items (name) VALUES ('first')")
+
+    first = writer.submit(insert("first"))
+    failing = writer.submit(partial_then_fail)
+    last = writer.submit(insert("last"))
+    release.set()
+
+    blocker.result(5)
+    assert first.result(5) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        failing.result(5)
+    assert last.result(5) is not None
+    assert names(db_path) == ["first", "last"]
+    # The blocker's batch, then one for the rest with the failure left out
+    assert writer.batches == 2
+    assert writer.operations == 3
+
+
+def test_commit_inside_operation_is_deferred(db_path):
+    writer = WriteQueue(db_path)
+
+    def commit_then_fail(conn):
+        conn.execute("INSERT INTO items (name) VALUES ('committed?')")
+        conn.commit()
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        writer.submit(commit_then_fail).result(5)
+    writer.drain(5)
+    assert names(db_path) == []
+
+
+def test_exclusive_operation_runs_outside_transaction(db_path):
+    writer = WriteQueue(db_path)
+    writer.submit(insert("a")).result(5)
+    assert writer.submit_exclusive(lambda conn: conn.in_transaction).result(5) is False
+    writer.submit_exclusive(lambda conn: conn.execute("VACUUM")).result(5)
+    assert names(db_path) == ["a"]
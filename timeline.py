@@ -0,0 +1,91 @@
+import heapq
+from datetime import date
+from itertools import islice
+
+from labs import LAB_ANALYTES, lab_label
+
+# A patient's history as one stream, newest first: medication starts and
+# stops, diagnostics and lab draws. Each kind of event is read from its own
+# (patient_id, date) index in small keyset batches and the streams are
+# merged lazily with a heap, so a page costs about the same for a patient
+# with ten years of history as for one admitted last week.
+PAGE_SIZE = 25
+
+# Events sort by (date, stream rank, id), newest first; the rank breaks
+# ties between streams on the same day
+STREAMS = {
+    # rank: (table, date column, select list, extra condition)
+    0: ("lab_results", "test_date", ", ".join(LAB_ANALYTES), ""),
+    1: ("diagnostics", "test_date", "test_name, results", ""),
+    2: ("medications", "end_date", "medication_name, dosage, frequency", "AND end_date IS NOT NULL"),
+    3: ("medications", "start_date", "medication_name, dosage, frequency", ""),
+}
+LAB_HIGHLIGHTS = 6
+
+
+def init_timeline_indexes(conn):
+    # lab_results(patient_id, test_date) and medications(patient_id, end_date)
+    # come with the alert and active-medication indexes
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medications_patient_start ON medications(patient_id, start_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_diagnostics_patient_date ON diagnostics(patient_id, test_date)")
+
+
+def _describe(rank, event_date, values):
+    if rank == 0:
+        readings = [f"{lab_label(a)} {v}" for a, v in zip(LAB_ANALYTES, values) if v not in (None, "")]
+        more = f" (+{len(readings) - LAB_HIGHLIGHTS} more)" if len(readings) > LAB_HIGHLIGHTS else ""
+        return "lab", "Lab results", ", ".join(readings[:LAB_HIGHLIGHTS]) + more
+    if rank == 1:
+        test_name, results = values
+        return "diagnostic", test_name, results or ""
+    name, dosage, frequency = values
+    # Courses are entered ahead of time too; a date still to come is a plan
+    planned = str(event_date) > date.today().isoformat()
+    if rank == 2:
+        return "medication_stop", f"{'Planned stop of' if planned else 'Stopped'} {name}", ""
+    return ("medication_start", f"{'Planned start of' if planned else 'Started'} {name}",
+            " ".join(v for v in (dosage, frequency) if v))
+
+
+def _stream(conn, source, rank, patient_id, before, batch_size):
+    table, date_column, select_list, condition = STREAMS[rank]
+    if before is None:
+        bound, params = "", ()
+    else:
+        before_date, before_rank, before_id = before
+        # Strictly older than the cursor in (date, rank, id) order
+        if rank < before_rank:
+            bound, params = f"AND {date_column} <= ?", (before_date,)
+        elif rank > before_rank:
+            bound, params = f"AND {date_column} < ?", (before_date,)
+        else:
+            bound, params = f"AND ({date_column}, id) < (?, ?)", (before_date, before_id)
+    while True:
+        rows = conn.execute(
+            f"""SELECT {date_column}, id, {select_list} FROM {source(table)}
+                WHERE patient_id = ? {condition} {bound}
+                ORDER BY {date_column} DESC, id DESC LIMIT ?""",
+            (patient_id, *params, batch_size)
+        ).fetchall()
+        for row_date, row_id, *values in rows:
+            yield (row_date, rank, row_id), values
+        if len(rows) < batch_size:
+            return
+        last_date, row_id = rows[-1][0], rows[-1][1]
+        bound, params = f"AND ({date_column}, id) < (?, ?)", (last_date, row_id)
+
+
+def timeline_page(conn, patient_id, before=None, limit=PAGE_SIZE, source=None):
+    """One page of the patient's timeline and the cursor for the next (older) one.
+
+    Events are ``(date, kind, title, detail)``; the cursor is None when
+    there is nothing older. ``source(table)`` names the table or subquery
+    to read (e.g. with archived history); by default the live table.
+    """
+    source = source or (lambda table: table)
+    # Each stream needs at most a page of rows, plus one to detect more
+    streams = [_stream(conn, source, rank, patient_id, before, limit + 1) for rank in STREAMS]
+    merged = heapq.merge(*streams, key=lambda event: event[0], reverse=True)
+    events = list(islice(merged, limit + 1))
+    page = [(key[0], *_describe(key[1], key[0], values)) for key, values in events[:limit]]
+    return page, events[limit - 1][0] if len(events) > limit else None
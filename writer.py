@@ -0,0 +1,191 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from metrics import write_batch_size
+from query_cache import invalidate
+
+# Form saves go through one writer thread per database file. It owns the
+# only write connection and commits whatever has queued up since its last
+# commit in a single transaction, so a burst of saves costs one fsync and
+# never fights over the write lock. Each operation runs in its own
+# savepoint: one failing save is rolled back without affecting the others.
+# An authorizer notes every table a batch writes to (trigger bodies
+# included), and those tables' cached reads are invalidated once it commits.
+#
+# Every write the app makes at runtime (clinical saves, audit events,
+# sessions, passwords, the clinic registry) goes through here. The only
+# other writers are schema setup in init_db, which writes only to create or
+# migrate a database and finds nothing to do on an up-to-date one, and the
+# command-line tools (archive.py, med_catalog.py), which run as separate
+# processes and so cannot share this queue.
+MAX_BATCH = 64
+BUSY_TIMEOUT_SECONDS = 30
+
+_WRITE_ACTIONS = (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class WriterConnection(sqlite3.Connection):
+    """The writer's connection, as seen by queued operations.
+
+    Operations share the batch transaction, so ``commit()`` from helpers
+    written for standalone connections must not end it early.
+    """
+
+    def commit(self):
+        pass
+
+
+class WriteQueue:
+    def __init__(self, db_path, max_batch=MAX_BATCH):
+        self.db_path = db_path
+        self.label = os.path.basename(db_path)
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.operations = 0
+        self._written = set()
+        self._thread = threading.Thread(target=self._run, name=f"writer-{db_path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation):
+        """Queue ``operation(conn)`` and return a Future for its result.
+
+        The operation runs inside the batch transaction, where
+        ``conn.commit()`` is a no-op; the future resolves only after that
+        transaction has committed.
+        """
+        future = Future()
+        self._queue.put((operation, future, False))
+        return future
+
+    def submit_exclusive(self, operation):
+        """Queue ``operation(conn)`` to run alone, outside any transaction.
+
+        For work that cannot run inside one (VACUUM, say); saves queued
+        behind it wait until it is done.
+        """
+        future = Future()
+        self._queue.put((operation, future, True))
+        return future
+
+    def _authorize(self, action, table, column, database, trigger):
+        if action in _WRITE_ACTIONS and database == "main":
+            self._written.add(table)
+        return sqlite3.SQLITE_OK
+
+    def _invalidate_written(self):
+        if self._written:
+            invalidate(self.db_path, *self._written)
+            self._written.clear()
+
+    def _run(self):
+        # isolation_level=None: transactions and savepoints are managed here.
+        # The authorizer only runs when a statement is prepared, so the
+        # statement cache is off: every write is seen, not just the first.
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None,
+                               check_same_thread=False, factory=WriterConnection, cached_statements=0)
+        conn.set_authorizer(self._authorize)
+        held = None
+        while True:
+            item, held = held or self._queue.get(), None
+            if item[2]:
+                self._run_exclusive(conn, item[0], item[1])
+                continue
+            batch = [item[:2]]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[2]:
+                    held = item
+                    break
+                batch.append(item[:2])
+            self._commit_batch(conn, batch)
+
+    def _run_exclusive(self, conn, operation, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = operation(conn)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Statements outside a transaction may have committed already
+            self._invalidate_written()
+            future.set_exception(e)
+        else:
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+            self._invalidate_written()
+            future.set_result(result)
+
+    def _commit_batch(self, conn, batch):
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = operation(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    future.set_exception(e)
+                else:
+                    conn.execute("RELEASE op")
+                    done.append((future, result))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._written.clear()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Before the futures resolve, so the saving session's rerun reads fresh rows
+        self._invalidate_written()
+        self.batches += 1
+        self.operations += len(done)
+        write_batch_size.observe(len(batch), self.label)
+        for future, result in done:
+            future.set_result(result)
+
+    def drain(self, timeout=None):
+        """Wait until everything queued so far has been committed."""
+        self.submit(lambda conn: None).result(timeout)
+
+
+def get_writer(db_path):
+    """The process-wide writer for ``db_path`` (started on first use)."""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = WriteQueue(db_path)
+        return writer
+
+
+def run_write(db_path, operation, timeout=BUSY_TIMEOUT_SECONDS * 2):
+    """Run ``operation(conn)`` on the writer for ``db_path`` and wait for its commit."""
+    return get_writer(db_path).submit(operation).result(timeout)
+
+
+@atexit.register
+def _drain_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        try:
+            writer.drain(timeout=5)
+        except Exception:
+            pass